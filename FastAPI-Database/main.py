@@ -1,25 +1,63 @@
-from fastapi import FastAPI, HTTPException, Query, File, UploadFile, Form, Path
+import time
+BOOT_STARTED = time.perf_counter()  # Measured from the first import, for the startup timing report
+
+from fastapi import FastAPI, HTTPException, Query, File, UploadFile, Form, Path, Response
 import jwt.exceptions
 import jwt.utils
 import pymysql
 from pydantic import BaseModel, validator, field_validator
-from typing import List
+from typing import List, Optional, Union
 import logging
 import datetime
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi import Request
 from fastapi import Depends, HTTPException, Security
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 import jwt
 from fastapi.security import OAuth2PasswordBearer
-import pandas as pd
 from passlib.context import CryptContext
 from io import BytesIO  # Needed for Bulk Upload
-import numpy as np
+import io
+import csv
+import json
+import gzip
+import hashlib
+import hmac
+from email.utils import formatdate
+from urllib.parse import quote
+# pandas, numpy and openpyxl are imported inside the functions that use them, keeping them out of worker cold start
 import pymysql.cursors
+import aiomysql
+import asyncio
+import bisect
+import contextvars
+import weakref
 from decimal import Decimal
-import time
 from functools import wraps
+from collections import OrderedDict
+from contextlib import contextmanager
 import os
+import re
+import queue
+import threading
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+
+# Optional: brotli adds Content-Encoding: br to table responses (pyarrow, for Arrow/Parquet, is imported on use)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def retry_on_db_error(max_retries=3, delay=1.0):
     def decorator(func):
@@ -58,13 +96,445 @@ app = FastAPI()
 
 logging.basicConfig(filename="update_requests.log", level=logging.INFO, format="%(asctime)s - %(message)s")
 
+# Per-request DB counters. MetricsMiddleware sets a RequestStats in this context variable; sync handlers
+# and streaming generators run in the threadpool with a copy of the context, so they update the same object.
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "scope")
+
+    def __init__(self, scope=None):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.scope = scope
+
+    @property
+    def route(self):
+        """ Path template of the matched route; the router stores it in the ASGI scope. """
+        return getattr((self.scope or {}).get("route"), "path", "unmatched")
+
+current_request_stats = contextvars.ContextVar("current_request_stats", default=None)
+
+def record_db_query(seconds):
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+
+# Query tracing: every statement is logged on the "sql" logger at DEBUG, statements slower than
+# SLOW_QUERY_SECONDS at WARNING. Parameters are logged by type only, never by value.
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() in ("1", "true", "yes")
+SQL_LOG_MAX_CHARS = 1000
+sql_logger = logging.getLogger("sql")
+sql_logger.setLevel(os.getenv("SQL_LOG_LEVEL", "WARNING").upper())
+
+def parameter_shape(args):
+    """ Types of a statement's parameters, e.g. "tuple[3](int, str, NoneType)". """
+    if args is None:
+        return "none"
+    if isinstance(args, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in args.items()) + "}"
+    if isinstance(args, (list, tuple)):
+        names = [type(value).__name__ for value in args[:10]]
+        return f"{type(args).__name__}[{len(args)}]({', '.join(names)}{', ...' if len(args) > 10 else ''})"
+    return type(args).__name__
+
+def statement_text(query):
+    text = " ".join(str(query).split())
+    return text if len(text) <= SQL_LOG_MAX_CHARS else text[:SQL_LOG_MAX_CHARS] + "..."
+
+def trace_query(query, args, seconds):
+    """ Record and log one executed statement; returns True when its plan should be captured with EXPLAIN. """
+    record_db_query(seconds)
+    slow = seconds >= SLOW_QUERY_SECONDS
+    level = logging.WARNING if slow else logging.DEBUG
+    if sql_logger.isEnabledFor(level):
+        stats = current_request_stats.get()
+        sql_logger.log(
+            level, "%s %.1f ms route=%s params=%s sql=%s", "Slow query" if slow else "Query", seconds * 1000,
+            stats.route if stats is not None else "-", parameter_shape(args), statement_text(query),
+        )
+    return slow and SLOW_QUERY_EXPLAIN and str(query).lstrip().upper().startswith(("SELECT", "WITH"))
+
+def log_explain(query, columns, rows):
+    sql_logger.warning("EXPLAIN for %s: %s", statement_text(query), [dict(zip(columns, row)) for row in rows])
+
+class MeteredCursorMixin:
+    """ Counts, times and traces every statement sent to MySQL (executemany batches each count once). """
+
+    can_explain = True
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, args)
+        except BaseException:
+            trace_query(query, args, time.perf_counter() - started)
+            raise
+        if trace_query(query, args, time.perf_counter() - started) and self.can_explain:
+            self.explain(query, args)
+        return result
+
+    def explain(self, query, args):
+        try:
+            with self.connection.cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute("EXPLAIN " + query, args)
+                log_explain(query, [column[0] for column in cursor.description], cursor.fetchall())
+        except pymysql.Error as e:
+            sql_logger.warning("EXPLAIN failed for %s: %s", statement_text(query), e)
+
+class MeteredCursor(MeteredCursorMixin, pymysql.cursors.Cursor):
+    pass
+
+class MeteredSSCursor(MeteredCursorMixin, pymysql.cursors.SSCursor):
+    can_explain = False  # Its unread result still occupies the connection
+
+class MeteredAsyncCursor(aiomysql.Cursor):
+    async def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            result = await super().execute(query, args)
+        except BaseException:
+            trace_query(query, args, time.perf_counter() - started)
+            raise
+        if trace_query(query, args, time.perf_counter() - started):
+            await self.explain(query, args)
+        return result
+
+    async def explain(self, query, args):
+        try:
+            async with self.connection.cursor(aiomysql.Cursor) as cursor:
+                await cursor.execute("EXPLAIN " + query, args)
+                log_explain(query, [column[0] for column in cursor.description], await cursor.fetchall())
+        except pymysql.Error as e:
+            sql_logger.warning("EXPLAIN failed for %s: %s", statement_text(query), e)
+
 # Database Configuration
 db_config = {
     "host": os.getenv("DB_HOST", "localhost"),
     "user": os.getenv("DB_USER", "root"),
     "password": os.getenv("DB_PASSWORD", "root"),
     "database": os.getenv("DB_NAME", "buc"),
+    "cursorclass": MeteredCursor,
+}
+
+# Connection Pool Configuration
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Close connections idle longer than this
+
+
+class ConnectionPool:
+    """
+    Process-wide, bounded pool of pymysql connections.
+
+    At most `size` connections are checked out at once; callers block for up to
+    `timeout` seconds waiting for a free slot. Idle connections are pinged on
+    checkout and closed instead of reused once they sit idle past `recycle`.
+    """
+
+    def __init__(self, config, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, recycle=DB_POOL_RECYCLE):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HTTPException(status_code=503, detail="Database connection pool exhausted")
+        try:
+            while True:
+                try:
+                    connection, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return pymysql.connect(**self.config)
+
+                if time.monotonic() - idle_since > self.recycle:
+                    self._discard(connection)
+                    continue
+                try:
+                    connection.ping(reconnect=False)
+                    return connection
+                except pymysql.Error:
+                    self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection, discard=False):
+        try:
+            if discard or not connection.open:
+                self._discard(connection)
+                return
+            try:
+                # End any open transaction so the next borrower starts from a fresh snapshot
+                connection.rollback()
+            except pymysql.Error:
+                self._discard(connection)
+                return
+            self._idle.put((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except pymysql.err.OperationalError:
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def close_all(self):
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(connection)
+
+
+db_pool = ConnectionPool(db_config)
+
+
+def get_db():
+    """FastAPI dependency: check a pooled connection out for the duration of one request."""
+    with db_pool.connection() as connection:
+        yield connection
+
+
+# Async pool for `async def` handlers, so their queries do not hold a threadpool worker.
+# Created lazily on first use; one pool per event loop (uvicorn runs a single loop per worker).
+async_db_pools = weakref.WeakKeyDictionary()
+
+async def get_async_pool():
+    loop = asyncio.get_running_loop()
+    pool = async_db_pools.get(loop)
+    if pool is None:
+        pool = await aiomysql.create_pool(
+            host=db_config["host"],
+            user=db_config["user"],
+            password=db_config["password"],
+            db=db_config["database"],
+            minsize=1,
+            maxsize=DB_POOL_SIZE,
+            pool_recycle=DB_POOL_RECYCLE,
+            autocommit=True,  # Read handlers: every statement sees the latest committed data
+            cursorclass=MeteredAsyncCursor,
+        )
+        # Another request may have created the pool while this one was connecting
+        existing = async_db_pools.setdefault(loop, pool)
+        if existing is not pool:
+            pool.close()
+            await pool.wait_closed()
+            pool = existing
+    return pool
+
+async def get_async_db():
+    """FastAPI dependency: async counterpart of get_db for `async def` handlers."""
+    pool = await get_async_pool()
+    async with pool.acquire() as connection:
+        yield connection
+
+async def close_async_pool():
+    pool = async_db_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache whose entries expire `ttl` seconds after being stored.
+
+    `generation` is bumped by every clear(); callers read it before a DB lookup and pass it
+    back to set(), so a value read before a concurrent write is never cached after it.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Country rates only change through the country write endpoints, which clear this cache
+COUNTRY_RATES_CACHE_TTL = float(os.getenv("COUNTRY_RATES_CACHE_TTL", "300"))
+country_rates_cache = TTLCache(ttl=COUNTRY_RATES_CACHE_TTL)
+
+# Reference-data responses (machine types, makes, model sizes, countries), one cache per table.
+# A table's write endpoints clear its cache, bumping its version; the TTL bounds how long writes made
+# by other workers go unseen. ETags hash the body, so every worker hands out the same tag.
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+reference_caches = {table: TTLCache(REFERENCE_CACHE_TTL) for table in ("machine_types", "makes", "model_size", "countries")}
+reference_last_modified = {}  # (table, key) -> (etag, Last-Modified) of the last body served
+
+def invalidate_reference_cache(table):
+    reference_caches[table].clear()
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def cached_reference_response(request, table, key, load):
+    """
+    JSON response for a reference-data endpoint, served from memory while `table`'s version is
+    unchanged. `load` is an async function of an aiomysql connection that returns the payload; a pool
+    connection is only checked out on a miss. If-None-Match with the current ETag gets a 304.
+    """
+    cache = reference_caches[table]
+    entry = cache.get(key)
+    if entry is None:
+        generation = cache.generation
+        pool = await get_async_pool()
+        async with pool.acquire() as connection:
+            payload = await load(connection)
+        body = dumps_json(payload)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        previous = reference_last_modified.get((table, key))
+        last_modified = previous[1] if previous and previous[0] == etag else formatdate(usegmt=True)
+        reference_last_modified[(table, key)] = (etag, last_modified)
+        entry = (body, etag, last_modified)
+        cache.set(key, entry, generation=generation)
+
+    body, etag, last_modified = entry
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_json(payload):
+    """ Serialize to JSON bytes with orjson when installed, else the standard library. """
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default)
+    return json.dumps(payload, default=json_default).encode()
+
+# Response formats for the large table endpoints, chosen by ?format= or the Accept header
+TABLE_FORMATS = {
+    "json": "application/json",
+    "columnar": "application/vnd.buc.columnar+json",  # {"columns": [...], "data": [[column values], ...]}
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
 }
+COMPRESSION_MIN_SIZE = 1024  # Smaller bodies are sent as is
+
+def negotiate_table_format(request):
+    requested = request.query_params.get("format")
+    if requested is not None:
+        if requested not in TABLE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown format {requested}; use one of {', '.join(TABLE_FORMATS)}")
+        return requested
+    accept = request.headers.get("accept", "")
+    for name, media_type in TABLE_FORMATS.items():
+        if name != "json" and media_type in accept:
+            return name
+    return "json"
+
+def negotiate_encoding(request):
+    accepted = {part.split(";")[0].strip() for part in request.headers.get("accept-encoding", "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def table_response(request, records, columns=None, headers=None):
+    """
+    Response for a list of row dicts in the format and encoding the client negotiated: JSON rows
+    (the default), columnar JSON with each column name sent once, or an Arrow IPC / Parquet stream
+    (needs pyarrow). Bodies of COMPRESSION_MIN_SIZE bytes or more are brotli- or gzip-compressed.
+    `columns` names the columns when `records` may be empty.
+    """
+    table_format = negotiate_table_format(request)
+    columns = list(records[0]) if records else list(columns or [])
+
+    if table_format == "json":
+        body = dumps_json(records)
+    elif table_format == "columnar":
+        body = dumps_json({"columns": columns, "data": [[record[column] for record in records] for column in columns]})
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Arrow and Parquet responses need pyarrow installed on the server")
+        table = pa.Table.from_pylist(records) if records else pa.table({column: [] for column in columns})
+        sink = pa.BufferOutputStream()
+        if table_format == "arrow":
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, sink)
+        body = sink.getvalue().to_pybytes()
+
+    headers = {**(headers or {}), "Vary": "Accept, Accept-Encoding"}
+    encoding = negotiate_encoding(request) if table_format != "parquet" else None  # Parquet pages are compressed already
+    if encoding and len(body) >= COMPRESSION_MIN_SIZE:
+        body = brotli.compress(body, quality=4) if encoding == "br" else gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=TABLE_FORMATS[table_format], headers=headers)
+
+TABLE_ENCODE_INLINE_ROWS = 200  # Async handlers encode larger tables in the threadpool
+
+async def table_response_async(request, records, columns=None, headers=None):
+    """ table_response for `async def` handlers: serializing and compressing a large table would block the event loop. """
+    if len(records) <= TABLE_ENCODE_INLINE_ROWS:
+        return table_response(request, records, columns=columns, headers=headers)
+    return await run_in_threadpool(table_response, request, records, columns=columns, headers=headers)
 
 # Enable CORS for Frontend Access
 app.add_middleware(
@@ -73,8 +543,123 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Request metrics, exposed in Prometheus text format on /metrics. Routes are labelled by their path
+# template (e.g. /item-cost-rollup/{item_master_id}) so label cardinality stays bounded.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+DB_QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+def prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class RequestMetrics:
+    """ Thread-safe per-route request metrics. """
+
+    HISTOGRAMS = (
+        ("http_request_duration_seconds", "Request latency until the last body byte is sent", LATENCY_BUCKETS),
+        ("http_response_size_bytes", "Response body size", RESPONSE_SIZE_BUCKETS),
+        ("http_request_db_queries", "SQL statements executed per request", DB_QUERY_BUCKETS),
+        ("http_request_db_seconds", "Time spent in SQL statements per request", LATENCY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.in_flight = 0
+        self._statuses = {}  # (method, route, status) -> requests
+        self._histograms = {}  # (method, route) -> one Histogram per HISTOGRAMS entry
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, method, route, status, seconds, size, stats):
+        with self._lock:
+            self.in_flight -= 1
+            key = (method, route, status)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+            histograms = self._histograms.get((method, route))
+            if histograms is None:
+                histograms = self._histograms[(method, route)] = [Histogram(buckets) for _, _, buckets in self.HISTOGRAMS]
+            for histogram, value in zip(histograms, (seconds, size, stats.queries, stats.db_seconds)):
+                histogram.observe(value)
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP http_requests_in_flight Requests currently being served",
+                "# TYPE http_requests_in_flight gauge",
+                f"http_requests_in_flight {self.in_flight}",
+                "# HELP http_requests_total Requests served",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self._statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{prometheus_label(route)}",status="{status}"}} {count}')
+            for index, (name, description, _) in enumerate(self.HISTOGRAMS):
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+                for (method, route), histograms in sorted(self._histograms.items()):
+                    lines.extend(histograms[index].samples(name, f'method="{method}",route="{prometheus_label(route)}"'))
+        return "\n".join(lines) + "\n"
+
+request_metrics = RequestMetrics()
+
+class MetricsMiddleware:
+    """ Plain ASGI middleware (so streaming responses are not buffered) that feeds request_metrics. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request_stats.set(stats)
+        status, size = 500, 0
+
+        async def send_and_measure(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        request_metrics.started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            request_metrics.finished(scope["method"], stats.route, status, time.perf_counter() - started, size, stats)
+            current_request_stats.reset(token)
+
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=request_metrics.render(), media_type="text/plain; version=0.0.4")
+
 COUNTRY_CONSTANTS = {
     "India": {"annual_hours": 6240, "space_rental": 5.75, "electricity_rate": 0.18, "water_rate": 0.6},
     "China": {"annual_hours": 6000, "space_rental": 15.75, "electricity_rate": 0.09, "water_rate": 1.5},
@@ -127,29 +712,94 @@ ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Authorization decisions are logged at DEBUG; set AUTH_LOG_LEVEL=DEBUG to turn them on
+auth_logger = logging.getLogger("auth")
+auth_logger.setLevel(os.getenv("AUTH_LOG_LEVEL", "WARNING").upper())
+
+
+class TokenClaimsCache:
+    """
+    Thread-safe LRU of verified JWT claims keyed by the raw token, so a token's signature is checked once.
+    Entries expire with the token's own `exp`; tokens without one are not cached.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(token, None)
+            self.misses += 1
+            return None
+
+    def set(self, token, claims):
+        expires = claims.get("exp")
+        if not isinstance(expires, (int, float)) or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (claims, expires)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+AUTH_CLAIMS_CACHE_SIZE = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "10000"))
+token_claims_cache = TokenClaimsCache(AUTH_CLAIMS_CACHE_SIZE)
+
 def decode_jwt(token: str = Security(oauth2_scheme)):
+    payload = token_claims_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    token_claims_cache.set(token, payload)
+    return payload
+
+async def current_claims(token: str = Security(oauth2_scheme)):
+    """ Verified claims of the request's bearer token; FastAPI resolves this once per request. """
+    return decode_jwt(token)
 
 
 def role_required(*required_role):
-    def wrapper(token: str = Security(oauth2_scheme)):
-        payload = decode_jwt(token)
+    async def wrapper(payload: dict = Depends(current_claims)):
         user_role = payload.get("role")
-        print(user_role)
         if user_role not in required_role:
+            auth_logger.warning("Denied %s (role %s) access requiring %s", payload.get("sub"), user_role, required_role)
             raise HTTPException(status_code=403, detail="Unauthorized access")
+        auth_logger.debug("Allowed %s (role %s) access requiring %s", payload.get("sub"), user_role, required_role)
         return True
     return wrapper
 
 @app.post("/register")
-def register(user: UserLogin):
-    connection = pymysql.connect(**db_config)
+def register(user: UserLogin, connection=Depends(get_db)):
     cursor = connection.cursor()
 
     # ✅ Hash the password before storing
@@ -159,7 +809,6 @@ def register(user: UserLogin):
                    (user.username, user.password, user.email,user.role))
     connection.commit()
     cursor.close()
-    connection.close()
 
     return {"message": "User registered successfully"}
 
@@ -167,6 +816,118 @@ def register(user: UserLogin):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+# bcrypt runs on its own small executor so a login burst cannot starve the threadpool other handlers share;
+# at most PASSWORD_HASH_MAX_PENDING checks run or wait at once, further logins get 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_checks = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+def check_password(plain_password, stored_password):
+    """
+    Verify a password against its stored value and return (valid, new_hash).
+    new_hash is set when the stored value should be replaced: its bcrypt cost is out of date,
+    or it is a legacy plain-text password.
+    """
+    if not stored_password:
+        return False, None
+    try:
+        return pwd_context.verify_and_update(plain_password, stored_password)
+    except (ValueError, TypeError):
+        # Not a recognised hash: existing plain-text passwords, compared in constant time
+        if hmac.compare_digest(plain_password.encode(), stored_password.encode()):
+            return True, pwd_context.hash(plain_password)
+        return False, None
+
+async def check_password_offloaded(plain_password, stored_password):
+    if not password_checks.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Too many logins in progress, try again shortly")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            password_executor, check_password, plain_password, stored_password
+        )
+    finally:
+        password_checks.release()
+
+
+class LoginThrottle:
+    """
+    In-process fixed-window counter of failed logins per key (username or client IP).
+    Keys are kept in least-recently-failed order and the oldest are dropped beyond max_keys.
+    """
+
+    def __init__(self, limit, window, max_keys=100_000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()  # key -> [window end, failures]
+        self._lock = threading.Lock()
+
+    def retry_after(self, key):
+        """ Seconds until `key` may try again, or 0 if it is not blocked. """
+        if self.limit <= 0:
+            return 0
+        with self._lock:
+            entry = self._failures.get(key)
+            if entry is None:
+                return 0
+            remaining = entry[0] - time.monotonic()
+            if remaining <= 0:
+                del self._failures[key]
+                return 0
+            return int(remaining) + 1 if entry[1] >= self.limit else 0
+
+    def record_failure(self, key):
+        if self.limit <= 0:  # Throttle turned off
+            return
+        with self._lock:
+            now = time.monotonic()
+            entry = self._failures.pop(key, None)
+            if entry is None or entry[0] <= now:
+                entry = [now + self.window, 0]
+            entry[1] += 1
+            self._failures[key] = entry
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+LOGIN_THROTTLE_WINDOW = int(os.getenv("LOGIN_THROTTLE_WINDOW", "300"))
+username_throttle = LoginThrottle(int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", "5")), LOGIN_THROTTLE_WINDOW)
+ip_throttle = LoginThrottle(int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "50")), LOGIN_THROTTLE_WINDOW)
+
+# Reverse proxies in front of the app that append to X-Forwarded-For. With 0 the peer address is used,
+# which behind a proxy is the proxy's own: set this, or LOGIN_MAX_FAILURES_PER_IP=0, when proxied.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+def login_client_ip(request):
+    """
+    Client address for per-IP login throttling. Behind TRUSTED_PROXY_HOPS proxies this is the
+    X-Forwarded-For entry appended by the outermost one; entries before it are client-supplied.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [
+            address.strip()
+            for header in request.headers.getlist("x-forwarded-for")
+            for address in header.split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+def login_throttle_check(username, client_ip):
+    retry_after = max(username_throttle.retry_after(username), ip_throttle.retry_after(client_ip))
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
 ACCESS_TOKEN_EXPIRE_SECONDS = 3600  # 1 hour
 REFRESH_TOKEN_EXPIRE_SECONDS = 7 * 24 * 3600  # 7 days
 
@@ -184,42 +945,33 @@ def create_refresh_token(data: dict):
 
 
 @app.post("/login")
-def login(user: UserReg):
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-    cursor.execute("SELECT id, username, password_hash, role FROM users WHERE username = %s", (user.username,))
-    result = cursor.fetchone()
-    
-    # if not result or not verify_password(user.password, result[2]):
-    #     raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    print(result)
-    if not result:
-        raise HTTPException(status_code=401, detail="Invalid username or password")
+async def login(user: UserReg, request: Request, connection=Depends(get_async_db)):
+    client_ip = login_client_ip(request)
+    login_throttle_check(user.username, client_ip)
+
+    async with connection.cursor() as cursor:
+        await cursor.execute("SELECT id, username, password_hash, role FROM users WHERE username = %s", (user.username,))
+        result = await cursor.fetchone()
+
+    # Handles both bcrypt hashes and existing plain-text passwords
+    password_valid, new_hash = await check_password_offloaded(user.password, result[2]) if result else (False, None)
 
-    # Handle both plain text and hashed passwords for backward compatibility
-    stored_password = result[2]
-    password_valid = False
-    
-    # Try to verify as hashed password first
-    try:
-        password_valid = verify_password(user.password, stored_password)
-    except:
-        # If verification fails, try direct comparison (for existing plain text passwords)
-        password_valid = (user.password == stored_password)
-    
     if not password_valid:
+        username_throttle.record_failure(user.username)
+        ip_throttle.record_failure(client_ip)
         raise HTTPException(status_code=401, detail="Invalid username or password")
-    
+    username_throttle.reset(user.username)
+
+    if new_hash:
+        # Outdated bcrypt cost or plain-text password: store a current hash now that we know the password
+        async with connection.cursor() as cursor:
+            await cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, result[0]))
 
     payload = {"sub": result[1], "role": result[3]}
 
     access_token = create_access_token(payload)
     refresh_token = create_refresh_token(payload)
 
-    cursor.close()
-    connection.close()
-
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -245,65 +997,62 @@ class MachineType(BaseModel):
 
 # Machine Type Management
 @app.post("/add-machine-type")
-def add_machine_type(name: MachineType):
-    connection = pymysql.connect(**db_config)
+def add_machine_type(name: MachineType, connection=Depends(get_db)):
     cursor = connection.cursor()
     cursor.execute("INSERT INTO machine_types (machine_type) VALUES (%s)", (name.machine_type,))
     connection.commit()
+    invalidate_reference_cache("machine_types")
     cursor.close()
-    connection.close()
     return {"message": "Machine Type added successfully"}
 
 @app.get("/fetch-machine-types")
-def fetch_machine_types():
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-    cursor.execute("SELECT * FROM machine_types")
-    types = [{"id": row[0], "name": row[1]} for row in cursor.fetchall()]
-    cursor.close()
-    connection.close()
-    return types
+async def fetch_machine_types(request: Request):
+    async def load(connection):
+        cursor = await connection.cursor()
+        await cursor.execute("SELECT * FROM machine_types")
+        types = [{"id": row[0], "name": row[1]} for row in await cursor.fetchall()]
+        await cursor.close()
+        return types
+    return await cached_reference_response(request, "machine_types", "fetch-machine-types", load)
 
 class Make(BaseModel):
     make: str
 
 @app.post("/add-make")
-def add_make(make: Make):
-    connection = pymysql.connect(**db_config)
+def add_make(make: Make, connection=Depends(get_db)):
     cursor = connection.cursor()
     cursor.execute("INSERT INTO makes (make) VALUES (%s)", (make.make,))
     connection.commit()
+    invalidate_reference_cache("makes")
     cursor.close()
-    connection.close()
     return {"message": "Make added successfully"}
 
 
 @app.get("/fetch-makes")
-def fetch_makes():
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-    cursor.execute("SELECT * FROM makes")
-    makes = [{"id": row[0], "make": row[1]} for row in cursor.fetchall()]
-    
-    cursor.close()
-    connection.close()
-    
-    return makes
+async def fetch_makes(request: Request):
+    async def load(connection):
+        cursor = await connection.cursor()
+        await cursor.execute("SELECT * FROM makes")
+        makes = [{"id": row[0], "make": row[1]} for row in await cursor.fetchall()]
+        
+        await cursor.close()
+        
+        return makes
+    return await cached_reference_response(request, "makes", "fetch-makes", load)
 
 @app.delete("/delete-make/{id}")
-def delete_make(id: int):
-    connection = pymysql.connect(**db_config)
+def delete_make(id: int, connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         cursor.execute("DELETE FROM makes WHERE id = %s", (id,))
         connection.commit()
+        invalidate_reference_cache("makes")
         return {"message": "Make deleted successfully"}
     except Exception as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 
 
@@ -311,19 +1060,16 @@ def delete_make(id: int):
 
 # Approval System
 @app.post("/approve-edit", dependencies=[Depends(role_required("Admin"))])
-def approve_edit(approval_id: int, status: str):
-    connection = pymysql.connect(**db_config)
+def approve_edit(approval_id: int, status: str, connection=Depends(get_db)):
     cursor = connection.cursor()
     cursor.execute("UPDATE user_approvals SET status = %s WHERE id = %s", (status, approval_id))
     connection.commit()
     cursor.close()
-    connection.close()
     return {"message": f"Edit request {status}"}
 
 
 @app.post("/request-edit-machine-rate", dependencies=[Depends(role_required("Manager"))])
-def request_edit_machine_rate(id: int, update: UpdateMachineRate):
-    connection = pymysql.connect(**db_config)
+def request_edit_machine_rate(id: int, update: UpdateMachineRate, connection=Depends(get_db)):
     cursor = connection.cursor()
 
     # Get current value before update
@@ -338,7 +1084,6 @@ def request_edit_machine_rate(id: int, update: UpdateMachineRate):
     
     connection.commit()
     cursor.close()
-    connection.close()
     return {"message": "Update request submitted for approval"}
 
 
@@ -350,50 +1095,82 @@ def safe_float(value):
     except ValueError:
         return 0.0
 
-def calculate_values(row, country: str):
-    """ Calculates all dynamic fields based on the selected country. """
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
+# Machine-rate inputs in the order they are selected from machine_rate_calculation
+MACHINE_RATE_INPUT_COLUMNS = (
+    "purchase_price", "res_value", "useful_life", "utilization", "maintenance",
+    "power_kw_hr", "power_spec", "area_m2", "water_m3_hr", "consumables",
+)
+
+def machine_rate_input_columns(rows, offset=6):
+    """
+    Convert DB rows into one float array per machine-rate input.
+    The ten inputs are read from row[offset:offset + 10] in MACHINE_RATE_INPUT_COLUMNS order.
+    """
+    import numpy as np
+
+    width = len(MACHINE_RATE_INPUT_COLUMNS)
+    matrix = np.array(
+        [[safe_float(value) for value in row[offset:offset + width]] for row in rows],
+        dtype=float,
+    ).reshape(-1, width)
+    return {name: matrix[:, index] for index, name in enumerate(MACHINE_RATE_INPUT_COLUMNS)}
+
+def calculate_machine_rate_columns(inputs, country: str, rates):
+    """
+    Vectorized machine-rate engine: derives every dynamic column for all rows in one NumPy pass.
+
+    `inputs` maps each name in MACHINE_RATE_INPUT_COLUMNS to an array (purchase_price in USD,
+    percentages as stored). Returns arrays rounded to 3 decimals, with the purchase price
+    converted to local currency.
+
+    To price many countries or scenarios at once, pass `country` as a list of names and each rate
+    as a column array of shape (len(country), 1); results then have one row per country.
+    """
+    import numpy as np
 
-    # Fetch country-specific rates including exchange rate
-    rates = get_country_rates(country)
-    if not rates:
-        raise HTTPException(status_code=400, detail="Invalid country name")
-    
     labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, currency_symbol = rates
-    
+
     # Convert rates to float
-    space_rental_rate = float(space_rental_rate)
-    electricity_rate = float(electricity_rate)
-    water_rate = float(water_rate)
-    exchange_rate = float(exchange_rate)
+    space_rental_rate = np.asarray(space_rental_rate, dtype=float)
+    electricity_rate = np.asarray(electricity_rate, dtype=float)
+    water_rate = np.asarray(water_rate, dtype=float)
+    exchange_rate = np.asarray(exchange_rate, dtype=float)
 
     # Get annual hours based on country
-    annual_hours = COUNTRY_CONSTANTS.get(country, {}).get("annual_hours", 6240)
+    if isinstance(country, str):
+        annual_hours = COUNTRY_CONSTANTS.get(country, {}).get("annual_hours", 6240)
+    else:
+        annual_hours = np.array([[COUNTRY_CONSTANTS.get(name, {}).get("annual_hours", 6240)] for name in country], dtype=float)
 
     # Convert purchase price from USD to local currency
-    purchase_price = float(row[6]) * exchange_rate
-    res_value = safe_float(row[7]) / 100  # Convert percentage to decimal     
-    useful_life = safe_float(row[8])     
-    utilization = safe_float(row[9]) / 100  # Convert percentage to decimal     
-    maintenance = safe_float(row[10]) / 100  # Convert percentage to decimal     
-    power_kw_hr = safe_float(row[11])     
-    power_spec = safe_float(row[12]) / 100  # Convert percentage to decimal     
-    area_m2 = safe_float(row[13])        
-    water_m3_hr = safe_float(row[14])    
-    consumables = safe_float(row[15])    
-
-    # Calculate values in local currency
-    # Depreciation: (Purchase Price - Residual Value) / (Useful Life * Annual Hours * Utilization)
-    depreciation = (
-        (purchase_price - (purchase_price * res_value)) / (useful_life * annual_hours * utilization)
-    ) if useful_life > 0 and utilization > 0 else 0
-
-    # Maintenance: (Purchase Price * Maintenance %) / (Useful Life * Annual Hours)
-    maintenance_1 = (purchase_price * maintenance) / (useful_life * annual_hours) if useful_life > 0 else 0
-
-    # Space: (Space Rental Rate * Area) / (Annual Hours / 12 * Utilization)
-    space = (space_rental_rate * area_m2) / (annual_hours / 12 * utilization) if utilization > 0 else 0
+    purchase_price = inputs["purchase_price"] * exchange_rate
+    res_value = inputs["res_value"] / 100  # Convert percentage to decimal
+    useful_life = inputs["useful_life"]
+    utilization = inputs["utilization"] / 100  # Convert percentage to decimal
+    maintenance = inputs["maintenance"] / 100  # Convert percentage to decimal
+    power_kw_hr = inputs["power_kw_hr"]
+    power_spec = inputs["power_spec"] / 100  # Convert percentage to decimal
+    area_m2 = inputs["area_m2"]
+    water_m3_hr = inputs["water_m3_hr"]
+    consumables = inputs["consumables"]
+
+    has_life = useful_life > 0
+    is_utilized = utilization > 0
+
+    # Divisions are evaluated for every row; the guards below zero out the rows that would divide by zero
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Depreciation: (Purchase Price - Residual Value) / (Useful Life * Annual Hours * Utilization)
+        depreciation = np.where(
+            has_life & is_utilized,
+            (purchase_price - (purchase_price * res_value)) / (useful_life * annual_hours * utilization),
+            0.0,
+        )
+
+        # Maintenance: (Purchase Price * Maintenance %) / (Useful Life * Annual Hours)
+        maintenance_1 = np.where(has_life, (purchase_price * maintenance) / (useful_life * annual_hours), 0.0)
+
+        # Space: (Space Rental Rate * Area) / (Annual Hours / 12 * Utilization)
+        space = np.where(is_utilized, (space_rental_rate * area_m2) / (annual_hours / 12 * utilization), 0.0)
 
     # Power: Electricity Rate * Power KW/hr * Power Spec %
     power = electricity_rate * power_kw_hr * power_spec
@@ -404,25 +1181,156 @@ def calculate_values(row, country: str):
     # Total cost per hour
     total_dollar_hr = depreciation + maintenance_1 + space + power + water + consumables
 
-    cursor.close()
-    connection.close()
-
     return {
-        "depreciation": round(depreciation, 3),
-        "maintenance_1": round(maintenance_1, 3),
-        "space": round(space, 3),
-        "power": round(power, 3),
-        "water": round(water, 3),
-        "total_dollar_hr": round(total_dollar_hr, 3),
+        "purchase_price": purchase_price,
+        "depreciation": np.round(depreciation, 3),
+        "maintenance_1": np.round(maintenance_1, 3),
+        "space": np.round(space, 3),
+        "power": np.round(power, 3),
+        "water": np.round(water, 3),
+        "total_dollar_hr": np.round(total_dollar_hr, 3),
         "currency_symbol": currency_symbol
     }
 
+MACHINE_RATE_DERIVED_COLUMNS = ("depreciation", "maintenance_1", "space", "power", "water", "total_dollar_hr")
+
+def machine_rate_row_values(columns, index):
+    """ Pick one row's derived values out of calculate_machine_rate_columns output as plain floats. """
+    values = {name: float(columns[name][index]) for name in MACHINE_RATE_DERIVED_COLUMNS}
+    values["currency_symbol"] = columns["currency_symbol"]
+    return values
+
+
+
+# Materialized machine rates: derived values stored per (machine rate row, country) pair
+MACHINE_RATE_RESULT_BATCH = 5000
+
+MACHINE_RATE_RESULT_UPSERT = f"""
+    INSERT INTO machine_rate_results (
+        machine_rate_id, country_id, purchase_price_local, {", ".join(MACHINE_RATE_DERIVED_COLUMNS)}
+    ) VALUES (%s, %s, %s, {", ".join(["%s"] * len(MACHINE_RATE_DERIVED_COLUMNS))})
+    ON DUPLICATE KEY UPDATE purchase_price_local = VALUES(purchase_price_local),
+        {", ".join(f"{name} = VALUES({name})" for name in MACHINE_RATE_DERIVED_COLUMNS)}
+"""
+
+def refresh_machine_rate_results(connection, machine_rate_ids=None, item_master_id=None, country_ids=None):
+    """
+    Recompute and store derived machine rates for every (machine rate row, country) pair in scope.
+
+    Scope is narrowed by machine_rate_ids and/or item_master_id on the machine-rate side and by
+    country_ids on the country side; None means "all". Returns the number of pairs written.
+    Does not commit: writers call it before their own commit, so an input change and its stored
+    results are committed (or rolled back) together.
+    """
+    if machine_rate_ids is not None and not machine_rate_ids:
+        return 0
+    if country_ids is not None and not country_ids:
+        return 0
+
+    cursor = connection.cursor()
+    try:
+        country_query = """
+            SELECT id, name, labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, currency_symbol
+            FROM countries
+        """
+        country_params = ()
+        if country_ids is not None:
+            country_query += f" WHERE id IN ({', '.join(['%s'] * len(country_ids))})"
+            country_params = tuple(country_ids)
+        cursor.execute(country_query, country_params)
+        countries = cursor.fetchall()
+        if not countries:
+            return 0
+
+        filters, params = [], []
+        if machine_rate_ids is not None:
+            filters.append(f"id IN ({', '.join(['%s'] * len(machine_rate_ids))})")
+            params.extend(machine_rate_ids)
+        if item_master_id is not None:
+            filters.append("item_master_id = %s")
+            params.append(item_master_id)
+        where = f" WHERE {' AND '.join(filters)}" if filters else ""
+        cursor.execute(f"SELECT id, {', '.join(MACHINE_RATE_INPUT_COLUMNS)} FROM machine_rate_calculation{where}", tuple(params))
+
+        written = 0
+        while True:
+            rows = cursor.fetchmany(MACHINE_RATE_RESULT_BATCH)
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            inputs = machine_rate_input_columns(rows, offset=1)
+            values = []
+            for country in countries:
+                columns = calculate_machine_rate_columns(inputs, country[1], country[2:])
+                values.extend(zip(
+                    ids,
+                    [country[0]] * len(ids),
+                    columns["purchase_price"].round(2).tolist(),
+                    *(columns[name].tolist() for name in MACHINE_RATE_DERIVED_COLUMNS),
+                ))
+            with connection.cursor() as write_cursor:
+                write_cursor.executemany(MACHINE_RATE_RESULT_UPSERT, values)
+            written += len(values)
+
+        return written
+    finally:
+        cursor.close()
+
 
+# Machine rates of one item master with the values stored for one country (params: country name, item_master_id)
+MACHINE_RATE_DATA_QUERY = f"""
+    SELECT 
+        mrc.id, 
+        mrc.machine_type_id,
+        mt.machine_type as machine_type_name,
+        mrc.make_id,
+        m.make as make_name,
+        mrc.model_size, 
+        mrc.purchase_price, 
+        mrc.res_value, 
+        mrc.useful_life, 
+        mrc.utilization,
+        mrc.maintenance, 
+        mrc.power_kw_hr, 
+        mrc.power_spec, 
+        mrc.area_m2, 
+        mrc.water_m3_hr, 
+        mrc.consumables,
+        c.id as country_id,
+        r.purchase_price_local,
+        {", ".join(f"r.{name}" for name in MACHINE_RATE_DERIVED_COLUMNS)}
+    FROM machine_rate_calculation mrc
+    LEFT JOIN machine_types mt ON mrc.machine_type_id = mt.id
+    LEFT JOIN makes m ON mrc.make_id = m.id
+    JOIN countries c ON c.name = %s
+    LEFT JOIN machine_rate_results r ON r.machine_rate_id = mrc.id AND r.country_id = c.id
+    WHERE mrc.item_master_id = %s
+"""
+
+def machine_rate_data_row(row, currency_symbol):
+    """ Response dict for one MACHINE_RATE_DATA_QUERY row. """
+    return {
+        "id": row[0],
+        "machine_type": row[2],  # Use machine_type_name instead of ID
+        "make": row[4],          # Use make_name instead of ID
+        "model_size": row[5],
+        "purchase_dollar": to_float(row[17]),  # Local currency value
+        "res_value": row[7],
+        "useful_life": row[8],
+        "utilization": row[9],
+        "maintenance": row[10],
+        "power_kw_hr": row[11],
+        "power_spec": row[12],
+        "area_m2": row[13],
+        "water_m3_hr": row[14],
+        "consumables": row[15],
+        **{name: to_float(value) for name, value in zip(MACHINE_RATE_DERIVED_COLUMNS, row[18:])},
+        "currency_symbol": currency_symbol
+    }
 
-# ✅ Fetch Machine Rate Data with Dynamic Calculations
+# ✅ Fetch Machine Rate Data with Stored Calculations
 @app.get("/machine-rate-data")
-def get_machine_rate_data(item_master_id: int, country: str):
-    connection = pymysql.connect(**db_config)
+def get_machine_rate_data(request: Request, item_master_id: int, country: str, connection=Depends(get_db)):
     cursor = connection.cursor()
 
     # Verify item master exists
@@ -430,76 +1338,25 @@ def get_machine_rate_data(item_master_id: int, country: str):
     if not cursor.fetchone():
         raise HTTPException(status_code=400, detail="Invalid Item Master ID")
 
-    # Fetching data from the database with machine type and make names
-    query = """
-        SELECT 
-            mrc.id, 
-            mrc.machine_type_id,
-            mt.machine_type as machine_type_name,
-            mrc.make_id,
-            m.make as make_name,
-            mrc.model_size, 
-            mrc.purchase_price, 
-            mrc.res_value, 
-            mrc.useful_life, 
-            mrc.utilization,
-            mrc.maintenance, 
-            mrc.power_kw_hr, 
-            mrc.power_spec, 
-            mrc.area_m2, 
-            mrc.water_m3_hr, 
-            mrc.consumables
-        FROM machine_rate_calculation mrc
-        LEFT JOIN machine_types mt ON mrc.machine_type_id = mt.id
-        LEFT JOIN makes m ON mrc.make_id = m.id
-        WHERE mrc.item_master_id = %s;
-    """
-    cursor.execute(query, (item_master_id,))
+    # Validates the country and gives its currency symbol (cached, no query on a hit)
+    currency_symbol = get_country_rates(country, connection)[5]
+
+    # Fetching data from the database with machine type and make names, plus the values stored for this country
+    query = MACHINE_RATE_DATA_QUERY
+    cursor.execute(query, (country, item_master_id))
     rows = cursor.fetchall()
 
-    results = []
-    for row in rows:
-        # Calculate values with currency conversion
-        calculated_values = calculate_values(row, country)
-        
-        # Get exchange rate for purchase price conversion
-        rates = get_country_rates(country)
-        if rates:
-            _, _, _, _, exchange_rate, _ = rates
-            local_purchase_price = float(row[6]) * float(exchange_rate)  # Convert USD to local currency
-        else:
-            local_purchase_price = float(row[6])
-
-        item = {
-            "id": row[0],
-            "machine_type": row[2],  # Use machine_type_name instead of ID
-            "make": row[4],          # Use make_name instead of ID
-            "model_size": row[5],
-            "purchase_dollar": round(local_purchase_price, 2),  # Rounded local currency value
-            "res_value": row[7],
-            "useful_life": row[8],
-            "utilization": row[9],
-            "maintenance": row[10],
-            "power_kw_hr": row[11],
-            "power_spec": row[12],
-            "area_m2": row[13],
-            "water_m3_hr": row[14],
-            "consumables": row[15],
-            **calculated_values
-        }
-        results.append(item)
+    results = [machine_rate_data_row(row, currency_symbol) for row in rows]
 
     cursor.close()
-    connection.close()
 
-    return results
+    return table_response(request, results)
 
 
 
 # ✅ Update a Single Field (Prevents Depreciation Edits)
 @app.put("/update-machine-rate/{id}")
-def update_machine_rate(id: int, update: UpdateMachineRate):
-    connection = pymysql.connect(**db_config)
+def update_machine_rate(id: int, update: UpdateMachineRate, connection=Depends(get_db)):
     cursor = connection.cursor()
 
     try:
@@ -516,6 +1373,7 @@ def update_machine_rate(id: int, update: UpdateMachineRate):
 
         query = f"UPDATE `machine_rate_calculation` SET `{db_column}` = %s WHERE id = %s"
         cursor.execute(query, (update.value, id))
+        refresh_machine_rate_results(connection, machine_rate_ids=[id])
         connection.commit()
 
         return {"message": f"Record with ID {id} updated successfully"}
@@ -527,7 +1385,6 @@ def update_machine_rate(id: int, update: UpdateMachineRate):
 
     finally:
         cursor.close()
-        connection.close()
 
 # ✅ Delete Records
 class DeleteMachineRate(BaseModel):
@@ -535,11 +1392,10 @@ class DeleteMachineRate(BaseModel):
 
 @retry_on_db_error()
 @app.post("/delete-machine-rate")
-def delete_machine_rate(delete_request: DeleteMachineRate):
+def delete_machine_rate(delete_request: DeleteMachineRate, connection=Depends(get_db)):
     if not delete_request.ids:
         raise HTTPException(status_code=400, detail="No IDs provided for deletion")
 
-    connection = pymysql.connect(**db_config)
     cursor = connection.cursor()
 
     try:
@@ -569,7 +1425,6 @@ def delete_machine_rate(delete_request: DeleteMachineRate):
         raise HTTPException(status_code=500, detail=f"Error deleting records: {str(e)}")
     finally:
         cursor.close()
-        connection.close()
 
 # ✅ Create New Machine Rate Entry
 class MachineRateCreate(BaseModel):
@@ -608,8 +1463,7 @@ class MachineRateCreate(BaseModel):
 
 @retry_on_db_error()
 @app.post("/create-machine-rate", dependencies=[Depends(role_required("Admin", "Manager"))])
-def create_machine_rate(item_master_id: int, country: str, rate: MachineRateCreate):
-    connection = pymysql.connect(**db_config)
+def create_machine_rate(item_master_id: int, country: str, rate: MachineRateCreate, connection=Depends(get_db)):
     cursor = connection.cursor()
 
     try:
@@ -619,7 +1473,8 @@ def create_machine_rate(item_master_id: int, country: str, rate: MachineRateCrea
             raise HTTPException(status_code=400, detail="Invalid Item Master ID")
 
         # Get country rates and exchange rate
-        labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, currency_symbol = get_country_rates(country)
+        rates = get_country_rates(country, connection)
+        labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, currency_symbol = rates
 
         # Convert purchase price to USD for storage
         purchase_price_usd = float(rate.purchase_dollar) / float(exchange_rate)  # Convert to USD
@@ -638,18 +1493,21 @@ def create_machine_rate(item_master_id: int, country: str, rate: MachineRateCrea
             rate.maintenance, rate.power_kw_hr, rate.power_spec, rate.area_m2,
             rate.water_m3_hr, rate.consumables
         ))
+        machine_rate_id = cursor.lastrowid
 
+        # Store the derived values for every country, not just the one requested
+        refresh_machine_rate_results(connection, machine_rate_ids=[machine_rate_id])
         connection.commit()
         
-        # Get the inserted record
-        machine_rate_id = cursor.lastrowid
-        cursor.execute("""
-            SELECT * FROM machine_rate_calculation WHERE id = %s
+        # Get the inserted inputs as stored, so the response matches what /machine-rate-data computes
+        cursor.execute(f"""
+            SELECT {", ".join(MACHINE_RATE_INPUT_COLUMNS)} FROM machine_rate_calculation WHERE id = %s
         """, (machine_rate_id,))
         row = cursor.fetchone()
 
         # Calculate values with currency conversion
-        calculated_values = calculate_values(row, country)
+        columns = calculate_machine_rate_columns(machine_rate_input_columns([row], offset=0), country, rates)
+        calculated_values = machine_rate_row_values(columns, 0)
 
         return {
             "message": "Machine rate created successfully",
@@ -681,11 +1539,15 @@ def create_machine_rate(item_master_id: int, country: str, rate: MachineRateCrea
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 
-def get_country_rates(country_name):
-    connection = pymysql.connect(**db_config)
+def get_country_rates(country_name, connection):
+    """ Country rate tuple for `country_name`, served from country_rates_cache when possible. """
+    rates = country_rates_cache.get(country_name)
+    if rates is not None:
+        return rates
+
+    generation = country_rates_cache.generation
     cursor = connection.cursor()
 
     cursor.execute("""
@@ -695,14 +1557,26 @@ def get_country_rates(country_name):
     
     rates = cursor.fetchone()
     cursor.close()
-    connection.close()
     
     if not rates:
         raise HTTPException(status_code=400, detail="Invalid country name")
 
+    country_rates_cache.set(country_name, rates, generation=generation)
     return rates
 
 
+@app.get("/cache-stats", dependencies=[Depends(role_required("Admin"))])
+def cache_stats():
+    """
+    Hit/miss counters for the in-process caches.
+    """
+    return {
+        "country_rates": country_rates_cache.stats(),
+        "token_claims": token_claims_cache.stats(),
+        **{f"reference_{table}": cache.stats() for table, cache in reference_caches.items()},
+    }
+
+
     
 
 # CRUD for Item Master
@@ -727,8 +1601,7 @@ class ItemMaster(BaseModel):
     revision_number: int
 
 @app.post("/create-item-master", dependencies=[Depends(role_required("Admin","Manager"))])
-def create_item_master(item: ItemMaster):
-    connection = pymysql.connect(**db_config)
+def create_item_master(item: ItemMaster, connection=Depends(get_db)):
     cursor = connection.cursor()
     cursor.execute("""
         INSERT INTO item_master (part_number, description, category, model, uom, material, weight, dimensions, 
@@ -740,96 +1613,176 @@ def create_item_master(item: ItemMaster):
           item.lifetime_volume, item.compliance_standards, item.lifecycle_stage, item.drawing_number, item.revision_number))
     connection.commit()
     cursor.close()
-    connection.close()
     return {"message": "Item Master created successfully"}
 
+# Keyset pagination for /fetch-item-masters
+ITEM_MASTER_PAGE_SIZE = int(os.getenv("ITEM_MASTER_PAGE_SIZE", "500"))
+ITEM_MASTER_MAX_PAGE_SIZE = 5000
+
+ITEM_MASTER_FIELDS = (
+    "id", "part_number", "description", "category", "model", "uom", "material", "weight", "dimensions",
+    "color", "supplier", "cost_per_unit", "min_order_qty", "annual_volume", "lifetime_volume",
+    "compliance_standards", "lifecycle_stage", "drawing_number", "revision_number", "created_at",
+)
+
+def parse_item_master_fields(fields):
+    """ Validate a comma-separated `fields=` projection; id is always included as the page cursor. """
+    if not fields:
+        return ITEM_MASTER_FIELDS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in ITEM_MASTER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ("id", *dict.fromkeys(field for field in requested if field != "id"))
+
 @app.get("/fetch-item-masters")
-def fetch_item_master():
+async def fetch_item_master(
+    request: Request,
+    after_id: Optional[int] = Query(None, ge=0, description="Cursor: return items with id greater than this"),
+    limit: Optional[int] = Query(None, ge=1, le=ITEM_MASTER_MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    supplier: Optional[str] = None,
+    lifecycle_stage: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. part_number,description"),
+    connection=Depends(get_async_db),
+):
     """
-    Fetch all Item Master records from the database.
+    Fetch active Item Master records, ordered by id. Without limit or after_id every record is
+    returned, as before paging existed. Otherwise one page is returned (ITEM_MASTER_PAGE_SIZE by default);
+    pass the X-Next-Cursor response header back as after_id to get the next page, the header is absent
+    on the last page. Supports the table_response formats and encodings.
     """
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-
-    query = """
-        SELECT 
-            id, part_number, description, category, model, uom, material, weight, dimensions,
-            color, supplier, cost_per_unit, min_order_qty, annual_volume, lifetime_volume,
-            compliance_standards, lifecycle_stage, drawing_number, revision_number, created_at
-        FROM item_master WHERE is_deleted = 0;  -- Fetch only active records
+    columns = parse_item_master_fields(fields)
+    paged = limit is not None or after_id is not None
+    if paged and limit is None:
+        limit = ITEM_MASTER_PAGE_SIZE
+
+    filters = ["is_deleted = 0"]  # Fetch only active records
+    params = []
+    for column, value in (("category", category), ("supplier", supplier), ("lifecycle_stage", lifecycle_stage)):
+        if value is not None:
+            filters.append(f"{column} = %s")
+            params.append(value)
+    if after_id is not None:
+        filters.append("id > %s")
+        params.append(after_id)
+
+    query = f"""
+        SELECT {", ".join(columns)}
+        FROM item_master
+        WHERE {" AND ".join(filters)}
+        ORDER BY id
     """
-    
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    
-    results = []
-    for row in rows:
-        item = {
-            "id": row[0],
-            "part_number": row[1],
-            "description": row[2],
-            "category": row[3],
-            "model": row[4],
-            "uom": row[5],
-            "material": row[6],
-            "weight": row[7],
-            "dimensions": row[8],
-            "color": row[9],
-            "supplier": row[10],
-            "cost_per_unit": row[11],
-            "min_order_qty": row[12],
-            "annual_volume": row[13],
-            "lifetime_volume": row[14],
-            "compliance_standards": row[15],
-            "lifecycle_stage": row[16],
-            "drawing_number": row[17],
-            "revision_number": row[18],
-            "created_at": row[19]
-        }
-        results.append(item)
+    if paged:
+        # One extra row tells us whether another page follows
+        query += " LIMIT %s"
+        params.append(limit + 1)
 
-    cursor.close()
-    connection.close()
-    
-    return results
+    cursor = await connection.cursor()
+    try:
+        await cursor.execute(query, tuple(params))
+        rows = await cursor.fetchall()
+    finally:
+        await cursor.close()
+
+    headers = {}
+    if paged and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1][0])
+
+    return await table_response_async(request, [dict(zip(columns, row)) for row in rows], columns=columns, headers=headers)
 
 
 @app.get("/fetch-item-masters-dropdown")
-def fetch_item_masters_dropdown():
+async def fetch_item_masters_dropdown(connection=Depends(get_async_db)):
     """
     Retrieve a list of item masters to be used in the dropdown.
     """
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
+    cursor = await connection.cursor()
     
-    cursor.execute("""
+    await cursor.execute("""
         SELECT id, part_number, revision_number FROM item_master WHERE is_deleted = 0
     """)
     item_masters = [
-        {"id": row[0], "label": f"{row[1]} - Rev {row[2]}"} for row in cursor.fetchall()
+        {"id": row[0], "label": f"{row[1]} - Rev {row[2]}"} for row in await cursor.fetchall()
     ]
     
-    cursor.close()
-    connection.close()
+    await cursor.close()
     
     return item_masters
 
+# Typeahead search over item masters
+ITEM_MASTER_SEARCH_LIMIT = 10
+ITEM_MASTER_SEARCH_MAX_LIMIT = 50
+
+def escape_like(value):
+    """ Escape LIKE wildcards so user input only ever matches literally. """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def fulltext_prefix_query(value):
+    """ Boolean-mode FULLTEXT query requiring every word of `value` as a prefix, e.g. "gear hou" -> "+gear* +hou*". """
+    words = re.sub(r'[+\-<>()~*"@]', " ", value).split()
+    return " ".join(f"+{word}*" for word in words)
+
+@app.get("/search-item-masters")
+async def search_item_masters(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(ITEM_MASTER_SEARCH_LIMIT, ge=1, le=ITEM_MASTER_SEARCH_MAX_LIMIT),
+    connection=Depends(get_async_db),
+):
+    """
+    Top `limit` active item masters matching `q`, for dropdown typeahead.
+    Part number prefix matches rank first, then drawing number prefix matches (both index range
+    scans), then FULLTEXT word-prefix matches on part number, description and drawing number.
+    """
+    q = q.strip()
+    prefix = escape_like(q) + "%"
+    fulltext = fulltext_prefix_query(q)
+
+    branches = [
+        ("part_number LIKE %s ORDER BY part_number", prefix),
+        ("drawing_number LIKE %s ORDER BY drawing_number", prefix),
+    ]
+    if fulltext:
+        branches.append(("MATCH(part_number, description, drawing_number) AGAINST (%s IN BOOLEAN MODE)", fulltext))
+
+    query = " UNION ALL ".join(
+        f"(SELECT {rank} AS match_rank, id, part_number, revision_number, description FROM item_master "
+        f"WHERE is_deleted = 0 AND {condition} LIMIT %s)"
+        for rank, (condition, _) in enumerate(branches)
+    )
+    params = [value for _, term in branches for value in (term, limit)]
+
+    cursor = await connection.cursor()
+    try:
+        await cursor.execute(query, tuple(params))
+        rows = await cursor.fetchall()
+    finally:
+        await cursor.close()
+
+    matches = {}
+    for _, item_id, part_number, revision_number, description in sorted(rows, key=lambda row: row[0]):
+        if item_id not in matches:
+            matches[item_id] = {"id": item_id, "label": f"{part_number} - Rev {revision_number}", "description": description}
+        if len(matches) == limit:
+            break
+    return list(matches.values())
+
 @app.get("/fetch-item-master-relations/{item_master_id}", dependencies=[Depends(role_required("Admin"))])
-def fetch_item_master_relations(item_master_id: int):
-    conn = pymysql.connect(**db_config)
+async def fetch_item_master_relations(item_master_id: int, conn=Depends(get_async_db)):
     try:
-        with conn.cursor() as cursor:
+        async with conn.cursor() as cursor:
             # Fetch related Machine Rate records
-            cursor.execute("SELECT * FROM machine_rate_calculation WHERE item_master_id = %s", (item_master_id,))
-            machine_rate = cursor.fetchall()
+            await cursor.execute("SELECT * FROM machine_rate_calculation WHERE item_master_id = %s", (item_master_id,))
+            machine_rate = await cursor.fetchall()
 
             # Fetch related Cost Aggregate records
-            cursor.execute("SELECT * FROM cost_aggregate WHERE item_master_id = %s", (item_master_id,))
-            cost_aggregate = cursor.fetchall()
+            await cursor.execute("SELECT * FROM cost_aggregate WHERE item_master_id = %s", (item_master_id,))
+            cost_aggregate = await cursor.fetchall()
 
             # Fetch related Process Flow Matrix records
-            cursor.execute("SELECT * FROM process_flow_matrix WHERE item_master_id = %s", (item_master_id,))
-            process_flow_matrix = cursor.fetchall()
+            await cursor.execute("SELECT * FROM process_flow_matrix WHERE item_master_id = %s", (item_master_id,))
+            process_flow_matrix = await cursor.fetchall()
 
         return {
             "machine_rate": machine_rate,
@@ -838,13 +1791,10 @@ def fetch_item_master_relations(item_master_id: int):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching related data: {str(e)}")
-    finally:
-        conn.close()
 
 
 @app.delete("/delete-item-master/{item_master_id}", dependencies=[Depends(role_required("Admin"))])
-def delete_item_master(item_master_id: int):
-    conn = pymysql.connect(**db_config)
+def delete_item_master(item_master_id: int, conn=Depends(get_db)):
     try:
         with conn.cursor() as cursor:
             # Delete related records first
@@ -860,25 +1810,77 @@ def delete_item_master(item_master_id: int):
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting item master: {str(e)}")
-    finally:
-        conn.close()
 
 #This is temporary not using this api
 @app.post("/soft-delete-item-master/{id}", dependencies=[Depends(role_required("Admin"))])
-def soft_delete_item_master(id: int):
-    connection = pymysql.connect(**db_config)
+def soft_delete_item_master(id: int, connection=Depends(get_db)):
     cursor = connection.cursor()
     cursor.execute("UPDATE item_master SET is_deleted = 1 WHERE id = %s", (id,))
     connection.commit()
     cursor.close()
-    connection.close()
     return {"message": "Item Master record soft-deleted"}
 
 
-@app.post("/bulk-upload-item-master", dependencies=[Depends(role_required("Admin","Manager"))])
-def bulk_upload_item_master(file: UploadFile = File(...)):
-    contents = file.file.read()
-    df = pd.read_excel(BytesIO(contents))
+# Rows per multi-row INSERT / commit during bulk uploads
+BULK_UPLOAD_CHUNK_SIZE = int(os.getenv("BULK_UPLOAD_CHUNK_SIZE", "1000"))
+BULK_UPLOAD_MAX_CHUNK_SIZE = 10000
+
+ITEM_MASTER_COLUMNS = (
+    "part_number", "description", "category", "model", "uom", "material", "weight", "dimensions",
+    "color", "supplier", "cost_per_unit", "min_order_qty", "annual_volume", "lifetime_volume",
+    "compliance_standards", "lifecycle_stage", "drawing_number", "revision_number",
+)
+
+def dataframe_row_tuples(df, columns):
+    """
+    Convert `columns` of a DataFrame into row tuples of plain Python values in one column-wise pass.
+    NaN/NA become None so the tuples can be handed straight to cursor.executemany.
+    """
+    values = []
+    for column in columns:
+        series = df[column].astype(object)
+        values.append(series.where(series.notna(), None).tolist())
+    return list(zip(*values))
+
+def insert_in_chunks(connection, query, rows, chunk_size, progress=None):
+    """
+    executemany `rows` in chunks of `chunk_size`, committing after each chunk.
+    `query` must end in a plain VALUES (%s, ...) clause so pymysql sends each chunk as one multi-row INSERT.
+    `progress`, if given, is called with the chunk list after every commit.
+    Returns per-chunk row counts and timings.
+    """
+    chunks = []
+    cursor = connection.cursor()
+    try:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            started = time.perf_counter()
+            try:
+                cursor.executemany(query, chunk)
+                connection.commit()
+            except pymysql.Error as e:
+                connection.rollback()
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Chunk {len(chunks) + 1} (rows {start + 1}-{start + len(chunk)}) failed after "
+                           f"{start} rows were committed: {str(e)}"
+                )
+            chunks.append({
+                "chunk": len(chunks) + 1,
+                "rows": len(chunk),
+                "seconds": round(time.perf_counter() - started, 4),
+            })
+            if progress:
+                progress(chunks)
+    finally:
+        cursor.close()
+    return chunks
+
+def parse_item_master_upload(fileobj):
+    """ Read an item master workbook into INSERT-ready row tuples in ITEM_MASTER_COLUMNS order. """
+    import pandas as pd
+
+    df = pd.read_excel(fileobj)
     df = df.where(pd.notnull(df), None)
     column_mapping = {
         "Part Number": "part_number",
@@ -914,30 +1916,52 @@ def bulk_upload_item_master(file: UploadFile = File(...)):
     df["annual_volume"] = df["annual_volume"].apply(extract_numeric).astype("Int64")
     df["lifetime_volume"] = df["lifetime_volume"].apply(extract_numeric).astype("Int64")
     df["revision_number"] = df["revision_number"].astype("Int64")
-    
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-    
-    for _, row in df.iterrows():
-        cursor.execute(
-            """
-            INSERT INTO item_master (part_number, description, category, model, uom, material, weight, dimensions, 
-                                     color, supplier, cost_per_unit, min_order_qty, annual_volume, lifetime_volume, 
-                                     compliance_standards, lifecycle_stage, drawing_number, revision_number, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """,
-            (
-                row["part_number"], row["description"], row["category"], row["model"], row["uom"], row["material"],
-                row["weight"], row["dimensions"], row["color"], row["supplier"], row["cost_per_unit"],
-                row["min_order_qty"], row["annual_volume"], row["lifetime_volume"], row["compliance_standards"],
-                row["lifecycle_stage"], row["drawing_number"], row["revision_number"]
-            )
+
+    return dataframe_row_tuples(df, ITEM_MASTER_COLUMNS)
+
+# created_at is left to its column default so the VALUES clause stays batchable
+ITEM_MASTER_INSERT_QUERY = f"""
+    INSERT INTO item_master ({", ".join(ITEM_MASTER_COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(ITEM_MASTER_COLUMNS))})
+"""
+
+def ingest_item_master_upload(connection, fileobj, chunk_size, job=None):
+    """ Parse an item master workbook and insert it in committed chunks, reporting to `job` if given. """
+    started = time.perf_counter()
+    rows = parse_item_master_upload(fileobj)
+    parse_seconds = time.perf_counter() - started
+
+    progress = None
+    if job:
+        job.report(parsed=len(rows))
+        progress = lambda chunks: job.report(inserted=sum(chunk["rows"] for chunk in chunks))
+
+    chunks = insert_in_chunks(connection, ITEM_MASTER_INSERT_QUERY, rows, chunk_size, progress)
+
+    return {
+        "total_rows": len(rows),
+        "inserted_rows": sum(chunk["rows"] for chunk in chunks),
+        "chunk_size": chunk_size,
+        "parse_seconds": round(parse_seconds, 4),
+        "elapsed_seconds": round(time.perf_counter() - started, 4),
+        "chunks": chunks,
+    }
+
+@app.post("/bulk-upload-item-master", dependencies=[Depends(role_required("Admin","Manager"))])
+def bulk_upload_item_master(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(BULK_UPLOAD_CHUNK_SIZE, ge=1, le=BULK_UPLOAD_MAX_CHUNK_SIZE),
+    background: bool = Query(False, description="Queue the import and return a job id immediately"),
+):
+    # No get_db dependency: a background job opens its own pooled connection, so the submit holds none
+    if background:
+        return submit_upload_job(
+            "item_master", file, lambda conn, fileobj, job: ingest_item_master_upload(conn, fileobj, chunk_size, job)
         )
-    
-    connection.commit()
-    cursor.close()
-    connection.close()
-    return {"message": "Bulk Item Master upload successful"}
+
+    with db_pool.connection() as connection:
+        result = ingest_item_master_upload(connection, BytesIO(file.file.read()), chunk_size)
+    return {"message": "Bulk Item Master upload successful", **result}
 
 
 # Process Flow Matrix Model
@@ -952,8 +1976,7 @@ class ProcessFlowMatrix(BaseModel):
 
 # Create Process Flow Record
 @app.post("/create-process-flow", dependencies=[Depends(role_required("Admin", "Manager"))])
-def create_process_flow(flow: ProcessFlowMatrix):
-    connection = pymysql.connect(**db_config)
+def create_process_flow(flow: ProcessFlowMatrix, connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         # Verify item master exists
@@ -972,6 +1995,7 @@ def create_process_flow(flow: ProcessFlowMatrix):
             flow.machine_type, flow.cycle_time_sec, flow.yield_percentage, flow.operator_count
         ))
 
+        refresh_cost_rollup(connection, flow.item_master_id, changed_flows={(flow.operation, flow.machine_type)})
         connection.commit()
         return {"message": "Process flow created successfully"}
     except pymysql.Error as e:
@@ -982,49 +2006,49 @@ def create_process_flow(flow: ProcessFlowMatrix):
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 # Fetch Process Flow Records
+PROCESS_FLOW_QUERY = """
+    SELECT pf.id, pf.op_no, pf.operation, pf.description, pf.machine_type, mt.machine_type, pf.cycle_time_sec, pf.yield_percentage, pf.operator_count
+    FROM process_flow_matrix pf
+    LEFT JOIN machine_types mt ON pf.machine_type = mt.id
+    WHERE pf.item_master_id = %s
+    ORDER BY pf.op_no
+"""
+
+def process_flow_row(row):
+    """ Response dict for one PROCESS_FLOW_QUERY row. """
+    return {
+        "id": row[0],
+        "op_no": row[1],
+        "operation": row[2],
+        "description": row[3],
+        "machine_type": row[4],  # ID
+        "machine_type_name": row[5],  # Name for display
+        "cycle_time_sec": row[6],
+        "yield_percentage": row[7],
+        "operator_count": row[8]
+    }
+
 @app.get("/fetch-process-flows")
-def fetch_process_flows(item_master_id: int):
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
+async def fetch_process_flows(item_master_id: int, connection=Depends(get_async_db)):
+    cursor = await connection.cursor()
     try:
         # Verify item master exists
-        cursor.execute("SELECT id FROM item_master WHERE id = %s", (item_master_id,))
-        if not cursor.fetchone():
+        await cursor.execute("SELECT id FROM item_master WHERE id = %s", (item_master_id,))
+        if not await cursor.fetchone():
             raise HTTPException(status_code=400, detail="Invalid Item Master ID")
 
         # Fetch process flow records with machine type name
-        cursor.execute("""
-            SELECT pf.id, pf.op_no, pf.operation, pf.description, pf.machine_type, mt.machine_type, pf.cycle_time_sec, pf.yield_percentage, pf.operator_count
-            FROM process_flow_matrix pf
-            LEFT JOIN machine_types mt ON pf.machine_type = mt.id
-            WHERE pf.item_master_id = %s
-            ORDER BY pf.op_no
-        """, (item_master_id,))
-        records = cursor.fetchall()
-        process_flows = []
-        for row in records:
-            process_flows.append({
-                "id": row[0],
-                "op_no": row[1],
-                "operation": row[2],
-                "description": row[3],
-                "machine_type": row[4],  # ID
-                "machine_type_name": row[5],  # Name for display
-                "cycle_time_sec": row[6],
-                "yield_percentage": row[7],
-                "operator_count": row[8]
-            })
+        await cursor.execute(PROCESS_FLOW_QUERY, (item_master_id,))
+        process_flows = [process_flow_row(row) for row in await cursor.fetchall()]
         return process_flows
     except pymysql.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cursor.close()
-        connection.close()
+        await cursor.close()
 
 # Delete Process Flow Records
 class DeleteProcessFlow(BaseModel):
@@ -1032,18 +2056,18 @@ class DeleteProcessFlow(BaseModel):
 
 @retry_on_db_error()
 @app.post("/delete-process-flow", dependencies=[Depends(role_required("Admin"))])
-def delete_process_flow(delete_request: DeleteProcessFlow):
+def delete_process_flow(delete_request: DeleteProcessFlow, connection=Depends(get_db)):
     if not delete_request.ids:
         raise HTTPException(status_code=400, detail="No IDs provided for deletion")
 
-    connection = pymysql.connect(**db_config)
     cursor = connection.cursor()
     
     try:
         # First verify the records exist
         id_list = ','.join(['%s'] * len(delete_request.ids))
-        cursor.execute(f"SELECT COUNT(*) FROM process_flow_matrix WHERE id IN ({id_list})", tuple(delete_request.ids))
-        count = cursor.fetchone()[0]
+        cursor.execute(f"SELECT item_master_id, operation, machine_type FROM process_flow_matrix WHERE id IN ({id_list})", tuple(delete_request.ids))
+        flows = cursor.fetchall()
+        count = len(flows)
         
         if count != len(delete_request.ids):
             raise HTTPException(status_code=404, detail="Some records not found")
@@ -1051,6 +2075,13 @@ def delete_process_flow(delete_request: DeleteProcessFlow):
         # Perform the deletion
         query = f"DELETE FROM process_flow_matrix WHERE id IN ({id_list})"
         cursor.execute(query, tuple(delete_request.ids))
+
+        # Cost aggregates that were costed against these flows move in (or out of) the chain
+        changed_flows = {}
+        for item_master_id, operation, machine_type in flows:
+            changed_flows.setdefault(item_master_id, set()).add((operation, machine_type))
+        for item_master_id, flow_keys in changed_flows.items():
+            refresh_cost_rollup(connection, item_master_id, changed_flows=flow_keys)
         connection.commit()
 
         return {
@@ -1066,7 +2097,6 @@ def delete_process_flow(delete_request: DeleteProcessFlow):
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 # Cost Aggregation Model
 class CostAggregate(BaseModel):
@@ -1078,8 +2108,7 @@ class CostAggregate(BaseModel):
     input_material_cost: float
     consumables_cost: float
 
-def get_process_flow_data_by_id(process_flow_id):
-    connection = pymysql.connect(**db_config)
+def get_process_flow_data_by_id(process_flow_id, connection):
     cursor = connection.cursor()
     try:
         cursor.execute("""
@@ -1097,7 +2126,6 @@ def get_process_flow_data_by_id(process_flow_id):
         }
     finally:
         cursor.close()
-        connection.close()
 
 def calculate_costs(data, cycle_time_sec, yield_percentage, operator_count):
     # Calculate costs based on process flow data
@@ -1122,10 +2150,145 @@ def to_float(val):
         return float(val)
     return float(val) if val is not None else 0.0
 
-@retry_on_db_error()
+# Cumulative cost chain: stored per cost aggregate in cost_aggregate_rollup, maintained incrementally
+COST_ROLLUP_COLUMNS = (
+    "total_labor_cost", "total_machine_cost", "total_operating_cost",
+    "cumulative_operating_cost", "yield_loss_cost", "total_cost",
+)
+
+# process_flow_matrix has no unique key on (item_master_id, operation, machine_type); joining only the
+# lowest matching flow id keeps one row per cost aggregate when duplicates exist
+COST_AGGREGATE_FLOW_JOIN = """LEFT JOIN process_flow_matrix pf ON pf.id = (
+        SELECT MIN(flow.id) FROM process_flow_matrix flow
+        WHERE flow.item_master_id = ca.item_master_id AND flow.operation = ca.operation AND flow.machine_type = ca.machine_type
+    )"""
+
+# Chain order is op_no, then id (op_no can be NULL); rollup values start at column COST_CHAIN_ROLLUP
+COST_CHAIN_QUERY = f"""
+    SELECT 
+        ca.id, ca.operation, ca.machine_type, ca.machine_rate, ca.labor_rate,
+        ca.input_material_cost, ca.consumables_cost, ca.total_cost,
+        pf.id as process_flow_id, pf.op_no, pf.description, pf.machine_type as pf_machine_type, pf.cycle_time_sec,
+        pf.yield_percentage, pf.operator_count,
+        r.position, {", ".join(f"r.{name}" for name in COST_ROLLUP_COLUMNS)}
+    FROM cost_aggregate ca
+    {COST_AGGREGATE_FLOW_JOIN}
+    LEFT JOIN cost_aggregate_rollup r ON r.cost_aggregate_id = ca.id
+    WHERE ca.item_master_id = %s
+    ORDER BY pf.op_no, ca.id
+"""
+COST_CHAIN_ROLLUP = 16
+
+COST_ROLLUP_UPSERT = f"""
+    INSERT INTO cost_aggregate_rollup (
+        cost_aggregate_id, item_master_id, position, {", ".join(COST_ROLLUP_COLUMNS)}
+    ) VALUES (%s, %s, %s, {", ".join(["%s"] * len(COST_ROLLUP_COLUMNS))})
+    ON DUPLICATE KEY UPDATE position = VALUES(position),
+        {", ".join(f"{name} = VALUES({name})" for name in COST_ROLLUP_COLUMNS)}
+"""
+
+# cost_aggregate.total_cost holds the chain's total_cost: the cumulative cost through that operation,
+# yield losses included, so the last operation's value is the item's cost
+COST_AGGREGATE_TOTAL_UPDATE = "UPDATE cost_aggregate SET total_cost = %s WHERE id = %s"
+
+def cost_chain_step(row, cumulative_operating_cost):
+    """ One operation's costs from a COST_CHAIN_QUERY row, given the running total of the operations before it. """
+    machine_rate = to_float(row[3])
+    labor_rate = to_float(row[4])
+    input_material_cost = to_float(row[5])
+    consumables_cost = to_float(row[6])
+    cycle_time_sec = to_float(row[12])
+    yield_percentage = to_float(row[13])
+    operator_count = to_float(row[14])
+
+    total_labor_cost = (cycle_time_sec / 3600) * operator_count * labor_rate
+    total_machine_cost = (cycle_time_sec / 3600) * machine_rate
+    total_operating_cost = input_material_cost + consumables_cost + total_labor_cost + total_machine_cost
+    cumulative_operating_cost += total_operating_cost
+    yield_loss_cost = (cumulative_operating_cost / (yield_percentage / 100)) - cumulative_operating_cost if yield_percentage else 0
+    total_cost = cumulative_operating_cost + yield_loss_cost
+
+    return {
+        "total_labor_cost": total_labor_cost,
+        "total_machine_cost": total_machine_cost,
+        "total_operating_cost": total_operating_cost,
+        "cumulative_operating_cost": cumulative_operating_cost,
+        "yield_loss_cost": yield_loss_cost,
+        "total_cost": total_cost,
+    }
+
+def cost_rollup_start(records, changed_ids=(), changed_flows=()):
+    """
+    Index of the first chain row whose stored rollup must be recomputed: a changed cost aggregate,
+    one matching a changed (operation, machine_type) process flow, or a row whose stored position
+    no longer matches (rows inserted or deleted before it). len(records) means the chain is current.
+    """
+    for position, row in enumerate(records):
+        if row[0] in changed_ids or (row[1], row[2]) in changed_flows or row[COST_CHAIN_ROLLUP - 1] != position:
+            return position
+    return len(records)
+
+def refresh_cost_rollup(connection, item_master_id, changed_ids=(), changed_flows=()):
+    """
+    Bring the stored cumulative cost chain for one item master up to date, in cost_aggregate_rollup
+    and in cost_aggregate.total_cost. Only the first changed operation and those after it are
+    recomputed; earlier rows keep their stored values and seed the running total.
+    Does not commit: writers call it before their own commit. Returns the number of rows rewritten.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(COST_CHAIN_QUERY, (item_master_id,))
+        records = cursor.fetchall()
+        start = cost_rollup_start(records, set(changed_ids), set(changed_flows))
+        if start == len(records):
+            return 0
+
+        cumulative_operating_cost = to_float(records[start - 1][COST_CHAIN_ROLLUP + 3]) if start else 0.0
+        values = []
+        for position in range(start, len(records)):
+            row = records[position]
+            step = cost_chain_step(row, cumulative_operating_cost)
+            cumulative_operating_cost = step["cumulative_operating_cost"]
+            values.append((row[0], item_master_id, position, *(step[name] for name in COST_ROLLUP_COLUMNS)))
+
+        cursor.executemany(COST_ROLLUP_UPSERT, values)
+        cursor.executemany(COST_AGGREGATE_TOTAL_UPDATE, [(row[-1], row[0]) for row in values])
+        return len(values)
+    finally:
+        cursor.close()
+
+def cost_aggregate_row(row):
+    """ Response dict for one COST_CHAIN_QUERY row, using its stored rollup values. """
+    rollup = dict(zip(COST_ROLLUP_COLUMNS, row[COST_CHAIN_ROLLUP:]))
+    return {
+        "id": row[0],
+        "operation": row[1],
+        "machine_type": row[2],
+        "process_flow_id": row[8],
+        "op_no": row[9],
+        "description": row[10],
+        "pf_machine_type": row[11],
+        "cycle_time_sec": to_float(row[12]),
+        "yield_percentage": to_float(row[13]),
+        "operator_count": to_float(row[14]),
+        "machine_rate": to_float(row[3]),
+        "labor_rate": to_float(row[4]),
+        "input_material_cost": to_float(row[5]),
+        "consumables_cost": to_float(row[6]),
+        **{name: round(to_float(value), 3) for name, value in rollup.items()},
+        "total_cost_db": round(to_float(row[7]), 3)
+    }
+
+COST_AGGREGATE_INSERT_QUERY = """
+    INSERT INTO cost_aggregate (
+        item_master_id, operation, machine_type, machine_rate, labor_rate,
+        input_material_cost, consumables_cost, total_cost
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+@retry_on_db_error()
 @app.post("/create-cost-aggregate", dependencies=[Depends(role_required("Admin", "Manager"))])
-def create_cost_aggregate(cost: CostAggregate):
-    connection = pymysql.connect(**db_config)
+def create_cost_aggregate(cost: CostAggregate, connection=Depends(get_db)):
     cursor = connection.cursor()
 
     try:
@@ -1139,13 +2302,7 @@ def create_cost_aggregate(cost: CostAggregate):
         yield_percentage = to_float(process_flow[6])
         operator_count = to_float(process_flow[7])
 
-        # Check for duplicate
-        cursor.execute(
-            "SELECT id FROM cost_aggregate WHERE item_master_id = %s AND operation = %s AND machine_type = %s",
-            (cost.item_master_id, cost.operation, cost.machine_type)
-        )
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Cost aggregate already exists for this process flow.")
+        # Duplicates are rejected by the uq_cost_aggregate_process_flow unique key (IntegrityError below)
 
         # Convert all numeric fields to float
         cost.machine_rate = to_float(cost.machine_rate)
@@ -1162,23 +2319,19 @@ def create_cost_aggregate(cost: CostAggregate):
         )
 
         # Insert cost aggregation record
-        cursor.execute("""
-            INSERT INTO cost_aggregate (
-                item_master_id, operation, machine_type, machine_rate, labor_rate,
-                input_material_cost, consumables_cost, total_cost
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
+        cursor.execute(COST_AGGREGATE_INSERT_QUERY, (
             cost.item_master_id, cost.operation, cost.machine_type, cost.machine_rate, cost.labor_rate,
             cost.input_material_cost, cost.consumables_cost, costs["total_cost"]
         ))
 
+        refresh_cost_rollup(connection, cost.item_master_id, changed_ids={cursor.lastrowid})
         connection.commit()
         return {"message": "Cost aggregation record created successfully"}
 
     except pymysql.err.IntegrityError as e:
         connection.rollback()
         if "Duplicate entry" in str(e):
-            raise HTTPException(status_code=400, detail="Record already present for this operation and machine type.")
+            raise HTTPException(status_code=400, detail="Cost aggregate already exists for this process flow.")
         else:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
@@ -1186,11 +2339,100 @@ def create_cost_aggregate(cost: CostAggregate):
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
+
+COST_AGGREGATE_BATCH_MAX = 1000
+
+def process_flow_keys_clause(keys):
+    """ Row-constructor IN clause over (item_master_id, operation, machine_type) keys, served by the lookup indexes. """
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(keys))
+    return f"(item_master_id, operation, machine_type) IN ({placeholders})", [value for key in keys for value in key]
+
+@app.post("/create-cost-aggregate-batch", dependencies=[Depends(role_required("Admin", "Manager"))])
+def create_cost_aggregate_batch(costs: List[CostAggregate], connection=Depends(get_db)):
+    """
+    Create many cost aggregates in one transaction: one process flow query, one duplicate query,
+    costs computed in memory and a single multi-row INSERT. Entries that cannot be created are
+    reported by their index in the request; the others are still inserted.
+    """
+    if not costs:
+        raise HTTPException(status_code=400, detail="No cost aggregates provided")
+    if len(costs) > COST_AGGREGATE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {COST_AGGREGATE_BATCH_MAX} cost aggregates per batch")
+
+    results = [{"index": index, "status": "created"} for index in range(len(costs))]
+
+    def fail(index, message):
+        results[index] = {"index": index, "status": "failed", "error": message}
+
+    keys = list(dict.fromkeys((cost.item_master_id, cost.operation, cost.machine_type) for cost in costs))
+    where, params = process_flow_keys_clause(keys)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT item_master_id, operation, machine_type, cycle_time_sec, yield_percentage, operator_count
+            FROM process_flow_matrix WHERE {where}
+        """, params)
+        process_flows = {}
+        for row in cursor.fetchall():
+            process_flows.setdefault((row[0], row[1], row[2]), row[3:])
+
+        cursor.execute(f"SELECT item_master_id, operation, machine_type FROM cost_aggregate WHERE {where}", params)
+        existing = set(cursor.fetchall())
+
+        pending = []
+        for index, cost in enumerate(costs):
+            key = (cost.item_master_id, cost.operation, cost.machine_type)
+            process_flow = process_flows.get(key)
+            if process_flow is None:
+                fail(index, "Process flow not found for the given operation, machine type, and item master.")
+                continue
+            if key in existing:
+                fail(index, "Record already present for this operation and machine type.")
+                continue
+            cycle_time_sec, yield_percentage, operator_count = (to_float(value) for value in process_flow)
+            if not yield_percentage:
+                fail(index, "Process flow yield percentage is zero.")
+                continue
+            existing.add(key)  # A second entry for the same process flow in this batch is a duplicate too
+            total_cost = calculate_costs(cost, cycle_time_sec, yield_percentage, operator_count)["total_cost"]
+            pending.append((index, (
+                cost.item_master_id, cost.operation, cost.machine_type, cost.machine_rate, cost.labor_rate,
+                cost.input_material_cost, cost.consumables_cost, total_cost
+            )))
+
+        if pending:
+            try:
+                cursor.executemany(COST_AGGREGATE_INSERT_QUERY, [values for _, values in pending])
+            except pymysql.err.IntegrityError:
+                # A concurrent insert won a unique key; a failed statement leaves the transaction open,
+                # so retry row by row and keep every entry that still fits
+                for index, values in pending:
+                    try:
+                        cursor.execute(COST_AGGREGATE_INSERT_QUERY, values)
+                    except pymysql.err.IntegrityError as e:
+                        fail(index, "Record already present for this operation and machine type."
+                             if "Duplicate entry" in str(e) else f"Database error: {str(e)}")
+
+        created = [costs[result["index"]].item_master_id for result in results if result["status"] == "created"]
+        for item_master_id in dict.fromkeys(created):
+            refresh_cost_rollup(connection, item_master_id)
+        connection.commit()
+
+        return {
+            "message": f"Created {len(created)} of {len(costs)} cost aggregation records",
+            "created": len(created),
+            "failed": len(costs) - len(created),
+            "results": results,
+        }
+
+    except pymysql.Error as e:
+        connection.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        cursor.close()
 
 @app.put("/update-cost-aggregate/{id}", dependencies=[Depends(role_required("Admin", "Manager"))])
-def update_cost_aggregate(id: int, cost: CostAggregate):
-    connection = pymysql.connect(**db_config)
+def update_cost_aggregate(id: int, cost: CostAggregate, connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         # Get process flow details based on item_master_id, operation, and machine_type
@@ -1221,9 +2463,15 @@ def update_cost_aggregate(id: int, cost: CostAggregate):
                     cost.input_material_cost, cost.consumables_cost, costs["total_cost"],
                     id
                 ))
+        refresh_cost_rollup(connection, cost.item_master_id, changed_ids={id})
         connection.commit()
         return {"message": "Cost aggregation record updated successfully"}
         
+    except pymysql.err.IntegrityError as e:
+        connection.rollback()
+        if "Duplicate entry" in str(e):
+            raise HTTPException(status_code=400, detail="Record already present for this operation and machine type.")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except pymysql.Error as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -1232,21 +2480,26 @@ def update_cost_aggregate(id: int, cost: CostAggregate):
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 class DeleteCostAggregateRequest(BaseModel):
     ids: List[int]
 
 @retry_on_db_error()
 @app.post("/delete-cost-aggregate", dependencies=[Depends(role_required("Admin"))])
-def delete_cost_aggregate_bulk(request: DeleteCostAggregateRequest):
+def delete_cost_aggregate_bulk(request: DeleteCostAggregateRequest, connection=Depends(get_db)):
     if not request.ids:
         raise HTTPException(status_code=400, detail="No IDs provided for deletion")
-    connection = pymysql.connect(**db_config)
     cursor = connection.cursor()
     try:
         id_list = ','.join(['%s'] * len(request.ids))
+        cursor.execute(f"SELECT DISTINCT item_master_id FROM cost_aggregate WHERE id IN ({id_list})", tuple(request.ids))
+        item_master_ids = [row[0] for row in cursor.fetchall()]
+
         cursor.execute(f"DELETE FROM cost_aggregate WHERE id IN ({id_list})", tuple(request.ids))
+
+        # Operations after the deleted ones shift position, which refresh_cost_rollup picks up
+        for item_master_id in item_master_ids:
+            refresh_cost_rollup(connection, item_master_id)
         connection.commit()
         return {"message": f"{len(request.ids)} cost aggregate(s) deleted successfully"}
     except Exception as e:
@@ -1254,7 +2507,6 @@ def delete_cost_aggregate_bulk(request: DeleteCostAggregateRequest):
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 
 class Country(BaseModel):
@@ -1268,12 +2520,11 @@ class Country(BaseModel):
 
 
 @app.post("/create-country", dependencies=[Depends(role_required("Admin"))])
-def create_country(country: Country):
+def create_country(country: Country, connection=Depends(get_db)):
     max_retries = 3
     retry_count = 0
     
     while retry_count < max_retries:
-        connection = pymysql.connect(**db_config)
         cursor = connection.cursor()
         
         try:
@@ -1282,16 +2533,17 @@ def create_country(country: Country):
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (country.name, country.currency_symbol, country.labor_rate, country.electricity_rate, 
                   country.water_rate, country.space_rental_rate, country.exchange_rate))
+            refresh_machine_rate_results(connection, country_ids=[cursor.lastrowid])
             
             connection.commit()
+            country_rates_cache.clear()
+            invalidate_reference_cache("countries")
             cursor.close()
-            connection.close()
             return {"message": "Country created successfully"}
 
         except pymysql.err.IntegrityError as e:
             connection.rollback()
             cursor.close()
-            connection.close()
             raise HTTPException(status_code=400, detail=str(e))
             
         except pymysql.err.OperationalError as e:
@@ -1299,71 +2551,49 @@ def create_country(country: Country):
                 retry_count += 1
                 connection.rollback()
                 cursor.close()
-                connection.close()
                 continue
             else:
                 connection.rollback()
                 cursor.close()
-                connection.close()
                 raise HTTPException(status_code=500, detail="Database operation failed. Please try again.")
                 
         except Exception as e:
             connection.rollback()
             cursor.close()
-            connection.close()
             raise HTTPException(status_code=500, detail=str(e))
             
     raise HTTPException(status_code=500, detail="Maximum retry attempts reached. Please try again later.")
 
 
 @app.get("/fetch-countries")
-def fetch_countries():
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-    
-    cursor.execute("""
-        SELECT id, name, currency_symbol, labor_rate, electricity_rate, 
-               water_rate, space_rental_rate, exchange_rate 
-        FROM countries
-    """)
-    countries = [{
-        "id": row[0], 
-        "name": row[1],
-        "currency_symbol": row[2],
-        "labor_rate": row[3],
-        "electricity_rate": row[4],
-        "water_rate": row[5],
-        "space_rental_rate": row[6],
-        "exchange_rate": row[7]
-    } for row in cursor.fetchall()]
-    
-    cursor.close()
-    connection.close()
-    return countries
-
-
-def get_country_rates(country_name):
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-
-    cursor.execute("""
-        SELECT labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, currency_symbol
-        FROM countries WHERE name = %s
-    """, (country_name,))
-    
-    rates = cursor.fetchone()
-    cursor.close()
-    connection.close()
-    
-    if not rates:
-        raise HTTPException(status_code=400, detail="Invalid country name")
+async def fetch_countries(request: Request):
+    async def load(connection):
+        cursor = await connection.cursor()
+        
+        await cursor.execute("""
+            SELECT id, name, currency_symbol, labor_rate, electricity_rate, 
+                   water_rate, space_rental_rate, exchange_rate 
+            FROM countries
+        """)
+        countries = [{
+            "id": row[0], 
+            "name": row[1],
+            "currency_symbol": row[2],
+            "labor_rate": row[3],
+            "electricity_rate": row[4],
+            "water_rate": row[5],
+            "space_rental_rate": row[6],
+            "exchange_rate": row[7]
+        } for row in await cursor.fetchall()]
+        
+        await cursor.close()
+        return countries
+    return await cached_reference_response(request, "countries", "fetch-countries", load)
 
-    return rates
 
 @app.put("/update-exchange-rate", dependencies=[Depends(role_required("Admin"))])
 def update_exchange_rate(country_id: int, labor_rate: float, electricity_rate: float, 
-                        water_rate: float, space_rental_rate: float, exchange_rate: float):
-    connection = pymysql.connect(**db_config)
+                        water_rate: float, space_rental_rate: float, exchange_rate: float, connection=Depends(get_db)):
     cursor = connection.cursor()
     
     cursor.execute("""
@@ -1371,46 +2601,105 @@ def update_exchange_rate(country_id: int, labor_rate: float, electricity_rate: f
         SET labor_rate=%s, electricity_rate=%s, water_rate=%s, space_rental_rate=%s, exchange_rate=%s
         WHERE id=%s
     """, (labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, country_id))
+    refresh_machine_rate_results(connection, country_ids=[country_id])
     
     connection.commit()
+    country_rates_cache.clear()
+    invalidate_reference_cache("countries")
     cursor.close()
-    connection.close()
     return {"message": "Exchange rate updated successfully"}
 
-@app.post("/bulk-upload-machine-rates", dependencies=[Depends(role_required("Admin","Manager"))])
-def bulk_upload_machine_rates(file: UploadFile = File(...), item_master_id: int = Form(...)):
-    try:
-        contents = file.file.read()
-        df = pd.read_excel(BytesIO(contents))
-
-        # Define the expected columns and their mappings
-        expected_columns = {
-            "Machine Type": "machine_type_id",
-            "Make": "make_id",
-            "Model/Size": "model_size",
-            "Purchase $": "purchase_price",
-            "Res Value": "res_value",
-            "Useful Life": "useful_life",
-            "Utilization": "utilization",
-            "Maintenance": "maintenance",
-            "Power (kW/hr)": "power_kw_hr",
-            "Power Spec": "power_spec",
-            "Area m2": "area_m2",
-            "Water m3/hr": "water_m3_hr",
-            "Consumables": "consumables"
-        }
+# Spreadsheet header -> machine_rate_calculation column, in insert order after item_master_id
+MACHINE_RATE_UPLOAD_COLUMNS = {
+    "Machine Type": "machine_type_id",
+    "Make": "make_id",
+    "Model/Size": "model_size",
+    "Purchase $": "purchase_price",
+    "Res Value": "res_value",
+    "Useful Life": "useful_life",
+    "Utilization": "utilization",
+    "Maintenance": "maintenance",
+    "Power (kW/hr)": "power_kw_hr",
+    "Power Spec": "power_spec",
+    "Area m2": "area_m2",
+    "Water m3/hr": "water_m3_hr",
+    "Consumables": "consumables"
+}
+MACHINE_RATE_UPLOAD_NUMERIC = list(MACHINE_RATE_UPLOAD_COLUMNS)[3:]
+MAX_REPORTED_UPLOAD_ERRORS = 1000
 
-        # Verify all required columns are present
-        missing_columns = [col for col in expected_columns.keys() if col not in df.columns]
-        if missing_columns:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing required columns: {', '.join(missing_columns)}"
-            )
+def iter_tabular_upload(fileobj, filename):
+    """
+    Lazily yield rows (header first) from an uploaded .xlsx or .csv file.
+    Workbooks are opened in openpyxl read-only mode and CSVs are read line by line,
+    so the upload is never loaded into memory as a whole.
+    """
+    from openpyxl import load_workbook
 
-        connection = pymysql.connect(**db_config)
-        cursor = connection.cursor()
+    if (filename or "").lower().endswith(".csv"):
+        text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+        try:
+            yield from csv.reader(text)
+        finally:
+            text.detach()  # Leave the underlying upload open for FastAPI to clean up
+    else:
+        try:
+            workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Unsupported file: upload an .xlsx workbook or a .csv file")
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+def parse_machine_rate_row(values, positions, machine_types, makes):
+    """ Validate one uploaded machine-rate row and convert it to the insert column order. """
+    machine_type_name = str(values[positions["Machine Type"]]).strip()
+    make_name = str(values[positions["Make"]]).strip()
+
+    if machine_type_name not in machine_types:
+        raise ValueError(f"Invalid Machine Type: {machine_type_name}")
+    if make_name not in makes:
+        raise ValueError(f"Invalid Make: {make_name}")
+
+    numbers = []
+    for column in MACHINE_RATE_UPLOAD_NUMERIC:
+        value = values[positions[column]]
+        if value is None or (isinstance(value, str) and not value.strip()):
+            raise ValueError(f"Missing value for {column}")
+        numbers.append(float(value))
+
+    return (
+        machine_types[machine_type_name],
+        makes[make_name],
+        str(values[positions["Model/Size"]]),
+        *numbers,
+    )
+
+def ingest_machine_rate_rows(connection, item_master_id, rows, batch_size, job=None):
+    """
+    Validate and insert machine-rate rows from iter_tabular_upload in bounded batches.
+    Each batch is flushed with one multi-row INSERT and committed, so memory use does not grow
+    with the file. A batch the database rejects is retried row by row to report the failing rows.
+    Progress is reported to `job` after every batch when running as a background upload.
+    """
+    header = next(rows, None)
+    if header is None:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    header = [str(column).strip() if column is not None else "" for column in header]
+
+    # Verify all required columns are present
+    missing_columns = [col for col in MACHINE_RATE_UPLOAD_COLUMNS if col not in header]
+    if missing_columns:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing required columns: {', '.join(missing_columns)}"
+        )
+    positions = {column: header.index(column) for column in MACHINE_RATE_UPLOAD_COLUMNS}
+    width = len(header)
 
+    cursor = connection.cursor()
+    try:
         # Verify item master exists
         cursor.execute("SELECT id FROM item_master WHERE id = %s", (item_master_id,))
         if not cursor.fetchone():
@@ -1419,84 +2708,267 @@ def bulk_upload_machine_rates(file: UploadFile = File(...), item_master_id: int
         # Get machine types and makes mappings
         cursor.execute("SELECT id, machine_type FROM machine_types")
         machine_types = {row[1]: row[0] for row in cursor.fetchall()}
-        
+
         cursor.execute("SELECT id, make FROM makes")
         makes = {row[1]: row[0] for row in cursor.fetchall()}
 
-        # Process each row
-        success_count = 0
+        insert_query = f"""
+            INSERT INTO machine_rate_calculation (
+                item_master_id, {", ".join(MACHINE_RATE_UPLOAD_COLUMNS.values())}
+            ) VALUES ({", ".join(["%s"] * (len(MACHINE_RATE_UPLOAD_COLUMNS) + 1))})
+        """
+
+        stats = {"total_rows": 0, "successful_uploads": 0, "failed_uploads": 0, "batches": 0}
         errors = []
-        
-        for index, row in df.iterrows():
+
+        def record_error(row_number, message):
+            stats["failed_uploads"] += 1
+            if len(errors) < MAX_REPORTED_UPLOAD_ERRORS:
+                errors.append(f"Row {row_number}: {message}")
+
+        def flush(batch):
+            if not batch:
+                return
             try:
-                # Convert machine type and make names to IDs
-                machine_type_name = str(row["Machine Type"]).strip()
-                make_name = str(row["Make"]).strip()
-                
-                if machine_type_name not in machine_types:
-                    raise ValueError(f"Invalid Machine Type: {machine_type_name}")
-                if make_name not in makes:
-                    raise ValueError(f"Invalid Make: {make_name}")
-
-                # Prepare data for insertion
-                insert_data = {
-                    "item_master_id": item_master_id,
-                    "machine_type_id": machine_types[machine_type_name],
-                    "make_id": makes[make_name],
-                    "model_size": str(row["Model/Size"]),
-                    "purchase_price": float(row["Purchase $"]),
-                    "res_value": float(row["Res Value"]),
-                    "useful_life": float(row["Useful Life"]),
-                    "utilization": float(row["Utilization"]),
-                    "maintenance": float(row["Maintenance"]),
-                    "power_kw_hr": float(row["Power (kW/hr)"]),
-                    "power_spec": float(row["Power Spec"]),
-                    "area_m2": float(row["Area m2"]),
-                    "water_m3_hr": float(row["Water m3/hr"]),
-                    "consumables": float(row["Consumables"])
-                }
-
-                # Insert the record
-                cursor.execute("""
-                    INSERT INTO machine_rate_calculation (
-                        item_master_id, machine_type_id, make_id, model_size,
-                        purchase_price, res_value, useful_life, utilization,
-                        maintenance, power_kw_hr, power_spec, area_m2,
-                        water_m3_hr, consumables
-                    ) VALUES (
-                        %(item_master_id)s, %(machine_type_id)s, %(make_id)s, %(model_size)s,
-                        %(purchase_price)s, %(res_value)s, %(useful_life)s, %(utilization)s,
-                        %(maintenance)s, %(power_kw_hr)s, %(power_spec)s, %(area_m2)s,
-                        %(water_m3_hr)s, %(consumables)s
-                    )
-                """, insert_data)
-                
-                success_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {index + 2}: {str(e)}")
+                cursor.executemany(insert_query, [values for _, values in batch])
+                connection.commit()
+                stats["successful_uploads"] += len(batch)
+            except pymysql.Error:
+                connection.rollback()
+                for row_number, values in batch:
+                    try:
+                        cursor.execute(insert_query, values)
+                        connection.commit()
+                        stats["successful_uploads"] += 1
+                    except pymysql.Error as e:
+                        connection.rollback()
+                        record_error(row_number, str(e))
+            stats["batches"] += 1
+            if job:
+                job.report(
+                    parsed=stats["total_rows"],
+                    inserted=stats["successful_uploads"],
+                    failed=stats["failed_uploads"],
+                    errors=errors,
+                )
+
+        batch = []
+        # Spreadsheet row numbers: the header is row 1
+        for row_number, values in enumerate(rows, start=2):
+            if values is None or all(value is None or value == "" for value in values):
+                continue
+            stats["total_rows"] += 1
+            values = tuple(values) + (None,) * (width - len(values))
+            try:
+                batch.append((row_number, (item_master_id, *parse_machine_rate_row(values, positions, machine_types, makes))))
+            except (ValueError, TypeError) as e:
+                record_error(row_number, str(e))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        flush(batch)
+    finally:
+        cursor.close()
 
-        connection.commit()
+    if stats["successful_uploads"]:
+        # Rows are committed batch by batch above; their stored results follow in one more commit
+        if refresh_machine_rate_results(connection, item_master_id=item_master_id):
+            connection.commit()
 
-        # Prepare response
-        response = {
-            "message": f"Successfully uploaded {success_count} records",
-            "total_rows": len(df),
-            "successful_uploads": success_count,
-            "failed_uploads": len(df) - success_count
-        }
-        
-        if errors:
-            response["errors"] = errors
+    if errors:
+        stats["errors"] = errors
+    return stats
 
-        return response
+@app.post("/bulk-upload-machine-rates", dependencies=[Depends(role_required("Admin","Manager"))])
+def bulk_upload_machine_rates(
+    file: UploadFile = File(...),
+    item_master_id: int = Form(...),
+    batch_size: int = Query(BULK_UPLOAD_CHUNK_SIZE, ge=1, le=BULK_UPLOAD_MAX_CHUNK_SIZE),
+    background: bool = Query(False, description="Queue the import and return a job id immediately"),
+):
+    # No get_db dependency: a background job opens its own pooled connection, so the submit holds none
+    if background:
+        filename = file.filename
+        return submit_upload_job(
+            "machine_rates", file,
+            lambda conn, fileobj, job: ingest_machine_rate_rows(
+                conn, item_master_id, iter_tabular_upload(fileobj, filename), batch_size, job
+            ),
+        )
 
+    try:
+        with db_pool.connection() as connection:
+            stats = ingest_machine_rate_rows(
+                connection, item_master_id, iter_tabular_upload(file.file, file.filename), batch_size
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    # Prepare response
+    return {
+        "message": f"Successfully uploaded {stats['successful_uploads']} records",
+        **stats,
+    }
+
+# Background Bulk Upload Jobs
+BULK_UPLOAD_WORKERS = int(os.getenv("BULK_UPLOAD_WORKERS", "2"))
+BULK_UPLOAD_JOB_RETENTION = int(os.getenv("BULK_UPLOAD_JOB_RETENTION", "3600"))  # Seconds finished jobs stay queryable
+
+upload_executor = ThreadPoolExecutor(max_workers=BULK_UPLOAD_WORKERS, thread_name_prefix="bulk-upload")
+
+
+class UploadJobCancelled(Exception):
+    pass
+
+
+class UploadJob:
+    """
+    Progress and outcome of one bulk upload running on upload_executor.
+    Workers call report() between batches; report() is also where a cancellation request takes effect.
+    """
+
+    def __init__(self, kind, filename):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = "queued"
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.rows_failed = 0
+        self.errors = []
+        self.result = None
+        self.detail = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def report(self, parsed=None, inserted=None, failed=None, errors=None):
+        with self._lock:
+            if parsed is not None:
+                self.rows_parsed = parsed
+            if inserted is not None:
+                self.rows_inserted = inserted
+            if failed is not None:
+                self.rows_failed = failed
+            if errors is not None:
+                self.errors = list(errors)
+        if self._cancel.is_set():
+            raise UploadJobCancelled()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def start(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+
+    def finish(self, status, result=None, detail=None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.detail = detail
+            self.finished_at = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "filename": self.filename,
+                "status": self.status,
+                "cancel_requested": self.cancel_requested,
+                "rows_parsed": self.rows_parsed,
+                "rows_inserted": self.rows_inserted,
+                "rows_failed": self.rows_failed,
+                "errors": list(self.errors),
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(self.rows_inserted / elapsed, 1) if elapsed else 0.0,
+                "detail": self.detail,
+                "result": self.result,
+            }
+
+
+upload_jobs = {}
+upload_jobs_lock = threading.Lock()
+
+def run_upload_job(job, path, work):
+    """ Worker body: run `work(connection, fileobj, job)` on a pooled connection and record the outcome. """
+    try:
+        if job.cancel_requested:
+            job.finish("cancelled")
+            return
+        job.start()
+        with open(path, "rb") as fileobj, db_pool.connection() as connection:
+            result = work(connection, fileobj, job)
+        job.report(
+            inserted=result.get("inserted_rows", result.get("successful_uploads")),
+            failed=result.get("failed_uploads"),
+            errors=result.get("errors"),
+        )
+        job.finish("completed", result=result)
+    except UploadJobCancelled:
+        job.finish("cancelled", detail="Cancelled; batches committed before cancellation were kept")
+    except HTTPException as e:
+        job.finish("failed", detail=e.detail)
+    except Exception as e:
+        logging.exception(f"Bulk upload job {job.id} failed")
+        job.finish("failed", detail=str(e))
     finally:
-        if 'connection' in locals():
-            cursor.close()
-            connection.close()
+        os.remove(path)
+
+def submit_upload_job(kind, file, work):
+    """
+    Spool an upload to a temporary file and queue it on upload_executor.
+    Returns immediately with the job id to poll at /bulk-upload-jobs/{job_id}.
+    """
+    suffix = os.path.splitext(file.filename or "")[1]
+    with tempfile.NamedTemporaryFile(prefix="bulk-upload-", suffix=suffix, delete=False) as spool:
+        shutil.copyfileobj(file.file, spool)
+
+    job = UploadJob(kind, file.filename)
+    with upload_jobs_lock:
+        # Forget finished jobs past the retention window
+        cutoff = time.time() - BULK_UPLOAD_JOB_RETENTION
+        for job_id in [key for key, old in upload_jobs.items() if old.finished_at and old.finished_at < cutoff]:
+            del upload_jobs[job_id]
+        upload_jobs[job.id] = job
+    upload_executor.submit(run_upload_job, job, spool.name, work)
+    return {"message": "Upload queued", "job_id": job.id, "status": job.status}
+
+def get_upload_job(job_id):
+    with upload_jobs_lock:
+        job = upload_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
+@app.get("/bulk-upload-jobs", dependencies=[Depends(role_required("Admin","Manager"))])
+def list_upload_jobs():
+    with upload_jobs_lock:
+        jobs = list(upload_jobs.values())
+    return [job.to_dict() for job in sorted(jobs, key=lambda job: job.created_at, reverse=True)]
+
+@app.get("/bulk-upload-jobs/{job_id}", dependencies=[Depends(role_required("Admin","Manager"))])
+def fetch_upload_job(job_id: str):
+    return get_upload_job(job_id).to_dict()
+
+@app.post("/bulk-upload-jobs/{job_id}/cancel", dependencies=[Depends(role_required("Admin","Manager"))])
+def cancel_upload_job(job_id: str):
+    job = get_upload_job(job_id)
+    if job.status in ("completed", "failed", "cancelled"):
+        raise HTTPException(status_code=400, detail=f"Upload job already {job.status}")
+    job.cancel()
+    return {"message": "Cancellation requested", "job_id": job.id}
 
 # ModelSize Pydantic model
 class ModelSize(BaseModel):
@@ -1504,68 +2976,64 @@ class ModelSize(BaseModel):
 
 # Create ModelSize
 @app.post("/create-model-size", dependencies=[Depends(role_required("Admin"))])
-def create_model_size(model: ModelSize):
-    connection = pymysql.connect(**db_config)
+def create_model_size(model: ModelSize, connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         cursor.execute("INSERT INTO model_size (model_name) VALUES (%s)", (model.model_name,))
         connection.commit()
+        invalidate_reference_cache("model_size")
         return {"message": "Model/Size created successfully"}
     except pymysql.Error as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
         cursor.close()
-        connection.close()
 
 # Fetch all ModelSizes
 @app.get("/fetch-model-sizes")
-def fetch_model_sizes():
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-    try:
-        cursor.execute("SELECT id, model_name FROM model_size")
-        models = [{"id": row[0], "model_name": row[1]} for row in cursor.fetchall()]
-        return models
-    finally:
-        cursor.close()
-        connection.close()
+async def fetch_model_sizes(request: Request):
+    async def load(connection):
+        cursor = await connection.cursor()
+        try:
+            await cursor.execute("SELECT id, model_name FROM model_size")
+            models = [{"id": row[0], "model_name": row[1]} for row in await cursor.fetchall()]
+            return models
+        finally:
+            await cursor.close()
+    return await cached_reference_response(request, "model_size", "fetch-model-sizes", load)
 
 # Update ModelSize
 @app.put("/update-model-size/{id}", dependencies=[Depends(role_required("Admin"))])
-def update_model_size(id: int, model: ModelSize):
-    connection = pymysql.connect(**db_config)
+def update_model_size(id: int, model: ModelSize, connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         cursor.execute("UPDATE model_size SET model_name = %s WHERE id = %s", (model.model_name, id))
         connection.commit()
+        invalidate_reference_cache("model_size")
         return {"message": "Model/Size updated successfully"}
     except pymysql.Error as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
         cursor.close()
-        connection.close()
 
 # Delete ModelSize
 @app.delete("/delete-model-size/{id}", dependencies=[Depends(role_required("Admin"))])
-def delete_model_size(id: int):
-    connection = pymysql.connect(**db_config)
+def delete_model_size(id: int, connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         cursor.execute("DELETE FROM model_size WHERE id = %s", (id,))
         connection.commit()
+        invalidate_reference_cache("model_size")
         return {"message": "Model/Size deleted successfully"}
     except pymysql.Error as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
         cursor.close()
-        connection.close()
 
 @app.put("/update-country/{country_id}", dependencies=[Depends(role_required("Admin"))])
-def update_country(country_id: int, country: Country):
-    connection = pymysql.connect(**db_config)
+def update_country(country_id: int, country: Country, connection=Depends(get_db)):
     cursor = connection.cursor()
     
     try:
@@ -1579,23 +3047,24 @@ def update_country(country_id: int, country: Country):
             country.electricity_rate, country.water_rate, country.space_rental_rate, 
             country.exchange_rate, country_id
         ))
+        refresh_machine_rate_results(connection, country_ids=[country_id])
         
         connection.commit()
+        country_rates_cache.clear()
+        invalidate_reference_cache("countries")
         return {"message": "Country updated successfully"}
     except Exception as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 class DeleteCountriesRequest(BaseModel):
     ids: List[int]
 
 @retry_on_db_error()
 @app.delete("/delete-countries", dependencies=[Depends(role_required("Admin"))])
-def delete_countries(request: DeleteCountriesRequest):
-    connection = pymysql.connect(**db_config)
+def delete_countries(request: DeleteCountriesRequest, connection=Depends(get_db)):
     cursor = connection.cursor()
     
     try:
@@ -1610,113 +3079,50 @@ def delete_countries(request: DeleteCountriesRequest):
         """)
         
         connection.commit()
+        country_rates_cache.clear()
+        invalidate_reference_cache("countries")
         return {"message": "Countries deleted successfully"}
     except Exception as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
 
 @app.get("/fetch-cost-aggregates")
-def fetch_cost_aggregates(item_master_id: int):
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
+async def fetch_cost_aggregates(request: Request, item_master_id: int, connection=Depends(get_async_db)):
+    cursor = await connection.cursor()
     try:
         # Verify item master exists
-        cursor.execute("SELECT id FROM item_master WHERE id = %s", (item_master_id,))
-        if not cursor.fetchone():
+        await cursor.execute("SELECT id FROM item_master WHERE id = %s", (item_master_id,))
+        if not await cursor.fetchone():
             raise HTTPException(status_code=400, detail="Invalid Item Master ID")
 
-        # Fetch cost aggregates with process flow data using item_master_id, operation, and machine_type
-        cursor.execute("""
-            SELECT 
-                ca.id, ca.operation, ca.machine_type, ca.machine_rate, ca.labor_rate,
-                ca.input_material_cost, ca.consumables_cost, ca.total_cost,
-                pf.id as process_flow_id, pf.op_no, pf.description, pf.machine_type as pf_machine_type, pf.cycle_time_sec,
-                pf.yield_percentage, pf.operator_count
-            FROM cost_aggregate ca
-            LEFT JOIN process_flow_matrix pf ON ca.item_master_id = pf.item_master_id AND ca.operation = pf.operation AND ca.machine_type = pf.machine_type
-            WHERE ca.item_master_id = %s
-            ORDER BY pf.op_no
-        """, (item_master_id,))
-        
-        records = cursor.fetchall()
-        cost_aggregates = []
-        cumulative_operating_cost = 0
-
-        for row in records:
-            # Convert all numeric fields to float
-            operation = row[1]
-            machine_type = row[2]
-            machine_rate = to_float(row[3])
-            labor_rate = to_float(row[4])
-            input_material_cost = to_float(row[5])
-            consumables_cost = to_float(row[6])
-            total_cost_db = to_float(row[7]) if len(row) > 7 else 0
-            process_flow_id = row[8]
-            op_no = row[9]
-            description = row[10]
-            pf_machine_type = row[11]
-            cycle_time_sec = to_float(row[12])
-            yield_percentage = to_float(row[13])
-            operator_count = to_float(row[14])
-
-            # Calculate costs
-            total_labor_cost = (cycle_time_sec / 3600) * operator_count * labor_rate
-            total_machine_cost = (cycle_time_sec / 3600) * machine_rate
-            total_operating_cost = input_material_cost + consumables_cost + total_labor_cost + total_machine_cost
-            cumulative_operating_cost += total_operating_cost
-            yield_loss_cost = (cumulative_operating_cost / (yield_percentage / 100)) - cumulative_operating_cost if yield_percentage else 0
-            total_cost = cumulative_operating_cost + yield_loss_cost
-
-            cost_aggregates.append({
-                "id": row[0],
-                "operation": operation,
-                "machine_type": machine_type,
-                "process_flow_id": process_flow_id,
-                "op_no": op_no,
-                "description": description,
-                "pf_machine_type": pf_machine_type,
-                "cycle_time_sec": cycle_time_sec,
-                "yield_percentage": yield_percentage,
-                "operator_count": operator_count,
-                "machine_rate": machine_rate,
-                "labor_rate": labor_rate,
-                "input_material_cost": input_material_cost,
-                "consumables_cost": consumables_cost,
-                "total_labor_cost": round(total_labor_cost, 3),
-                "total_machine_cost": round(total_machine_cost, 3),
-                "total_operating_cost": round(total_operating_cost, 3),
-                "cumulative_operating_cost": round(cumulative_operating_cost, 3),
-                "yield_loss_cost": round(yield_loss_cost, 3),
-                "total_cost": round(total_cost, 3),
-                "total_cost_db": round(total_cost_db, 3)
-            })
-        
-        return cost_aggregates
+        # Stored cost chain with process flow data, kept current by every write path: one indexed read
+        await cursor.execute(COST_CHAIN_QUERY, (item_master_id,))
+        records = await cursor.fetchall()
+
+        cost_aggregates = [cost_aggregate_row(row) for row in records]
+        return await table_response_async(request, cost_aggregates)
     finally:
-        cursor.close()
-        connection.close()
+        await cursor.close()
 
 # Fetch Machine Types
 @app.get("/machine-types")
-def get_machine_types():
-    connection = pymysql.connect(**db_config)
-    cursor = connection.cursor()
-    try:
-        cursor.execute("SELECT id, name FROM machine_types")
-        machine_types = [{"id": row[0], "name": row[1]} for row in cursor.fetchall()]
-        return machine_types
-    except pymysql.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        cursor.close()
-        connection.close()
+async def get_machine_types(request: Request):
+    async def load(connection):
+        cursor = await connection.cursor()
+        try:
+            await cursor.execute("SELECT id, name FROM machine_types")
+            machine_types = [{"id": row[0], "name": row[1]} for row in await cursor.fetchall()]
+            return machine_types
+        except pymysql.Error as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        finally:
+            await cursor.close()
+    return await cached_reference_response(request, "machine_types", "machine-types", load)
 
 @app.delete("/delete-machine-type/{id}", dependencies=[Depends(role_required("Admin"))])
-def delete_machine_type(id: int):
-    connection = pymysql.connect(**db_config)
+def delete_machine_type(id: int, connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         # First check if the machine type exists
@@ -1737,6 +3143,7 @@ def delete_machine_type(id: int):
         # If not in use, proceed with deletion
         cursor.execute("DELETE FROM machine_types WHERE id = %s", (id,))
         connection.commit()
+        invalidate_reference_cache("machine_types")
         return {"message": "Machine type deleted successfully"}
     except pymysql.Error as e:
         connection.rollback()
@@ -1749,11 +3156,27 @@ def delete_machine_type(id: int):
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        connection.close()
+
+def final_cost_breakdown(base_total_cost):
+    """ Material handling, overheads and profit markups on the summed cost aggregate totals. """
+    material_handling = round(0.02 * base_total_cost, 2)
+    overheads = round(0.075 * base_total_cost, 2)
+    profit = round(0.075 * base_total_cost, 2)
+    final_total_cost = round(base_total_cost + material_handling + overheads + profit, 2)
+
+    return {
+        "base_total_cost": round(base_total_cost, 2),
+        "material_handling": material_handling,
+        "overheads": overheads,
+        "profit": profit,
+        "final_total_cost": final_total_cost,
+        "material_handling_percentage": 2.0,
+        "overheads_percentage": 7.5,
+        "profit_percentage": 7.5
+    }
 
 @app.get("/cost-aggregate/final-cost/{item_master_id}")
-def calculate_final_cost(item_master_id: int = Path(..., description="ID of the item master")):
-    connection = pymysql.connect(**db_config)
+def calculate_final_cost(item_master_id: int = Path(..., description="ID of the item master"), connection=Depends(get_db)):
     cursor = connection.cursor()
     try:
         # Verify item master exists
@@ -1761,213 +3184,1010 @@ def calculate_final_cost(item_master_id: int = Path(..., description="ID of the
         if not cursor.fetchone():
             raise HTTPException(status_code=400, detail="Invalid Item Master ID")
 
-        # Fetch all cost aggregates for the item_master_id
-        cursor.execute("SELECT total_cost FROM cost_aggregate WHERE item_master_id = %s", (item_master_id,))
-        rows = cursor.fetchall()
-        if not rows:
+        # The last operation's stored chain total is the item's cost (earlier operations are included in it)
+        cursor.execute("""
+            SELECT total_cost FROM cost_aggregate_rollup
+            WHERE item_master_id = %s
+            ORDER BY position DESC
+            LIMIT 1
+        """, (item_master_id,))
+        row = cursor.fetchone()
+        if not row:
             raise HTTPException(status_code=404, detail="No cost aggregates found for this Item Master ID")
 
-        base_total_cost = sum([float(row[0]) for row in rows])
-        material_handling = round(0.02 * base_total_cost, 2)
-        overheads = round(0.075 * base_total_cost, 2)
-        profit = round(0.075 * base_total_cost, 2)
-        final_total_cost = round(base_total_cost + material_handling + overheads + profit, 2)
+        return final_cost_breakdown(to_float(row[0]))
+    finally:
+        cursor.close()
+
+@app.get("/item-cost-rollup/{item_master_id}")
+async def get_item_cost_rollup(
+    item_master_id: int = Path(..., description="ID of the item master"),
+    country: str = Query(..., description="Country whose rates price the machine rates"),
+    connection=Depends(get_async_db),
+):
+    """
+    Everything needed to cost one part in one call: the responses of /fetch-process-flows,
+    /machine-rate-data, /fetch-cost-aggregates and /cost-aggregate/final-cost, read with four
+    queries on one connection.
+    """
+    cursor = await connection.cursor()
+    try:
+        # Verifies the item master and resolves the country in one query
+        await cursor.execute("""
+            SELECT im.id, c.id, c.currency_symbol
+            FROM item_master im
+            LEFT JOIN countries c ON c.name = %s
+            WHERE im.id = %s
+            LIMIT 1
+        """, (country, item_master_id))
+        found = await cursor.fetchone()
+        if not found:
+            raise HTTPException(status_code=400, detail="Invalid Item Master ID")
+        _, country_id, currency_symbol = found
+        if country_id is None:
+            raise HTTPException(status_code=400, detail="Invalid country name")
+
+        await cursor.execute(PROCESS_FLOW_QUERY, (item_master_id,))
+        process_flows = [process_flow_row(row) for row in await cursor.fetchall()]
+
+        await cursor.execute(MACHINE_RATE_DATA_QUERY, (country, item_master_id))
+        machine_rates = await cursor.fetchall()
+
+        await cursor.execute(COST_CHAIN_QUERY, (item_master_id,))
+        cost_chain = await cursor.fetchall()
 
         return {
-            "base_total_cost": round(base_total_cost, 2),
-            "material_handling": material_handling,
-            "overheads": overheads,
-            "profit": profit,
-            "final_total_cost": final_total_cost,
-            "material_handling_percentage": 2.0,
-            "overheads_percentage": 7.5,
-            "profit_percentage": 7.5
+            "item_master_id": item_master_id,
+            "country": country,
+            "process_flows": process_flows,
+            "machine_rates": [machine_rate_data_row(row, currency_symbol) for row in machine_rates],
+            "cost_aggregates": [cost_aggregate_row(row) for row in cost_chain],
+            # None where /cost-aggregate/final-cost answers 404 (no cost aggregates yet)
+            "final_cost": final_cost_breakdown(to_float(cost_chain[-1][-1])) if cost_chain else None,  # Last rollup total_cost
         }
     finally:
-        cursor.close()
-        connection.close()
+        await cursor.close()
+
+# Item x country costing matrix
+COSTING_MATRIX_MAX_ITEMS = 500
+COSTING_MATRIX_MAX_COUNTRIES = 100
+COSTING_MATRIX_WORKERS = int(os.getenv("COSTING_MATRIX_WORKERS", str(os.cpu_count() or 1)))
+
+# Worker processes for parallel matrices; spawned (not forked from the threaded server) on first use
+costing_process_pool = None
+costing_process_pool_lock = threading.Lock()
+
+# Cost aggregates of several item masters with their process flow inputs, each item's operations in chain order
+COSTING_OPERATIONS_QUERY = f"""
+    SELECT ca.item_master_id, ca.machine_type, ca.input_material_cost, ca.consumables_cost,
+           pf.cycle_time_sec, pf.yield_percentage, pf.operator_count, pf.id
+    FROM cost_aggregate ca
+    {COST_AGGREGATE_FLOW_JOIN}
+    WHERE ca.item_master_id IN ({{placeholders}})
+    ORDER BY ca.item_master_id, pf.op_no, ca.id
+"""
+
+COSTING_OPERATION_COLUMNS = (
+    "input_material_cost", "consumables_cost", "cycle_time_sec", "yield_percentage", "operator_count",
+)
+
+def load_costing_inputs(cursor, item_master_ids):
+    """
+    Load the machine rates and cost aggregates of `item_master_ids` with two queries and lay them out as
+    arrays for costing_matrix_block. Each operation is priced by the first machine rate row of its item
+    with the same machine type; rate_index is -1 where there is none.
+    """
+    import numpy as np
+
+    placeholders = ", ".join(["%s"] * len(item_master_ids))
+    cursor.execute(f"""
+        SELECT id, item_master_id, machine_type_id, {", ".join(MACHINE_RATE_INPUT_COLUMNS)}
+        FROM machine_rate_calculation
+        WHERE item_master_id IN ({placeholders})
+        ORDER BY id
+    """, tuple(item_master_ids))
+    machine_rates = cursor.fetchall()
+    cursor.execute(COSTING_OPERATIONS_QUERY.format(placeholders=placeholders), tuple(item_master_ids))
+    operations = cursor.fetchall()
+
+    rate_index = {}
+    for index, row in enumerate(machine_rates):
+        rate_index.setdefault((row[1], row[2]), index)
+
+    items, starts = [], []
+    for index, row in enumerate(operations):
+        if not items or items[-1] != row[0]:
+            items.append(row[0])
+            starts.append(index)
+
+    return {
+        "machine_rates": machine_rate_input_columns(machine_rates, offset=3),
+        "items": items,
+        "starts": np.array(starts, dtype=int),
+        "machine_rate_ids": [row[0] for row in machine_rates],
+        "process_flow_ids": [row[7] for row in operations],
+        "rate_index": np.array([rate_index.get((row[0], row[1]), -1) for row in operations], dtype=int),
+        **{
+            name: np.array([to_float(row[column]) for row in operations], dtype=float)
+            for column, name in enumerate(COSTING_OPERATION_COLUMNS, start=2)
+        },
+    }
+
+def costing_request_scope(item_master_ids, country_names):
+    """ De-duplicated item master IDs and country names of a costing request, within the matrix limits. """
+    item_master_ids = list(dict.fromkeys(item_master_ids))
+    country_names = list(dict.fromkeys(country_names))
+    if not item_master_ids or not country_names:
+        raise HTTPException(status_code=400, detail="Provide at least one item master ID and one country")
+    if len(item_master_ids) > COSTING_MATRIX_MAX_ITEMS or len(country_names) > COSTING_MATRIX_MAX_COUNTRIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {COSTING_MATRIX_MAX_ITEMS} item masters and {COSTING_MATRIX_MAX_COUNTRIES} countries per matrix",
+        )
+    return item_master_ids, country_names
+
+def load_costing_scope(cursor, item_master_ids, country_names):
+    """ Part number per item master ID and (name, rates) per country name; 400 on unknown IDs or names. """
+    cursor.execute(
+        f"SELECT id, part_number FROM item_master WHERE id IN ({', '.join(['%s'] * len(item_master_ids))})",
+        tuple(item_master_ids),
+    )
+    part_numbers = dict(cursor.fetchall())
+    unknown = [item_id for item_id in item_master_ids if item_id not in part_numbers]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid Item Master IDs: {unknown}")
+
+    cursor.execute(f"""
+        SELECT name, labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, currency_symbol
+        FROM countries WHERE name IN ({', '.join(['%s'] * len(country_names))})
+    """, tuple(country_names))
+    rates = {row[0]: row[1:] for row in cursor.fetchall()}
+    unknown = [name for name in country_names if name not in rates]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid country names: {unknown}")
+    return part_numbers, [(name, rates[name]) for name in country_names]
+
+def costing_matrix_block(inputs, countries):
+    """
+    Chain and summed cost totals of every item in `inputs` for each of `countries` ((name, rates) pairs in
+    get_country_rates order), as two arrays of shape (len(countries), len(inputs["items"])).
+
+    The chain total is the last operation's total_cost in the cumulative yield chain (cost_chain_step);
+    the summed total adds up per-operation totals the way calculate_costs does. Labor is priced at each
+    country's rate and machines at the engine's rate in the country's currency. Operations without a
+    machine rate row (rate_index -1) have no rate in that currency, so their items come out NaN.
+    Any input array may instead have one row per country (what-if scenarios); all
+    countries are evaluated in one broadcast pass. Pure NumPy on picklable inputs, so blocks can run
+    in worker processes.
+    """
+    import numpy as np
+
+    starts = inputs["starts"]
+    if not len(starts):
+        empty = np.zeros((len(countries), 0))
+        return empty, empty
+
+    shape = (len(countries), len(inputs["rate_index"]))
+    rates = [np.array([[to_float(country_rates[index])] for _, country_rates in countries]) for index in range(5)]
+    has_rate = inputs["rate_index"] >= 0
+    machine_rates = np.full(shape, np.nan)
+    if has_rate.any():
+        names = [name for name, _ in countries]
+        hourly = calculate_machine_rate_columns(inputs["machine_rates"], names, (*rates, None))["total_dollar_hr"]
+        machine_rates[:, has_rate] = hourly[:, inputs["rate_index"][has_rate]]
+    labor_rates = rates[0]
+
+    hours = inputs["cycle_time_sec"] / 3600
+    operating = np.broadcast_to(
+        inputs["input_material_cost"] + inputs["consumables_cost"]
+        + hours * (inputs["operator_count"] * labor_rates + machine_rates),
+        shape,
+    )
+    yield_fraction = inputs["yield_percentage"] / 100
+    has_yield = yield_fraction != 0
+    per_operation = np.where(has_yield, operating / np.where(has_yield, yield_fraction, 1), operating)
+
+    cumulative = np.add.reduceat(operating, starts, axis=1)
+    last_yield = yield_fraction[..., np.append(starts[1:], shape[1]) - 1]
+    chain = np.where(last_yield != 0, cumulative / np.where(last_yield != 0, last_yield, 1), cumulative)
+    return chain, np.add.reduceat(per_operation, starts, axis=1)
+
+def get_costing_process_pool():
+    global costing_process_pool
+    with costing_process_pool_lock:
+        if costing_process_pool is None:
+            costing_process_pool = ProcessPoolExecutor(
+                max_workers=COSTING_MATRIX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return costing_process_pool
+
+def run_costing_matrix(inputs, countries, parallel=False):
+    """
+    costing_matrix_block over all countries, split by country across the process pool when `parallel`
+    (one-row-per-country scenario inputs are always evaluated in-process).
+    """
+    import numpy as np
+
+    workers = min(COSTING_MATRIX_WORKERS, len(countries))
+    if not parallel or workers < 2:
+        return costing_matrix_block(inputs, countries)
+
+    size = -(-len(countries) // workers)
+    blocks = [countries[start:start + size] for start in range(0, len(countries), size)]
+    results = list(get_costing_process_pool().map(costing_matrix_block, [inputs] * len(blocks), blocks))
+    return tuple(np.concatenate([result[part] for result in results]) for part in (0, 1))
+
+class CostingMatrixRequest(BaseModel):
+    item_master_ids: List[int]
+    countries: List[str]
+    parallel: bool = False  # Split the countries across worker processes (large matrices)
+
+# Any signed-in role; "parallel": true starts worker processes, so the endpoint is never anonymous
+@app.post("/costing-matrix", dependencies=[Depends(role_required("Admin", "Manager", "Viewer"))])
+def costing_matrix(request: CostingMatrixRequest, connection=Depends(get_db)):
+    """
+    Cost of every requested item master in every requested country, from four queries and one vectorized
+    pass. Each cell carries the cost chain total and the final cost after the /cost-aggregate/final-cost
+    markups, applied to the chain total as final-cost does. The totals are re-priced per country (labor at
+    the country's labor_rate, machines at the engine's local-currency rate), so they differ from final-cost,
+    which marks up the stored chain total. Costs are null for items without cost aggregates or with operations that
+    have no machine rate row for their machine type; `skipped_reason` says why.
+    """
+    item_master_ids, country_names = costing_request_scope(request.item_master_ids, request.countries)
 
-@app.on_event("startup")
-async def startup_event():
-    """Create database tables on startup if they don't exist"""
-    connection = pymysql.connect(**db_config)
     cursor = connection.cursor()
-    
     try:
-        # Create users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                email VARCHAR(100),
-                role VARCHAR(20) DEFAULT 'User'
-            )
-        """)
-        
-        # Create machine_types table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS machine_types (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                machine_type VARCHAR(100) NOT NULL
-            )
-        """)
-        
-        # Create makes table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS makes (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                make VARCHAR(100) NOT NULL
-            )
-        """)
-        
-        # Create model_sizes table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS model_size (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                model_name VARCHAR(100) NOT NULL
-            )
-        """)
-        
-        # Create countries table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS countries (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                currency_symbol VARCHAR(10),
-                labor_rate DECIMAL(10,2),
-                electricity_rate DECIMAL(10,2),
-                water_rate DECIMAL(10,2),
-                space_rental_rate DECIMAL(10,2),
-                exchange_rate DECIMAL(10,4)
-            )
-        """)
-        
-        # Create item_master table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS item_master (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                part_number VARCHAR(100) UNIQUE NOT NULL,
-                description TEXT,
-                category VARCHAR(100),
-                model VARCHAR(100),
-                uom VARCHAR(20),
-                material VARCHAR(100),
-                weight DECIMAL(10,2),
-                dimensions VARCHAR(100),
-                color VARCHAR(50),
-                supplier VARCHAR(100),
-                cost_per_unit DECIMAL(10,2),
-                min_order_qty INT,
-                annual_volume INT,
-                lifetime_volume INT,
-                compliance_standards TEXT,
-                lifecycle_stage VARCHAR(50),
-                drawing_number VARCHAR(100),
-                revision_number INT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                is_deleted BOOLEAN DEFAULT FALSE
-            )
-        """)
-        
-        # Create machine_rate_calculations table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS machine_rate_calculation (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                item_master_id INT,
-                machine_type_id INT,
-                make_id INT,
-                model_size VARCHAR(100),
-                purchase_price DECIMAL(15,2),
-                res_value DECIMAL(15,2),
-                useful_life DECIMAL(10,2),
-                utilization DECIMAL(5,2),
-                maintenance DECIMAL(5,2),
-                power_kw_hr DECIMAL(10,2),
-                power_spec DECIMAL(10,2),
-                area_m2 DECIMAL(10,2),
-                water_m3_hr DECIMAL(10,2),
-                consumables DECIMAL(10,2),
-                country VARCHAR(50),
-                depreciation DECIMAL(15,2),
-                maintenance_1 DECIMAL(15,2),
-                space DECIMAL(15,2),
-                power DECIMAL(15,2),
-                water DECIMAL(15,2),
-                total_dollar_hr DECIMAL(15,2),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (item_master_id) REFERENCES item_master(id),
-                FOREIGN KEY (machine_type_id) REFERENCES machine_types(id),
-                FOREIGN KEY (make_id) REFERENCES makes(id)
-            )
-        """)
-        
-        # Create process_flow_matrix table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS process_flow_matrix (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                item_master_id INT,
-                op_no INT,
-                operation VARCHAR(100),
-                description TEXT,
-                machine_type INT,
-                cycle_time_sec INT,
-                yield_percentage DECIMAL(5,2),
-                operator_count DECIMAL(5,2),
-                FOREIGN KEY (item_master_id) REFERENCES item_master(id),
-                FOREIGN KEY (machine_type) REFERENCES machine_types(id)
-            )
-        """)
-        
-        # Create cost_aggregate table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cost_aggregate (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                item_master_id INT,
-                operation VARCHAR(100),
-                machine_type INT,
-                machine_rate DECIMAL(15,2),
-                labor_rate DECIMAL(15,2),
-                input_material_cost DECIMAL(15,2),
-                consumables_cost DECIMAL(15,2),
-                total_cost DECIMAL(15,2),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (item_master_id) REFERENCES item_master(id),
-                FOREIGN KEY (machine_type) REFERENCES machine_types(id)
-            )
-        """)
-        
-        # Create edit_requests table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS edit_requests (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                table_name VARCHAR(50),
-                record_id INT,
-                field_name VARCHAR(50),
-                old_value TEXT,
-                new_value TEXT,
-                requested_by VARCHAR(50),
-                status VARCHAR(20) DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        part_numbers, countries = load_costing_scope(cursor, item_master_ids, country_names)
+        inputs = load_costing_inputs(cursor, item_master_ids)
+    finally:
+        cursor.close()
+
+    chain, summed = run_costing_matrix(inputs, countries, parallel=request.parallel)
+    cells = costing_cells(inputs, item_master_ids, part_numbers, countries, chain, summed)
+    return {"item_master_ids": item_master_ids, "countries": country_names, "cells": cells}
+
+def costing_cells(inputs, item_master_ids, part_numbers, countries, chain, summed):
+    """ Response cells, country-major, from costing_matrix_block results with one row per country. """
+    import numpy as np
+
+    column = {item_id: index for index, item_id in enumerate(inputs["items"])}
+    counts = np.diff(np.append(inputs["starts"], len(inputs["rate_index"])))
+    missing = np.add.reduceat((inputs["rate_index"] < 0).astype(int), inputs["starts"]) if len(column) else []
+
+    cells = []
+    for row, (name, country_rates) in enumerate(countries):
+        for item_id in item_master_ids:
+            index = column.get(item_id)
+            cell = {
+                "item_master_id": item_id,
+                "part_number": part_numbers[item_id],
+                "country": name,
+                "currency_symbol": country_rates[5],
+                "operations": 0 if index is None else int(counts[index]),
+                "missing_machine_rates": 0 if index is None else int(missing[index]),
+                "chain_total_cost": None,
+                "base_total_cost": None,
+                "final_total_cost": None,
+                "skipped_reason": None,
+            }
+            if index is None:
+                cell["skipped_reason"] = "No cost aggregates"
+            elif missing[index]:
+                # The stored cost aggregate machine_rate has no known currency, so it cannot be mixed in
+                cell["skipped_reason"] = f"{int(missing[index])} operation(s) have no machine rate for their machine type"
+            else:
+                breakdown = final_cost_breakdown(float(chain[row, index]))
+                cell.update(
+                    chain_total_cost=round(float(chain[row, index]), 2),
+                    base_total_cost=breakdown["base_total_cost"],
+                    final_total_cost=breakdown["final_total_cost"],
+                )
+            cells.append(cell)
+    return cells
+
+# What-if scenarios: the costing matrix re-run on in-memory overrides; nothing is written
+WHAT_IF_MAX_SCENARIOS = 1000
+WHAT_IF_MAX_VALUES = 5_000_000  # Scenario rows x (machine rates + operations), bounds the batch's memory
+
+WHAT_IF_FIELDS = {
+    "country": ("labor_rate", "electricity_rate", "water_rate", "space_rental_rate", "exchange_rate"),
+    "machine_rate": MACHINE_RATE_INPUT_COLUMNS,
+    "process_flow": ("cycle_time_sec", "yield_percentage", "operator_count"),
+}
+
+class WhatIfParameter(BaseModel):
+    target: str  # "country", "machine_rate" or "process_flow"
+    key: Union[int, str]  # Country name, or machine rate / process flow ID
+    field: str
+    values: List[float]  # One value overrides the parameter; several values sweep it
+    relative: bool = False  # Values multiply the current value (1.1 = +10%) instead of replacing it
+
+class WhatIfRequest(BaseModel):
+    item_master_ids: List[int]
+    countries: List[str]
+    parameters: List[WhatIfParameter] = []
+
+def what_if_inputs(inputs, countries, parameters):
+    """
+    Expand the Cartesian product of the parameters' values into one costing_matrix_block batch.
+    Rows are scenario-major: row s * len(countries) + c prices country c under scenario s. Only the
+    overridden inputs get a row per scenario; the rest broadcast. Returns (inputs, countries, scenarios).
+    """
+    import itertools
+    import math
+    import numpy as np
+
+    for parameter in parameters:
+        if parameter.field not in WHAT_IF_FIELDS.get(parameter.target, ()):
+            raise HTTPException(status_code=400, detail=f"Invalid what-if parameter: {parameter.target}.{parameter.field}")
+        if not parameter.values:
+            raise HTTPException(status_code=400, detail=f"No values for what-if parameter: {parameter.target}.{parameter.field}")
+
+    # Size the product before expanding it: a few KB of values can describe billions of scenarios
+    scenario_count = math.prod(len(parameter.values) for parameter in parameters)
+    rows = scenario_count * len(countries)
+    if scenario_count > WHAT_IF_MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {WHAT_IF_MAX_SCENARIOS} scenarios per request")
+    if rows * (len(inputs["machine_rate_ids"]) + len(inputs["rate_index"])) > WHAT_IF_MAX_VALUES:
+        raise HTTPException(status_code=400, detail="Too many scenarios for the selected item masters and countries")
+
+    scenarios = list(itertools.product(*(parameter.values for parameter in parameters)))
+
+    values = np.repeat(np.array(scenarios, dtype=float).reshape(len(scenarios), len(parameters)), len(countries), axis=0)
+    rates = np.tile([[to_float(country_rates[index]) for index in range(5)] for _, country_rates in countries], (len(scenarios), 1))
+    country_of_row = np.tile(np.arange(len(countries)), len(scenarios))
+    country_index = {name: index for index, (name, _) in enumerate(countries)}
+
+    inputs = {**inputs, "machine_rates": dict(inputs["machine_rates"])}
+
+    def apply(current, parameter, new_values):
+        return current * new_values if parameter.relative else new_values
+
+    def per_row(array):
+        return array if array.ndim == 2 else np.broadcast_to(array, (rows, len(array))).copy()
+
+    for position, parameter in enumerate(parameters):
+        if parameter.target == "country":
+            if parameter.key not in country_index:
+                raise HTTPException(status_code=400, detail=f"Country {parameter.key} is not in the requested countries")
+            selected = country_of_row == country_index[parameter.key]
+            field = WHAT_IF_FIELDS["country"].index(parameter.field)
+            rates[selected, field] = apply(rates[selected, field], parameter, values[selected, position])
+            continue
+
+        ids = inputs["machine_rate_ids"] if parameter.target == "machine_rate" else inputs["process_flow_ids"]
+        columns = [index for index, value in enumerate(ids) if str(value) == str(parameter.key)]
+        if not columns:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{parameter.target.replace('_', ' ').capitalize()} {parameter.key} is not used by the requested item masters",
             )
-        """)
-        
-        # Create test user for CI/CD
-        cursor.execute("SELECT id FROM users WHERE username = %s", ("Lakshk",))
-        if not cursor.fetchone():
-            # Create test user with hashed password
-            hashed_password = pwd_context.hash("Lakshk@257")
-            cursor.execute("INSERT INTO users (username, password_hash, email, role) VALUES (%s, %s, %s, %s)", 
-                         ("Lakshk", hashed_password, "test@example.com", "Admin"))
-            print("Test user 'Lakshk' created successfully!")
-        
-        connection.commit()
-        print("Database tables created successfully!")
-        
-    except Exception as e:
-        print(f"Error creating tables: {e}")
-        connection.rollback()
+        arrays = inputs["machine_rates"] if parameter.target == "machine_rate" else inputs
+        array = per_row(arrays[parameter.field])
+        array[:, columns] = apply(array[:, columns], parameter, values[:, position:position + 1])
+        arrays[parameter.field] = array
+
+    columns = [
+        (countries[country][0], (*rates[row], countries[country][1][5]))
+        for row, country in enumerate(country_of_row)
+    ]
+    return inputs, columns, scenarios
+
+# Any signed-in role: a sweep can price up to WHAT_IF_MAX_SCENARIOS scenarios in one request
+@app.post("/what-if", dependencies=[Depends(role_required("Admin", "Manager", "Viewer"))])
+def what_if(request: WhatIfRequest, connection=Depends(get_db)):
+    """
+    Cost sensitivity without touching stored data: the /costing-matrix cells for the stored values
+    (baseline), then for every combination of the parameter values. Country rates, machine rate
+    inputs and process flow cycle time, yield and operator count can be overridden or swept; the
+    machine-rate and cost pipelines of all scenarios are evaluated as one vectorized batch.
+    """
+    item_master_ids, country_names = costing_request_scope(request.item_master_ids, request.countries)
+
+    cursor = connection.cursor()
+    try:
+        part_numbers, countries = load_costing_scope(cursor, item_master_ids, country_names)
+        inputs = load_costing_inputs(cursor, item_master_ids)
     finally:
         cursor.close()
-        connection.close()
+
+    scenario_inputs, columns, scenarios = what_if_inputs(inputs, countries, request.parameters)
+    baseline = costing_cells(inputs, item_master_ids, part_numbers, countries, *costing_matrix_block(inputs, countries))
+    chain, summed = costing_matrix_block(scenario_inputs, columns)
+
+    results = []
+    for index, scenario in enumerate(scenarios):
+        rows = slice(index * len(countries), (index + 1) * len(countries))
+        results.append({
+            "values": list(scenario),
+            "cells": costing_cells(
+                inputs, item_master_ids, part_numbers, columns[rows], chain[rows], summed[rows]
+            ),
+        })
+
+    return {
+        "item_master_ids": item_master_ids,
+        "countries": country_names,
+        "parameters": [f"{parameter.target}:{parameter.key}:{parameter.field}" for parameter in request.parameters],
+        "baseline": baseline,
+        "scenarios": results,
+    }
+
+# Streaming exports: rows flow from an unbuffered server-side cursor straight into the response body
+EXPORT_FETCH_SIZE = 1000
+XLSX_MAX_ROWS = 1_048_576  # Rows per worksheet (Excel's limit), header included
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def stream_query(query, params=()):
+    """ Yield batches of up to EXPORT_FETCH_SIZE rows of an unbuffered (SSCursor) query on its own pooled connection. """
+    connection = db_pool.acquire()
+    finished = False
+    try:
+        cursor = connection.cursor(MeteredSSCursor)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+        finished = True
+    finally:
+        # A client that disconnects leaves the result half read; draining it could take minutes, so drop the connection
+        db_pool.release(connection, discard=not finished)
+
+def csv_chunks(header, batches):
+    """ Encode batches of rows as CSV, one chunk per batch (UTF-8 with BOM, as the uploads read it). """
+    buffer = io.StringIO()
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def xlsx_chunks(header, batches, title):
+    """
+    Write batches of rows into a write-only openpyxl workbook, which keeps rows in temporary files
+    rather than memory, then stream the saved file. Rows beyond a worksheet's limit continue on a new sheet.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    sheet_rows = 1
+    for rows in batches:
+        for row in rows:
+            if sheet_rows == XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"{title} {len(workbook.worksheets) + 1}")
+                sheet.append(header)
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(1 << 16)
+            if not chunk:
+                break
+            yield chunk
+
+def export_response(export_format, filename, header, batches):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format {export_format}; use csv or xlsx")
+    if export_format == "csv":
+        chunks = csv_chunks(header, batches)
+    else:
+        chunks = xlsx_chunks(header, batches, title=filename.replace("-", " ").title()[:31])
+    # Header values are latin-1: an ASCII fallback name, and the exact name as RFC 5987 filename*
+    ascii_filename = re.sub(r"[^A-Za-z0-9_-]+", "-", filename).strip("-") or "export"
+    disposition = (
+        f'attachment; filename="{ascii_filename}.{export_format}"; '
+        f"filename*=UTF-8''{quote(f'{filename}.{export_format}')}"
+    )
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[export_format], headers={"Content-Disposition": disposition})
+
+@app.get("/export/item-masters")
+def export_item_masters(export_format: str = Query("csv", alias="format")):
+    """ Every active item master as CSV or XLSX, streamed in id order. """
+    query = f"SELECT {', '.join(ITEM_MASTER_FIELDS)} FROM item_master WHERE is_deleted = 0 ORDER BY id"
+    return export_response(export_format, "item-masters", ITEM_MASTER_FIELDS, stream_query(query))
+
+MACHINE_RATE_EXPORT_HEADER = (
+    "ID", "Item Master ID", "Part Number", *MACHINE_RATE_UPLOAD_COLUMNS, "Purchase (Local)",
+    "Depreciation", "Maintenance Cost", "Space", "Power", "Water", "Total $/hr", "Currency",
+)
+
+@app.get("/export/machine-rates")
+def export_machine_rates(
+    country: str,
+    item_master_id: Optional[int] = None,
+    export_format: str = Query("csv", alias="format"),
+    connection=Depends(get_db),
+):
+    """
+    Machine rates with the derived costs stored for one country in machine_rate_results (the values
+    /machine-rate-data serves), for one item master or all, as CSV or XLSX.
+    """
+    get_country_rates(country, connection)  # 400 on an unknown country
+
+    query = f"""
+        SELECT mrc.id, mrc.item_master_id, im.part_number, mt.machine_type, m.make, mrc.model_size,
+               {", ".join(f"mrc.{name}" for name in MACHINE_RATE_INPUT_COLUMNS)},
+               r.purchase_price_local, {", ".join(f"r.{name}" for name in MACHINE_RATE_DERIVED_COLUMNS)},
+               c.currency_symbol
+        FROM machine_rate_calculation mrc
+        JOIN item_master im ON im.id = mrc.item_master_id
+        LEFT JOIN machine_types mt ON mrc.machine_type_id = mt.id
+        LEFT JOIN makes m ON mrc.make_id = m.id
+        JOIN countries c ON c.name = %s
+        LEFT JOIN machine_rate_results r ON r.machine_rate_id = mrc.id AND r.country_id = c.id
+        {"WHERE mrc.item_master_id = %s" if item_master_id is not None else ""}
+        ORDER BY mrc.id
+    """
+    params = (country, item_master_id) if item_master_id is not None else (country,)
+    return export_response(export_format, f"machine-rates-{country.lower()}", MACHINE_RATE_EXPORT_HEADER, stream_query(query, params))
+
+COST_AGGREGATE_EXPORT_HEADER = (
+    "Item Master ID", "Part Number", "Op No", "Operation", "Description", "Machine Type",
+    "Cycle Time (sec)", "Yield %", "Operator Count", "Machine Rate", "Labor Rate",
+    "Input Material Cost", "Consumables Cost", "Total Labor Cost", "Total Machine Cost",
+    "Total Operating Cost", "Cumulative Operating Cost", "Yield Loss Cost", "Total Cost",
+)
+
+def cost_aggregate_export_rows(batches):
+    """ Compute each item master's cumulative cost chain while streaming; rows arrive grouped by item in chain order. """
+    item_master_id, cumulative_operating_cost = None, 0.0
+    for rows in batches:
+        out = []
+        for row in rows:
+            if row[15] != item_master_id:
+                item_master_id, cumulative_operating_cost = row[15], 0.0
+            step = cost_chain_step(row, cumulative_operating_cost)
+            cumulative_operating_cost = step["cumulative_operating_cost"]
+            out.append((
+                row[15], row[16], row[9], row[1], row[10], row[17],
+                row[12], row[13], row[14], row[3], row[4], row[5], row[6],
+                *(round(step[name], 3) for name in COST_ROLLUP_COLUMNS),
+            ))
+        yield out
+
+@app.get("/export/cost-aggregates")
+def export_cost_aggregates(item_master_id: Optional[int] = None, export_format: str = Query("csv", alias="format")):
+    """ Cost aggregates with their cumulative cost chain, for one item master or all, as CSV or XLSX. """
+    # First 15 columns match COST_CHAIN_QUERY so cost_chain_step can read the rows
+    query = f"""
+        SELECT ca.id, ca.operation, ca.machine_type, ca.machine_rate, ca.labor_rate,
+               ca.input_material_cost, ca.consumables_cost, ca.total_cost,
+               pf.id, pf.op_no, pf.description, pf.machine_type, pf.cycle_time_sec,
+               pf.yield_percentage, pf.operator_count,
+               ca.item_master_id, im.part_number, mt.machine_type
+        FROM cost_aggregate ca
+        JOIN item_master im ON im.id = ca.item_master_id
+        {COST_AGGREGATE_FLOW_JOIN}
+        LEFT JOIN machine_types mt ON ca.machine_type = mt.id
+        {"WHERE ca.item_master_id = %s" if item_master_id is not None else ""}
+        ORDER BY ca.item_master_id, pf.op_no, ca.id
+    """
+    params = (item_master_id,) if item_master_id is not None else ()
+    batches = cost_aggregate_export_rows(stream_query(query, params))
+    return export_response(export_format, "cost-aggregates", COST_AGGREGATE_EXPORT_HEADER, batches)
+
+def ensure_index(cursor, table, name, columns, kind="INDEX"):
+    """ Create an index unless it already exists (MySQL has no CREATE INDEX IF NOT EXISTS). """
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, name))
+    if not cursor.fetchone():
+        cursor.execute(f"CREATE {kind} {name} ON {table} ({columns})")
+
+# Schema migrations
+# Each migration is (version, description, apply(cursor)). MySQL commits DDL implicitly, so every
+# step is written to be re-runnable (IF NOT EXISTS / ensure_index) and an interrupted migration is
+# simply applied again on the next boot. Append new migrations; never edit an applied one.
+SCHEMA_MIGRATIONS_LOCK = "buc_schema_migrations"
+SCHEMA_MIGRATIONS_LOCK_TIMEOUT = 60  # Seconds to wait while another worker migrates
+
+def migrate_base_tables(cursor):
+    # Create users table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            email VARCHAR(100),
+            role VARCHAR(20) DEFAULT 'User'
+        )
+    """)
+
+    # Create machine_types table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS machine_types (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            machine_type VARCHAR(100) NOT NULL
+        )
+    """)
+
+    # Create makes table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS makes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            make VARCHAR(100) NOT NULL
+        )
+    """)
+
+    # Create model_sizes table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS model_size (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            model_name VARCHAR(100) NOT NULL
+        )
+    """)
+
+    # Create countries table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS countries (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            currency_symbol VARCHAR(10),
+            labor_rate DECIMAL(10,2),
+            electricity_rate DECIMAL(10,2),
+            water_rate DECIMAL(10,2),
+            space_rental_rate DECIMAL(10,2),
+            exchange_rate DECIMAL(10,4)
+        )
+    """)
+
+    # Create item_master table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS item_master (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            part_number VARCHAR(100) UNIQUE NOT NULL,
+            description TEXT,
+            category VARCHAR(100),
+            model VARCHAR(100),
+            uom VARCHAR(20),
+            material VARCHAR(100),
+            weight DECIMAL(10,2),
+            dimensions VARCHAR(100),
+            color VARCHAR(50),
+            supplier VARCHAR(100),
+            cost_per_unit DECIMAL(10,2),
+            min_order_qty INT,
+            annual_volume INT,
+            lifetime_volume INT,
+            compliance_standards TEXT,
+            lifecycle_stage VARCHAR(50),
+            drawing_number VARCHAR(100),
+            revision_number INT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            is_deleted BOOLEAN DEFAULT FALSE
+        )
+    """)
+
+    # Create machine_rate_calculations table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS machine_rate_calculation (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            item_master_id INT,
+            machine_type_id INT,
+            make_id INT,
+            model_size VARCHAR(100),
+            purchase_price DECIMAL(15,2),
+            res_value DECIMAL(15,2),
+            useful_life DECIMAL(10,2),
+            utilization DECIMAL(5,2),
+            maintenance DECIMAL(5,2),
+            power_kw_hr DECIMAL(10,2),
+            power_spec DECIMAL(10,2),
+            area_m2 DECIMAL(10,2),
+            water_m3_hr DECIMAL(10,2),
+            consumables DECIMAL(10,2),
+            country VARCHAR(50),
+            depreciation DECIMAL(15,2),
+            maintenance_1 DECIMAL(15,2),
+            space DECIMAL(15,2),
+            power DECIMAL(15,2),
+            water DECIMAL(15,2),
+            total_dollar_hr DECIMAL(15,2),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (item_master_id) REFERENCES item_master(id),
+            FOREIGN KEY (machine_type_id) REFERENCES machine_types(id),
+            FOREIGN KEY (make_id) REFERENCES makes(id)
+        )
+    """)
+
+    # Create process_flow_matrix table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS process_flow_matrix (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            item_master_id INT,
+            op_no INT,
+            operation VARCHAR(100),
+            description TEXT,
+            machine_type INT,
+            cycle_time_sec INT,
+            yield_percentage DECIMAL(5,2),
+            operator_count DECIMAL(5,2),
+            FOREIGN KEY (item_master_id) REFERENCES item_master(id),
+            FOREIGN KEY (machine_type) REFERENCES machine_types(id)
+        )
+    """)
+
+    # Create cost_aggregate table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cost_aggregate (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            item_master_id INT,
+            operation VARCHAR(100),
+            machine_type INT,
+            machine_rate DECIMAL(15,2),
+            labor_rate DECIMAL(15,2),
+            input_material_cost DECIMAL(15,2),
+            consumables_cost DECIMAL(15,2),
+            total_cost DECIMAL(15,2),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (item_master_id) REFERENCES item_master(id),
+            FOREIGN KEY (machine_type) REFERENCES machine_types(id)
+        )
+    """)
+
+    # Create machine_rate_results table (derived machine rates per machine rate row and country)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS machine_rate_results (
+            machine_rate_id INT NOT NULL,
+            country_id INT NOT NULL,
+            purchase_price_local DECIMAL(18,2),
+            depreciation DECIMAL(15,3),
+            maintenance_1 DECIMAL(15,3),
+            space DECIMAL(15,3),
+            power DECIMAL(15,3),
+            water DECIMAL(15,3),
+            total_dollar_hr DECIMAL(15,3),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (machine_rate_id, country_id),
+            KEY idx_machine_rate_results_country (country_id),
+            FOREIGN KEY (machine_rate_id) REFERENCES machine_rate_calculation(id) ON DELETE CASCADE,
+            FOREIGN KEY (country_id) REFERENCES countries(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Create cost_aggregate_rollup table (stored cumulative cost chain per item master)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cost_aggregate_rollup (
+            cost_aggregate_id INT PRIMARY KEY,
+            item_master_id INT NOT NULL,
+            position INT NOT NULL,
+            total_labor_cost DOUBLE,
+            total_machine_cost DOUBLE,
+            total_operating_cost DOUBLE,
+            cumulative_operating_cost DOUBLE,
+            yield_loss_cost DOUBLE,
+            total_cost DOUBLE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            KEY idx_cost_aggregate_rollup_item (item_master_id, position),
+            FOREIGN KEY (cost_aggregate_id) REFERENCES cost_aggregate(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Create edit_requests table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS edit_requests (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            table_name VARCHAR(50),
+            record_id INT,
+            field_name VARCHAR(50),
+            old_value TEXT,
+            new_value TEXT,
+            requested_by VARCHAR(50),
+            status VARCHAR(20) DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def migrate_item_master_indexes(cursor):
+    # Indexes backing the /fetch-item-masters filters (keyset order is the primary key)
+    ensure_index(cursor, "item_master", "idx_item_master_category", "is_deleted, category, id")
+    ensure_index(cursor, "item_master", "idx_item_master_supplier", "is_deleted, supplier, id")
+    ensure_index(cursor, "item_master", "idx_item_master_lifecycle", "is_deleted, lifecycle_stage, id")
+
+    # Indexes backing /search-item-masters (part_number already has its unique index)
+    ensure_index(cursor, "item_master", "idx_item_master_drawing_number", "drawing_number")
+    ensure_index(cursor, "item_master", "ft_item_master_search", "part_number, description, drawing_number", kind="FULLTEXT INDEX")
+
+def migrate_lookup_indexes(cursor):
+    # Every process flow / cost aggregate lookup filters on (item_master_id, operation, machine_type);
+    # the leading item_master_id also serves the per-item-master reads and the foreign key
+    ensure_index(cursor, "process_flow_matrix", "idx_process_flow_lookup", "item_master_id, operation, machine_type")
+    ensure_index(cursor, "countries", "idx_countries_name", "name")
+
+    # One cost aggregate per process flow: the unique key replaces the SELECT-before-INSERT check.
+    # That check could race, so existing duplicates are removed first, keeping the oldest (lowest id)
+    # row of each; their cost_aggregate_rollup rows go with them (ON DELETE CASCADE)
+    cursor.execute("""
+        SELECT DISTINCT ca.id FROM cost_aggregate ca
+        JOIN cost_aggregate kept ON kept.item_master_id = ca.item_master_id AND kept.operation = ca.operation
+            AND kept.machine_type = ca.machine_type AND kept.id < ca.id
+        ORDER BY ca.id
+    """)
+    duplicate_ids = [row[0] for row in cursor.fetchall()]
+    if duplicate_ids:
+        logging.warning(
+            f"Deleting {len(duplicate_ids)} duplicate cost_aggregate rows (same item_master_id, operation and "
+            f"machine_type as a lower id) before adding uq_cost_aggregate_process_flow: ids {duplicate_ids}"
+        )
+        placeholders = ", ".join(["%s"] * len(duplicate_ids))
+        cursor.execute(f"DELETE FROM cost_aggregate WHERE id IN ({placeholders})", duplicate_ids)
+    ensure_index(cursor, "cost_aggregate", "uq_cost_aggregate_process_flow", "item_master_id, operation, machine_type", kind="UNIQUE INDEX")
+
+def migrate_seed_test_user(cursor):
+    # Create test user for CI/CD; bcrypt is deliberately slow, so hash only when the user is missing
+    cursor.execute("SELECT id FROM users WHERE username = %s", ("Lakshk",))
+    if not cursor.fetchone():
+        hashed_password = pwd_context.hash("Lakshk@257")
+        cursor.execute("INSERT INTO users (username, password_hash, email, role) VALUES (%s, %s, %s, %s)", 
+                     ("Lakshk", hashed_password, "test@example.com", "Admin"))
+        logging.info("Test user 'Lakshk' created successfully!")
+
+def migrate_machine_rate_results(cursor):
+    # Machine rates written before machine_rate_results existed; every write path refreshes its own rows
+    refresh_machine_rate_results(cursor.connection)
+
+def migrate_cost_rollup(cursor):
+    # Store the cost chain for cost aggregates written before cost_aggregate_rollup existed, and move
+    # cost_aggregate.total_cost from the per-operation calculate_costs value to the chain total
+    cursor.execute("DELETE FROM cost_aggregate_rollup")  # Every chain is recomputed from its first operation
+    cursor.execute("SELECT DISTINCT item_master_id FROM cost_aggregate")
+    for (item_master_id,) in cursor.fetchall():
+        refresh_cost_rollup(cursor.connection, item_master_id)
+
+SCHEMA_MIGRATIONS = [
+    (1, "Base tables", migrate_base_tables),
+    (2, "Item master filter and search indexes", migrate_item_master_indexes),
+    (3, "Process flow, cost aggregate and country lookup indexes", migrate_lookup_indexes),
+    (4, "Seed the CI test user", migrate_seed_test_user),
+    (5, "Store derived machine rates for existing rows", migrate_machine_rate_results),
+    (6, "Store cost chains and chain total_cost for existing cost aggregates", migrate_cost_rollup),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def applied_schema_version(cursor):
+    """ Highest applied migration, or 0 on a database that predates schema_migrations. """
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+    except pymysql.err.ProgrammingError as e:
+        if e.args[0] == 1146:  # ER_NO_SUCH_TABLE
+            return 0
+        raise
+    return cursor.fetchone()[0] or 0
+
+def run_migrations(connection):
+    """
+    Apply pending migrations in order and record each in schema_migrations.
+    A current schema costs a single SELECT; workers booting together serialize on a named lock.
+    Returns the versions applied by this call.
+    """
+    cursor = connection.cursor()
+    try:
+        if applied_schema_version(cursor) >= SCHEMA_VERSION:
+            return []
+
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_MIGRATIONS_LOCK, SCHEMA_MIGRATIONS_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Timed out waiting for another worker to finish migrating the schema")
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            current = applied_schema_version(cursor)  # Another worker may have migrated while we waited
+
+            applied = []
+            for version, description, apply in SCHEMA_MIGRATIONS:
+                if version <= current:
+                    continue
+                apply(cursor)
+                cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description))
+                connection.commit()
+                applied.append(version)
+                logging.info(f"Applied schema migration {version}: {description}")
+            return applied
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_MIGRATIONS_LOCK,))
+    finally:
+        cursor.close()
+
+# Startup timing report, served by /health
+startup_report = {"status": "starting"}
+
+def prepare_database():
+    connection = db_pool.acquire()
+    try:
+        return run_migrations(connection)
+    finally:
+        db_pool.release(connection)
+
+# A failed boot migration (e.g. the database is not accepting connections yet) is retried in the
+# background with exponential backoff; /health stays 503 until an attempt succeeds
+SCHEMA_RETRY_INITIAL_DELAY = 1.0
+SCHEMA_RETRY_MAX_DELAY = float(os.getenv("SCHEMA_RETRY_MAX_DELAY", "60"))
+schema_retry_task = None
+
+async def prepare_database_reported():
+    """ One attempt at prepare_database, recorded in startup_report; returns whether it succeeded. """
+    startup_report["attempts"] = startup_report.get("attempts", 0) + 1
+    try:
+        applied = await run_in_threadpool(prepare_database)
+    except Exception as e:
+        logging.error(f"Error preparing database: {e}")
+        startup_report.update(status="error", error=str(e))
+        return False
+    if applied:
+        logging.info(f"Applied schema migrations {applied}; schema is at version {SCHEMA_VERSION}")
+    startup_report.pop("error", None)
+    startup_report.pop("next_retry_seconds", None)
+    startup_report.update(status="ok", schema_version=SCHEMA_VERSION, migrations_applied=applied)
+    return True
+
+async def retry_prepare_database():
+    delay = SCHEMA_RETRY_INITIAL_DELAY
+    while True:
+        startup_report["next_retry_seconds"] = delay
+        await asyncio.sleep(delay)
+        if await prepare_database_reported():
+            logging.info(f"Schema ready after {startup_report['attempts']} attempts")
+            return
+        delay = min(delay * 2, SCHEMA_RETRY_MAX_DELAY)
+
+@app.on_event("startup")
+async def startup_event():
+    """Bring the schema up to date (a single SELECT once current) and record how long the boot took"""
+    global schema_retry_task
+    started = time.perf_counter()
+    ready = await prepare_database_reported()
+
+    finished = time.perf_counter()
+    startup_report.update(
+        import_seconds=round(started - BOOT_STARTED, 3),
+        schema_seconds=round(finished - started, 3),
+        boot_seconds=round(finished - BOOT_STARTED, 3),
+    )
+    logging.info(f"Startup report: {startup_report}")
+    if not ready:
+        schema_retry_task = asyncio.create_task(retry_prepare_database())
+
+@app.get("/health")
+async def health(response: Response):
+    """Health check without a database round trip: 503 until the schema was brought up to date (retried in the background)."""
+    if startup_report["status"] != "ok":
+        response.status_code = 503
+    return startup_report
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close every pooled connection when the worker stops"""
+    if schema_retry_task is not None:
+        schema_retry_task.cancel()
+    upload_executor.shutdown(wait=False, cancel_futures=True)
+    password_executor.shutdown(wait=False, cancel_futures=True)
+    if costing_process_pool is not None:
+        costing_process_pool.shutdown(wait=False, cancel_futures=True)
+    db_pool.close_all()
+    await close_async_pool()
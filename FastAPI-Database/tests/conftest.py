@@ -0,0 +1,151 @@
+"""
+Shared scripted stand-in for pymysql and aiomysql connections.
+
+A script is a list of (pattern, result) or (pattern, result, columns) entries. A statement gets the
+result of the first entry whose pattern is a substring of it; unmatched statements return no rows.
+A result is a list of rows, an exception to raise, or a callable taking the statement's parameters
+and returning rows (or raising). executemany consults the script once per row.
+
+Every statement is recorded in `executed` as (query, params); parameters of statements other than
+SELECT, and executemany rows, are also collected in `written`.
+"""
+import pytest
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.connection = db
+        self.result = []
+        self.description = None
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.executed.append((query, params))
+        self.result, columns = self.connection.respond(query, params)
+        self.description = tuple((name,) for name in columns) if columns else None
+        self.rowcount = len(self.result)
+        if not query.lstrip().upper().startswith(("SELECT", "WITH", "(SELECT")):
+            self.connection.written.append(params)
+        return self.rowcount
+
+    def executemany(self, query, rows):
+        rows = list(rows)
+        self.connection.executed.append((query, rows))
+        for row in rows:
+            self.connection.respond(query, row)
+        self.connection.written.extend(rows)
+        self.rowcount = len(rows)
+        return self.rowcount
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def fetchmany(self, size):
+        batch, self.result = self.result[:size], self.result[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.executed = []
+        self.written = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.pings = 0
+        self.open = True
+
+    @property
+    def queries(self):
+        return [query for query, _ in self.executed]
+
+    def respond(self, query, params):
+        for pattern, result, *columns in self.script:
+            if pattern in query:
+                if isinstance(result, BaseException):
+                    raise result
+                rows = result(params) if callable(result) else result
+                return list(rows or []), (columns[0] if columns else None)
+        return [], None
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+
+    def close(self):
+        self.open = False
+
+
+class FakeAsyncCursor:
+    """ aiomysql-style cursor over a FakeCursor; `await conn.cursor()` and `async with conn.cursor()` both work. """
+
+    def __init__(self, db):
+        self.cursor = FakeCursor(db)
+
+    def __await__(self):
+        if False:
+            yield
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    async def execute(self, query, params=None):
+        return self.cursor.execute(query, params)
+
+    async def executemany(self, query, rows):
+        return self.cursor.executemany(query, rows)
+
+    async def fetchone(self):
+        return self.cursor.fetchone()
+
+    async def fetchall(self):
+        return self.cursor.fetchall()
+
+    async def close(self):
+        pass
+
+
+class FakeAsyncDB(FakeDB):
+    def cursor(self, *cursor_classes):
+        return FakeAsyncCursor(self)
+
+
+@pytest.fixture
+def fake_db():
+    """ Factory for scripted sync connections: fake_db(script). """
+    return FakeDB
+
+
+@pytest.fixture
+def fake_async_db():
+    """ Factory for scripted aiomysql-style connections: fake_async_db(script). """
+    return FakeAsyncDB
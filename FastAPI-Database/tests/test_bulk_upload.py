@@ -0,0 +1,82 @@
+import io
+
+from openpyxl import Workbook
+
+import main
+
+HEADER = list(main.MACHINE_RATE_UPLOAD_COLUMNS)
+ROW = ["CNC", "Haas", "VF-2", 1000, 10, 10, 80, 5, 15, 70, 20, 0.5, 1.25]
+
+
+# Lookups the upload validates against; every other statement is an insert
+LOOKUPS = [
+    ("FROM item_master", lambda params: [(params[0],)]),
+    ("FROM machine_types", [(1, "CNC")]),
+    ("FROM makes", [(7, "Haas")]),
+]
+
+
+def csv_upload(rows):
+    lines = [",".join(str(value) for value in row) for row in rows]
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def test_csv_upload_is_validated_and_flushed_in_batches(fake_db):
+    connection = fake_db(LOOKUPS)
+    bad_row = ["Lathe"] + ROW[1:]
+    rows = main.iter_tabular_upload(csv_upload([HEADER, ROW, ROW, bad_row, ROW]), "rates.csv")
+
+    stats = main.ingest_machine_rate_rows(connection, 3, rows, batch_size=2)
+
+    assert stats["successful_uploads"] == 3
+    assert stats["errors"] == ["Row 4: Invalid Machine Type: Lathe"]
+    assert stats["batches"] == 2 and connection.commits == 2
+    assert connection.written[0] == (3, 1, 7, "VF-2", 1000.0, 10.0, 10.0, 80.0, 5.0, 15.0, 70.0, 20.0, 0.5, 1.25)
+
+
+def test_xlsx_upload_is_read_lazily(fake_db):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    sheet.append(ROW)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+
+    connection = fake_db(LOOKUPS)
+    stats = main.ingest_machine_rate_rows(connection, 3, main.iter_tabular_upload(buffer, "rates.xlsx"), batch_size=100)
+
+    assert stats["successful_uploads"] == 1 and "errors" not in stats
+
+
+def test_background_job_reports_progress_and_honours_cancel(fake_db):
+    job = main.UploadJob("machine_rates", "rates.csv")
+    job.start()
+    job.cancel()  # takes effect at the first progress report, after that batch is committed
+    rows = main.iter_tabular_upload(csv_upload([HEADER] + [ROW] * 5), "rates.csv")
+
+    try:
+        main.ingest_machine_rate_rows(fake_db(LOOKUPS), 3, rows, batch_size=2, job=job)
+    except main.UploadJobCancelled:
+        pass
+    else:
+        raise AssertionError("ingest should stop once the job is cancelled")
+
+    progress = job.to_dict()
+    assert (progress["rows_parsed"], progress["rows_inserted"], progress["rows_failed"]) == (2, 2, 0)
+    assert progress["cancel_requested"]
+
+
+def test_background_submit_does_not_hold_a_pool_connection(monkeypatch):
+    class NoConnections:
+        def connection(self):
+            raise AssertionError("background submit checked out a pooled connection")
+
+    submitted = []
+    monkeypatch.setattr(main, "db_pool", NoConnections())
+    monkeypatch.setattr(main, "submit_upload_job", lambda kind, file, work: submitted.append(kind) or {"job_id": "1"})
+
+    upload = main.UploadFile(file=io.BytesIO(b"Part Number\n"), filename="items.csv")
+    assert main.bulk_upload_item_master(file=upload, chunk_size=10, background=True) == {"job_id": "1"}
+    assert main.bulk_upload_machine_rates(file=upload, item_master_id=1, batch_size=10, background=True) == {"job_id": "1"}
+    assert submitted == ["item_master", "machine_rates"]
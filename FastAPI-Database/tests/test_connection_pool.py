@@ -0,0 +1,46 @@
+import pytest
+from fastapi import HTTPException
+
+import main
+from main import ConnectionPool
+
+
+@pytest.fixture
+def fake_connect(monkeypatch, fake_db):
+    created = []
+
+    def connect(**kwargs):
+        created.append(fake_db())
+        return created[-1]
+
+    monkeypatch.setattr(main.pymysql, "connect", connect)
+    return created
+
+
+def test_pool_reuses_released_connection(fake_connect):
+    pool = ConnectionPool({}, size=2, timeout=0.1, recycle=60)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(fake_connect) == 1
+    assert second.pings == 1
+
+
+def test_pool_is_bounded(fake_connect):
+    pool = ConnectionPool({}, size=1, timeout=0.05, recycle=60)
+    with pool.connection():
+        with pytest.raises(HTTPException) as exc:
+            pool.acquire()
+    assert exc.value.status_code == 503
+
+
+def test_pool_recycles_idle_connections(fake_connect):
+    pool = ConnectionPool({}, size=1, timeout=0.1, recycle=0)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is not second
+    assert not first.open
@@ -0,0 +1,44 @@
+import pymysql
+
+import main
+
+
+def batch_db(fake_db, existing=(), raced=()):
+    def insert(params):
+        if params[:3] in raced:
+            raise pymysql.err.IntegrityError(1062, "Duplicate entry for key 'uq_cost_aggregate_process_flow'")
+
+    return fake_db([
+        ("FROM cost_aggregate ca", []),  # Cost chain read by refresh_cost_rollup
+        ("FROM process_flow_matrix", FLOWS),
+        ("FROM cost_aggregate WHERE", list(existing)),
+        ("INSERT INTO cost_aggregate", insert),
+    ])
+
+
+def cost(operation, machine_type=1):
+    return main.CostAggregate(
+        item_master_id=1, operation=operation, machine_type=machine_type,
+        machine_rate=36, labor_rate=18, input_material_cost=5, consumables_cost=1,
+    )
+
+
+FLOWS = [(1, "Milling", 1, 100, 50, 1), (1, "Drilling", 1, 100, 100, 1), (1, "Turning", 1, 100, 100, 1)]
+
+
+def test_batch_reports_failures_per_entry(fake_db):
+    connection = batch_db(fake_db, existing=[(1, "Drilling", 1)])
+    response = main.create_cost_aggregate_batch(
+        [cost("Milling"), cost("Drilling"), cost("Grinding"), cost("Milling")], connection=connection
+    )
+    assert (response["created"], response["failed"]) == (1, 3)
+    assert [result["status"] for result in response["results"]] == ["created", "failed", "failed", "failed"]
+    # (1 + 0.5 + 5 + 1) / 0.5
+    assert connection.written == [(1, "Milling", 1, 36, 18, 5, 1, 15.0)]
+
+
+def test_concurrent_duplicate_falls_back_to_row_inserts(fake_db):
+    connection = batch_db(fake_db, raced={(1, "Turning", 1)})
+    response = main.create_cost_aggregate_batch([cost("Milling"), cost("Turning")], connection=connection)
+    assert [result["status"] for result in response["results"]] == ["created", "failed"]
+    assert [row[1] for row in connection.written] == ["Milling"]
@@ -0,0 +1,72 @@
+import main
+from main import COST_CHAIN_ROLLUP, cost_chain_step, cost_rollup_start, refresh_cost_rollup
+
+
+def chain_row(ca_id, operation, yield_percentage, rollup=(None,) * 7):
+    # COST_CHAIN_QUERY layout: cost aggregate, process flow, then position + stored rollup values
+    return (ca_id, operation, 1, 120.0, 30.0, 5.0, 1.0, 0.0,
+            ca_id, ca_id, "op", 1, 60, yield_percentage, 2.0) + tuple(rollup)
+
+
+def full_chain(rows):
+    cumulative, stored = 0.0, []
+    for position, row in enumerate(rows):
+        step = cost_chain_step(row, cumulative)
+        cumulative = step["cumulative_operating_cost"]
+        stored.append(chain_row(row[0], row[1], row[13], (position, *(step[name] for name in main.COST_ROLLUP_COLUMNS))))
+    return stored
+
+
+def test_chain_is_current_when_positions_match():
+    stored = full_chain([chain_row(1, "Cut", 98), chain_row(2, "Mill", 95)])
+    assert cost_rollup_start(stored) == 2
+    assert cost_rollup_start(stored, changed_flows={("Mill", 1)}) == 1
+
+
+def test_refresh_recomputes_only_from_the_changed_operation(fake_db):
+    stored = full_chain([chain_row(1, "Cut", 98), chain_row(2, "Mill", 95), chain_row(3, "Drill", 90)])
+    # Operation 2's yield drops; operation 1 keeps its stored values
+    edited = list(stored)
+    edited[1] = chain_row(2, "Mill", 80, stored[1][COST_CHAIN_ROLLUP - 1:])
+    connection = fake_db([("FROM cost_aggregate ca", edited)])
+
+    assert refresh_cost_rollup(connection, 7, changed_ids={2}) == 2
+    assert connection.commits == 0  # Committed by the calling write path
+
+    expected = full_chain([chain_row(1, "Cut", 98), chain_row(2, "Mill", 80), chain_row(3, "Drill", 90)])
+    rollup = dict(connection.executed)[main.COST_ROLLUP_UPSERT]
+    assert [values[0] for values in rollup] == [2, 3]
+    for values, row in zip(rollup, expected[1:]):
+        assert values[1:] == (7, *row[COST_CHAIN_ROLLUP - 1:])
+
+    # cost_aggregate.total_cost follows the chain
+    assert dict(connection.executed)[main.COST_AGGREGATE_TOTAL_UPDATE] == [(row[-1], row[0]) for row in expected[1:]]
+
+
+def test_duplicate_process_flows_join_once_and_keep_the_chain_current():
+    import sqlite3
+
+    db = sqlite3.connect(":memory:")
+    db.executescript(f"""
+        CREATE TABLE cost_aggregate (id, item_master_id, operation, machine_type, machine_rate, labor_rate,
+                                     input_material_cost, consumables_cost, total_cost);
+        CREATE TABLE process_flow_matrix (id, item_master_id, op_no, operation, description, machine_type,
+                                          cycle_time_sec, yield_percentage, operator_count);
+        CREATE TABLE cost_aggregate_rollup (cost_aggregate_id, position, {", ".join(main.COST_ROLLUP_COLUMNS)});
+        INSERT INTO cost_aggregate VALUES (1, 7, 'Cut', 1, 120, 30, 5, 1, 0);
+        -- Two flows match the same (item_master_id, operation, machine_type)
+        INSERT INTO process_flow_matrix VALUES (11, 7, 10, 'Cut', 'first', 1, 60, 95, 2);
+        INSERT INTO process_flow_matrix VALUES (12, 7, 20, 'Cut', 'second', 1, 90, 90, 1);
+        INSERT INTO cost_aggregate_rollup VALUES (1, 0, 0, 0, 0, 0, 0, 0);
+    """)
+    records = db.execute(main.COST_CHAIN_QUERY.replace("%s", "?"), (7,)).fetchall()
+
+    assert [(row[0], row[8]) for row in records] == [(1, 11)]
+    assert cost_rollup_start(records) == len(records)
+
+
+def test_final_cost_marks_up_the_last_chain_total(fake_db):
+    connection = fake_db([("FROM item_master", [(7,)]), ("FROM cost_aggregate_rollup", [(42.5,)])])
+    assert main.calculate_final_cost(7, connection=connection) == main.final_cost_breakdown(42.5)
+    assert "ORDER BY position DESC" in connection.queries[-1]
+    assert connection.written == []
@@ -0,0 +1,126 @@
+import pytest
+
+import main
+
+INDIA = ("India", (18, 8, 2, 60, 83, "₹"))
+USA = ("USA", (30, 0.15, 1.5, 12, 1, "$"))
+MACHINE_RATES = [
+    (1, 10, 1, 1000, 10, 10, 80, 5, 15, 70, 20, 0.5, 1.25),
+    (2, 10, 1, 9999, 10, 10, 80, 5, 15, 70, 20, 0.5, 1.25),  # Second rate of the same type is not used
+    (3, 20, 1, 1000, 10, 10, 80, 5, 15, 70, 20, 0.5, 1.25),
+]
+# item_master_id, machine_type, input_material_cost, consumables_cost, cycle_time_sec, yield, operators,
+# process_flow_id
+OPERATIONS = [
+    (10, 1, 5, 1, 120, 95, 1, 100),
+    (20, 1, 3, 0, 30, 0, 1, 102),
+    (20, 1, 0, 2, 60, 90, 2, 103),
+]
+MISSING_RATE = (30, 2, 0, 2, 60, 90, 2, 104)  # Machine type 2 has no machine rate row
+
+
+def costing_cursor(fake_db, operations=OPERATIONS):
+    return fake_db([("FROM machine_rate_calculation", MACHINE_RATES), ("", operations)]).cursor()
+
+
+def chain_total(operations, labor_rate, machine_rate):
+    cumulative, total = 0.0, 0.0
+    for item_id, machine_type, material, consumables, cycle, yield_percentage, operators, _ in operations:
+        row = [None] * 15
+        row[3:7] = [machine_rate, labor_rate, material, consumables]
+        row[12:15] = [cycle, yield_percentage, operators]
+        step = main.cost_chain_step(row, cumulative)
+        cumulative, total = step["cumulative_operating_cost"], step["total_cost"]
+    return total
+
+
+def test_matrix_matches_the_per_item_cost_chain(fake_db):
+    inputs = main.load_costing_inputs(costing_cursor(fake_db), [10, 20])
+    chain, summed = main.run_costing_matrix(inputs, [INDIA, USA])
+    assert inputs["items"] == [10, 20]
+    assert list(inputs["rate_index"]) == [0, 2, 2]
+
+    for row, (name, rates) in enumerate([INDIA, USA]):
+        hourly = main.calculate_machine_rate_columns(inputs["machine_rates"], name, rates)["total_dollar_hr"][0]
+        assert chain[row, 0] == pytest.approx((5 + 1 + 120 / 3600 * (rates[0] + hourly)) / 0.95)
+        assert chain[row, 1] == pytest.approx(chain_total(OPERATIONS[1:], rates[0], hourly))
+        assert summed[row, 0] == pytest.approx(chain[row, 0])
+
+
+def test_items_missing_a_machine_rate_are_skipped_not_priced_in_another_currency(fake_db):
+    inputs = main.load_costing_inputs(costing_cursor(fake_db, OPERATIONS + [MISSING_RATE]), [10, 20, 30])
+    chain, summed = main.run_costing_matrix(inputs, [INDIA])
+    cells = main.costing_cells(inputs, [10, 20, 30, 40], {10: "A", 20: "B", 30: "C", 40: "D"}, [INDIA], chain, summed)
+
+    assert [cell["skipped_reason"] for cell in cells] == [
+        None, None, "1 operation(s) have no machine rate for their machine type", "No cost aggregates",
+    ]
+    assert cells[2]["final_total_cost"] is None and cells[0]["final_total_cost"] is not None
+
+
+def test_parallel_matrix_matches_serial(monkeypatch, fake_db):
+    monkeypatch.setattr(main, "COSTING_MATRIX_WORKERS", 2)
+    inputs = main.load_costing_inputs(costing_cursor(fake_db), [10, 20])
+    serial = main.run_costing_matrix(inputs, [INDIA, USA])
+    parallel = main.run_costing_matrix(inputs, [INDIA, USA], parallel=True)
+    main.costing_process_pool.shutdown()
+    main.costing_process_pool = None
+    for expected, actual in zip(serial, parallel):
+        assert actual == pytest.approx(expected)
+
+
+def test_what_if_sweep_matches_costing_each_scenario_separately(fake_db):
+    inputs = main.load_costing_inputs(costing_cursor(fake_db), [10, 20])
+    parameters = [
+        main.WhatIfParameter(target="country", key="India", field="exchange_rate", values=[1.0, 1.1], relative=True),
+        main.WhatIfParameter(target="machine_rate", key=1, field="utilization", values=[60, 80]),
+    ]
+    scenario_inputs, columns, scenarios = main.what_if_inputs(inputs, [INDIA, USA], parameters)
+    chain, summed = main.costing_matrix_block(scenario_inputs, columns)
+    assert chain.shape == (8, 2)
+    assert inputs["machine_rates"]["utilization"][0] == 80  # Stored inputs are left untouched
+
+    for index, (exchange_factor, utilization) in enumerate(scenarios):
+        expected_inputs = {**inputs, "machine_rates": dict(inputs["machine_rates"])}
+        expected_inputs["machine_rates"]["utilization"] = inputs["machine_rates"]["utilization"].copy()
+        expected_inputs["machine_rates"]["utilization"][0] = utilization
+        india_rates = list(INDIA[1])
+        india_rates[4] *= exchange_factor
+        expected, _ = main.costing_matrix_block(expected_inputs, [("India", tuple(india_rates)), USA])
+        assert chain[index * 2:index * 2 + 2] == pytest.approx(expected)
+
+
+def test_what_if_rejects_parameters_outside_the_request(fake_db):
+    inputs = main.load_costing_inputs(costing_cursor(fake_db), [10, 20])
+    parameter = main.WhatIfParameter(target="process_flow", key=999, field="yield_percentage", values=[90])
+    with pytest.raises(main.HTTPException):
+        main.what_if_inputs(inputs, [INDIA], [parameter])
+
+
+def test_what_if_rejects_oversized_sweeps_before_expanding_them(monkeypatch, fake_db):
+    def expand(*iterables):
+        raise AssertionError("product expanded before the scenario cap was checked")
+
+    monkeypatch.setattr("itertools.product", expand)
+    inputs = main.load_costing_inputs(costing_cursor(fake_db), [10, 20])
+    parameters = [
+        main.WhatIfParameter(target="machine_rate", key=1, field=field, values=list(range(1000)))
+        for field in ("utilization", "useful_life", "maintenance")
+    ]
+    with pytest.raises(main.HTTPException) as error:
+        main.what_if_inputs(inputs, [INDIA], parameters)
+    assert error.value.status_code == 400
+
+
+def test_costing_matrix_requires_a_signed_in_role():
+    from fastapi.testclient import TestClient
+
+    body = {"item_master_ids": [10], "countries": ["India"], "parallel": True}
+    assert TestClient(main.app).post("/costing-matrix", json=body).status_code == 401
+
+
+def test_what_if_requires_a_signed_in_role():
+    from fastapi.testclient import TestClient
+
+    body = {"item_master_ids": [10], "countries": ["India"], "parameters": []}
+    assert TestClient(main.app).post("/what-if", json=body).status_code == 401
@@ -0,0 +1,91 @@
+import csv
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+import main
+
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+        self.released = []
+
+    def acquire(self):
+        return self.connection
+
+    def release(self, connection, discard=False):
+        self.released.append(discard)
+
+
+def test_stream_query_batches_and_returns_the_connection(monkeypatch, fake_db):
+    pool = FakePool(fake_db([("", [(index,) for index in range(5)])]))
+    monkeypatch.setattr(main, "db_pool", pool)
+    monkeypatch.setattr(main, "EXPORT_FETCH_SIZE", 2)
+
+    assert [len(rows) for rows in main.stream_query("SELECT 1")] == [2, 2, 1]
+    assert pool.released == [False]
+
+
+def test_abandoned_stream_discards_the_connection(monkeypatch, fake_db):
+    pool = FakePool(fake_db([("", [(index,) for index in range(5)])]))
+    monkeypatch.setattr(main, "db_pool", pool)
+    monkeypatch.setattr(main, "EXPORT_FETCH_SIZE", 2)
+
+    batches = main.stream_query("SELECT 1")
+    next(batches)
+    batches.close()
+    assert pool.released == [True]
+
+
+def test_csv_chunks_write_one_chunk_per_batch():
+    chunks = list(main.csv_chunks(("id", "name"), [[(1, "a"), (2, "b")], [(3, "c")]]))
+    assert len(chunks) == 2
+    text = b"".join(chunks).decode("utf-8-sig")
+    assert list(csv.reader(io.StringIO(text))) == [["id", "name"], ["1", "a"], ["2", "b"], ["3", "c"]]
+
+
+def test_xlsx_chunks_start_a_new_sheet_at_the_row_limit(monkeypatch):
+    monkeypatch.setattr(main, "XLSX_MAX_ROWS", 3)
+    body = b"".join(main.xlsx_chunks(("id",), [[(1,), (2,), (3,)], [(4,)]], title="Export"))
+
+    workbook = load_workbook(io.BytesIO(body), read_only=True)
+    sheets = [[row for row in sheet.iter_rows(values_only=True)] for sheet in workbook.worksheets]
+    assert workbook.sheetnames == ["Export", "Export 2"]
+    assert sheets == [[("id",), (1,), (2,)], [("id",), (3,), (4,)]]
+
+
+def test_unknown_export_format_is_rejected():
+    with pytest.raises(main.HTTPException) as error:
+        main.export_response("pdf", "item-masters", ("id",), iter(()))
+    assert error.value.status_code == 400
+
+
+def test_cost_aggregate_chain_resets_per_item_master():
+    def row(item_master_id, machine_rate):
+        # COST_CHAIN_QUERY columns: machine rate at 3, cycle time / yield / operators at 12-14
+        values = [None] * 18
+        values[3], values[4], values[5], values[6] = machine_rate, 0, 0, 0
+        values[12], values[13], values[14] = 3600, 100, 1
+        values[15] = item_master_id
+        return tuple(values)
+
+    rows = next(main.cost_aggregate_export_rows([[row(1, 10), row(1, 5), row(2, 7)]]))
+    cumulative = main.COST_AGGREGATE_EXPORT_HEADER.index("Cumulative Operating Cost")
+    assert [out[cumulative] for out in rows] == [10, 15, 7]
+
+
+def test_machine_rate_export_streams_stored_results_with_an_encodable_filename(monkeypatch):
+    streamed = []
+    monkeypatch.setattr(main, "get_country_rates", lambda country, connection: None)
+    monkeypatch.setattr(main, "stream_query", lambda query, params=(): streamed.append((query, params)) or iter(()))
+
+    response = main.export_machine_rates("Россия", item_master_id=3, export_format="csv", connection=None)
+
+    query, params = streamed[0]
+    assert "LEFT JOIN machine_rate_results r" in query and params == ("Россия", 3)
+    disposition = response.headers["content-disposition"]
+    disposition.encode("latin-1")
+    assert 'filename="machine-rates.csv"' in disposition
+    assert "filename*=UTF-8''machine-rates-%D1%80%D0%BE%D1%81%D1%81%D0%B8%D1%8F.csv" in disposition
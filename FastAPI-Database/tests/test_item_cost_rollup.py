@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+
+import main
+
+PROCESS_FLOW = (5, 10, "Milling", "Rough mill", 1, "CNC", 120, 95, 1)
+MACHINE_RATE = (7, 1, "CNC", 2, "Haas", "VF-2", 1000, 10, 10, 80, 5, 15, 70, 20, 0.5, 1.25, 3, 83000, 1, 2, 3, 4, 5, 15)
+COST_CHAIN = (9, "Milling", 1, 36, 18, 5, 1, 100, 5, 10, "Rough mill", 1, 120, 95, 1, 0, 1, 1.2, 7.2, 7.2, 0.4, 7.6)
+
+
+def client_with(connection):
+    async def fake_get_async_db():
+        yield connection
+
+    main.app.dependency_overrides[main.get_async_db] = fake_get_async_db
+    return TestClient(main.app)
+
+
+def rollup_db(fake_async_db):
+    def currency(params):
+        return [(params[1], 3, "₹")] if params[0] == "India" else [(params[1], None, None)]
+
+    return fake_async_db([
+        ("FROM item_master im", currency),
+        (main.PROCESS_FLOW_QUERY, [PROCESS_FLOW]),
+        (main.MACHINE_RATE_DATA_QUERY, [MACHINE_RATE]),
+        (main.COST_CHAIN_QUERY, [COST_CHAIN]),
+    ])
+
+
+def test_rollup_combines_the_four_views_in_four_queries(fake_async_db):
+    connection = rollup_db(fake_async_db)
+    try:
+        response = client_with(connection).get("/item-cost-rollup/1", params={"country": "India"})
+    finally:
+        main.app.dependency_overrides.clear()
+    assert response.status_code == 200
+    body = response.json()
+    assert body["process_flows"] == [main.process_flow_row(PROCESS_FLOW)]
+    assert body["machine_rates"][0]["total_dollar_hr"] == 15.0
+    assert body["machine_rates"][0]["currency_symbol"] == "₹"
+    assert body["cost_aggregates"][0]["total_cost"] == 7.6
+    assert body["final_cost"] == main.final_cost_breakdown(7.6)  # Last operation's stored chain total
+    assert len(connection.executed) == 4
+
+
+def test_rollup_rejects_unknown_country(fake_async_db):
+    try:
+        response = client_with(rollup_db(fake_async_db)).get("/item-cost-rollup/1", params={"country": "Atlantis"})
+    finally:
+        main.app.dependency_overrides.clear()
+    assert response.status_code == 400
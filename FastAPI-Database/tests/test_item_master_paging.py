@@ -0,0 +1,47 @@
+import asyncio
+
+import orjson
+import pytest
+from starlette.requests import Request
+
+import main
+
+
+def fetch(connection, **params):
+    arguments = {"after_id": None, "limit": None, "category": None, "supplier": None, "lifecycle_stage": None, "fields": None}
+    arguments.update(params)
+    request = Request({"type": "http", "query_string": b"", "headers": []})
+    response = asyncio.run(main.fetch_item_master(request, connection=connection, **arguments))
+    query, params = connection.executed[0]
+    return response, (" ".join(query.split()), params)
+
+
+def test_without_paging_parameters_every_row_is_returned(fake_async_db):
+    response, (query, params) = fetch(fake_async_db([("FROM item_master", [(1, "P-1"), (2, "P-2")])]), fields="part_number")
+    assert "LIMIT" not in query
+    assert params == ()
+    assert "x-next-cursor" not in response.headers
+    assert orjson.loads(response.body) == [{"id": 1, "part_number": "P-1"}, {"id": 2, "part_number": "P-2"}]
+
+
+def test_cursor_page_with_category_filter_sets_the_next_cursor(fake_async_db):
+    rows = [(11, "P-11"), (12, "P-12"), (13, "P-13")]  # limit + 1 rows: another page follows
+    response, (query, params) = fetch(fake_async_db([("FROM item_master", rows)]), after_id=10, limit=2, category="Gears", fields="part_number")
+    assert "WHERE is_deleted = 0 AND category = %s AND id > %s ORDER BY id LIMIT %s" in query
+    assert params == ("Gears", 10, 3)
+    assert response.headers["x-next-cursor"] == "12"
+    assert [row["id"] for row in orjson.loads(response.body)] == [11, 12]
+
+
+def test_last_page_has_no_cursor_and_uses_the_default_page_size(fake_async_db):
+    response, (_, params) = fetch(fake_async_db([("FROM item_master", [(21, "P-21")])]), after_id=20, fields="part_number")
+    assert params == (20, main.ITEM_MASTER_PAGE_SIZE + 1)
+    assert "x-next-cursor" not in response.headers
+
+
+def test_fields_always_include_id_and_reject_unknown_columns():
+    assert main.parse_item_master_fields("part_number, id ,part_number") == ("id", "part_number")
+    assert main.parse_item_master_fields(None) == main.ITEM_MASTER_FIELDS
+    with pytest.raises(main.HTTPException) as error:
+        main.parse_item_master_fields("part_number,password_hash")
+    assert error.value.status_code == 400
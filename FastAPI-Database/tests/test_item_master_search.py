@@ -0,0 +1,44 @@
+from main import escape_like, fulltext_prefix_query
+
+
+def test_like_wildcards_are_escaped():
+    assert escape_like("A_1%") == "A\\_1\\%"
+
+
+def test_fulltext_query_requires_every_word_as_prefix():
+    assert fulltext_prefix_query('gear "hou-sing"') == "+gear* +hou* +sing*"
+    assert fulltext_prefix_query("+-*") == ""
+
+
+def search(connection, q, limit=10):
+    import asyncio
+    import main
+
+    return asyncio.run(main.search_item_masters(q=q, limit=limit, connection=connection)), connection.executed
+
+
+def test_search_ranks_prefix_matches_first_and_dedupes(fake_async_db):
+    # (match_rank, id, part_number, revision_number, description), in the order MySQL may return them
+    rows = [
+        (2, 3, "GB-100", 1, "gear housing"),
+        (0, 1, "GEAR-1", 2, "spur gear"),
+        (2, 1, "GEAR-1", 2, "spur gear"),  # Also a FULLTEXT match: listed once, at its best rank
+        (1, 2, "X-9", 1, "drawing GEAR-7"),
+    ]
+    results, executed = search(fake_async_db([("match_rank", rows)]), "gear")
+    assert [result["id"] for result in results] == [1, 2, 3]
+    assert results[0] == {"id": 1, "label": "GEAR-1 - Rev 2", "description": "spur gear"}
+
+    query, params = executed[0]
+    assert query.count("UNION ALL") == 2
+    assert params == ("gear%", 10, "gear%", 10, "+gear*", 10)
+
+
+def test_search_stops_at_the_limit_and_skips_fulltext_without_words(fake_async_db):
+    rows = [(0, index, f"P-{index}", 1, "") for index in range(5)]
+    results, executed = search(fake_async_db([("match_rank", rows)]), "+-*", limit=3)
+    assert [result["id"] for result in results] == [0, 1, 2]
+
+    query, params = executed[0]
+    assert "MATCH" not in query
+    assert params == ("+-*%", 3, "+-*%", 3)
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from passlib.context import CryptContext
+
+import main
+
+
+def test_throttle_blocks_after_the_limit_and_resets():
+    throttle = main.LoginThrottle(limit=2, window=60)
+    throttle.record_failure("u")
+    assert throttle.retry_after("u") == 0
+    throttle.record_failure("u")
+    assert 0 < throttle.retry_after("u") <= 61
+    throttle.reset("u")
+    assert throttle.retry_after("u") == 0
+
+
+def test_throttle_window_expires():
+    throttle = main.LoginThrottle(limit=1, window=0)
+    throttle.record_failure("u")
+    assert throttle.retry_after("u") == 0
+
+
+def test_throttle_drops_the_oldest_keys():
+    throttle = main.LoginThrottle(limit=1, window=60, max_keys=2)
+    for key in ("a", "b", "c"):
+        throttle.record_failure(key)
+    assert throttle.retry_after("a") == 0
+    assert throttle.retry_after("c") > 0
+
+
+def test_login_throttle_check_returns_429():
+    main.username_throttle.reset("blocked")
+    for _ in range(main.username_throttle.limit):
+        main.username_throttle.record_failure("blocked")
+    with pytest.raises(main.HTTPException) as error:
+        main.login_throttle_check("blocked", "127.0.0.1")
+    assert error.value.status_code == 429
+    assert "Retry-After" in error.value.headers
+    main.username_throttle.reset("blocked")
+
+
+def test_plain_text_password_is_upgraded_to_a_hash():
+    assert main.check_password("secret", "wrong") == (False, None)
+    valid, new_hash = main.check_password("secret", "secret")
+    assert valid and main.pwd_context.verify("secret", new_hash)
+
+
+def test_outdated_bcrypt_cost_is_rehashed(monkeypatch):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    monkeypatch.setattr(main, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+    valid, new_hash = main.check_password("secret", old_hash)
+    assert valid and new_hash and "$05$" in new_hash
+    assert main.check_password("secret", new_hash) == (True, None)
+
+
+def test_offloaded_check_rejects_when_saturated(monkeypatch):
+    monkeypatch.setattr(main, "password_checks", main.threading.BoundedSemaphore(1))
+    main.password_checks.acquire()
+    with pytest.raises(main.HTTPException) as error:
+        asyncio.run(main.check_password_offloaded("secret", "secret"))
+    assert error.value.status_code == 503
+
+
+def make_request(forwarded=None, peer="10.0.0.1"):
+    from starlette.requests import Request
+
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_client_ip_comes_from_the_trusted_forwarded_hop(monkeypatch):
+    monkeypatch.setattr(main, "TRUSTED_PROXY_HOPS", 0)
+    assert main.login_client_ip(make_request("1.2.3.4")) == "10.0.0.1"  # Header ignored unless proxies are trusted
+
+    monkeypatch.setattr(main, "TRUSTED_PROXY_HOPS", 1)
+    assert main.login_client_ip(make_request("6.6.6.6, 1.2.3.4")) == "1.2.3.4"  # First entry is client-supplied
+    assert main.login_client_ip(make_request()) == "10.0.0.1"
+
+    monkeypatch.setattr(main, "TRUSTED_PROXY_HOPS", 2)
+    assert main.login_client_ip(make_request("6.6.6.6, 1.2.3.4, 172.16.0.2")) == "1.2.3.4"
+
+
+def test_zero_limit_turns_the_throttle_off():
+    throttle = main.LoginThrottle(limit=0, window=60)
+    for _ in range(100):
+        throttle.record_failure("proxy")
+    assert throttle.retry_after("proxy") == 0
@@ -0,0 +1,63 @@
+from decimal import Decimal
+
+from main import calculate_machine_rate_columns, machine_rate_input_columns, machine_rate_row_values
+
+# labor_rate, electricity_rate, water_rate, space_rental_rate, exchange_rate, currency_symbol
+INDIA_RATES = (Decimal("2.50"), Decimal("0.18"), Decimal("0.60"), Decimal("5.75"), Decimal("83.0000"), "₹")
+
+
+def make_row(purchase_price, res_value, useful_life, utilization, maintenance,
+             power_kw_hr, power_spec, area_m2, water_m3_hr, consumables):
+    # Mirrors the /machine-rate-data SELECT: six descriptive columns, then the ten inputs
+    return (1, 1, "CNC", 1, "Haas", "VF-2",
+            Decimal(purchase_price), Decimal(res_value), Decimal(useful_life), Decimal(utilization),
+            Decimal(maintenance), Decimal(power_kw_hr), Decimal(power_spec), Decimal(area_m2),
+            Decimal(water_m3_hr), Decimal(consumables))
+
+
+def test_engine_matches_scalar_formulas():
+    row = make_row("1000", "10", "10", "80", "5", "15", "70", "20", "0.5", "1.25")
+    columns = calculate_machine_rate_columns(machine_rate_input_columns([row]), "India", INDIA_RATES)
+    values = machine_rate_row_values(columns, 0)
+
+    purchase_price = 1000 * 83.0
+    annual_hours = 6240
+    depreciation = (purchase_price - purchase_price * 0.10) / (10 * annual_hours * 0.80)
+    maintenance_1 = (purchase_price * 0.05) / (10 * annual_hours)
+    space = (5.75 * 20) / (annual_hours / 12 * 0.80)
+    power = 0.18 * 15 * 0.70
+    water = 0.60 * 0.5
+    total = depreciation + maintenance_1 + space + power + water + 1.25
+
+    assert values == {
+        "depreciation": round(depreciation, 3),
+        "maintenance_1": round(maintenance_1, 3),
+        "space": round(space, 3),
+        "power": round(power, 3),
+        "water": round(water, 3),
+        "total_dollar_hr": round(total, 3),
+        "currency_symbol": "₹",
+    }
+
+
+def test_engine_guards_divide_by_zero_per_row():
+    rows = [
+        make_row("1000", "10", "0", "80", "5", "0", "0", "20", "0", "0"),
+        make_row("1000", "10", "10", "0", "5", "0", "0", "20", "0", "0"),
+    ]
+    columns = calculate_machine_rate_columns(machine_rate_input_columns(rows), "India", INDIA_RATES)
+
+    no_life, idle = machine_rate_row_values(columns, 0), machine_rate_row_values(columns, 1)
+    assert no_life["depreciation"] == 0 and no_life["maintenance_1"] == 0
+    assert no_life["space"] > 0
+    assert idle["depreciation"] == 0 and idle["space"] == 0
+    assert idle["maintenance_1"] > 0
+
+
+def test_engine_accepts_empty_and_null_inputs():
+    columns = calculate_machine_rate_columns(machine_rate_input_columns([]), "India", INDIA_RATES)
+    assert columns["total_dollar_hr"].shape == (0,)
+
+    row = (None,) * 6 + (Decimal("100"),) + (None,) * 9
+    columns = calculate_machine_rate_columns(machine_rate_input_columns([row]), "India", INDIA_RATES)
+    assert machine_rate_row_values(columns, 0)["total_dollar_hr"] == 0
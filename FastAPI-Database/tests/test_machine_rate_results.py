@@ -0,0 +1,47 @@
+from starlette.requests import Request
+
+import main
+
+INDIA = (1, "India", 18, 8, 2, 60, 83, "₹")
+MACHINE_RATE = (7, 1000, 10, 10, 80, 5, 15, 70, 20, 0.5, 1.25)  # id, then MACHINE_RATE_INPUT_COLUMNS
+
+
+def test_update_stores_results_before_committing(fake_db):
+    def upsert(params):
+        assert connection.commits == 0, "results written after the update was committed"
+
+    connection = fake_db([
+        ("FROM countries", [INDIA]),
+        ("FROM machine_rate_calculation", [MACHINE_RATE]),
+        ("INSERT INTO machine_rate_results", upsert),
+    ])
+    main.update_machine_rate(7, main.UpdateMachineRate(field="utilization", value="75"), connection=connection)
+
+    assert connection.commits == 1
+    assert [row[:2] for row in connection.written if len(row) > 2] == [(7, 1)]
+
+
+def test_failed_refresh_rolls_back_the_update(fake_db):
+    connection = fake_db([("FROM countries", RuntimeError("lost connection"))])
+    try:
+        main.update_machine_rate(7, main.UpdateMachineRate(field="utilization", value="75"), connection=connection)
+    except main.HTTPException as error:
+        assert error.status_code == 500
+    else:
+        raise AssertionError("a failed refresh should fail the update")
+    assert (connection.commits, connection.rollbacks) == (0, 1)
+
+
+def test_machine_rate_data_only_reads(fake_db):
+    row = (7, 1, "CNC", 2, "Haas", "VF-2", 1000, 10, 10, 80, 5, 15, 70, 20, 0.5, 1.25, 1) + (None,) * 8  # No results stored
+    connection = fake_db([
+        ("FROM item_master", [(1,)]),
+        ("FROM countries", [INDIA[2:]]),
+        ("FROM machine_rate_calculation mrc", [row]),
+    ])
+    main.country_rates_cache.clear()
+    request = Request({"type": "http", "query_string": b"", "headers": []})
+    main.get_machine_rate_data(request, item_master_id=1, country="India", connection=connection)
+
+    assert connection.commits == 0 and connection.written == []
+    assert not any("machine_rate_results (" in query for query in connection.queries)
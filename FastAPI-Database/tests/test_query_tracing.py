@@ -0,0 +1,56 @@
+import logging
+
+import main
+
+
+def explain_db(fake_db):
+    return fake_db([("EXPLAIN", [("process_flow_matrix", None)], ("table", "key"))])
+
+
+def traced_cursor(connection):
+    class TracedCursor(main.MeteredCursorMixin, type(connection.cursor())):
+        pass
+
+    return TracedCursor(connection)
+
+
+def test_parameter_shape_hides_values():
+    assert main.parameter_shape((1, "secret", None)) == "tuple[3](int, str, NoneType)"
+    assert main.parameter_shape({"id": 5}) == "{id: int}"
+    assert main.parameter_shape(list(range(12))).endswith(", ...)")
+    assert main.parameter_shape(None) == "none"
+
+
+def test_slow_select_is_logged_with_route_and_explained(monkeypatch, caplog, fake_db):
+    monkeypatch.setattr(main, "SLOW_QUERY_SECONDS", 0)
+    monkeypatch.setattr(main, "SLOW_QUERY_EXPLAIN", True)
+
+    class Route:
+        path = "/item-cost-rollup/{item_master_id}"
+
+    stats = main.RequestStats({"route": Route()})
+    token = main.current_request_stats.set(stats)
+    connection = explain_db(fake_db)
+    try:
+        with caplog.at_level(logging.WARNING, logger="sql"):
+            traced_cursor(connection).execute("SELECT * FROM process_flow_matrix WHERE item_master_id = %s", (7,))
+            traced_cursor(connection).execute("UPDATE item_master SET weight = %s", (1.5,))
+    finally:
+        main.current_request_stats.reset(token)
+
+    assert stats.queries == 2
+    assert connection.queries == [
+        "SELECT * FROM process_flow_matrix WHERE item_master_id = %s",
+        "EXPLAIN SELECT * FROM process_flow_matrix WHERE item_master_id = %s",
+        "UPDATE item_master SET weight = %s",
+    ]
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("route=/item-cost-rollup/{item_master_id} params=tuple[1](int)" in message for message in messages)
+    assert any("EXPLAIN for SELECT" in message and "process_flow_matrix" in message for message in messages)
+
+
+def test_fast_queries_are_not_logged_at_the_default_level(monkeypatch, caplog, fake_db):
+    monkeypatch.setattr(main, "SLOW_QUERY_SECONDS", 60)
+    with caplog.at_level(logging.WARNING, logger="sql"):
+        traced_cursor(explain_db(fake_db)).execute("SELECT 1")
+    assert caplog.records == []
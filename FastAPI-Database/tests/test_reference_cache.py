@@ -0,0 +1,41 @@
+from contextlib import asynccontextmanager
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+
+def test_reference_responses_are_served_from_memory_until_invalidated(monkeypatch, fake_async_db):
+    connection = fake_async_db([("FROM machine_types", [(1, "CNC")])])
+    pool = FakePool(connection)
+
+    async def fake_get_async_pool():
+        return pool
+
+    monkeypatch.setattr(main, "get_async_pool", fake_get_async_pool)
+    main.invalidate_reference_cache("machine_types")
+    client = TestClient(main.app)
+
+    first = client.get("/fetch-machine-types")
+    assert first.json() == [{"id": 1, "name": "CNC"}]
+    etag = first.headers["etag"]
+
+    cached = client.get("/fetch-machine-types", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert len(connection.executed) == 1
+
+    connection.script = [("FROM machine_types", [(1, "CNC"), (2, "Lathe")])]
+    main.invalidate_reference_cache("machine_types")
+    changed = client.get("/fetch-machine-types", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert len(connection.executed) == 2
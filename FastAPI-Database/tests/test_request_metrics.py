@@ -0,0 +1,55 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+
+
+def make_client(monkeypatch):
+    monkeypatch.setattr(main, "request_metrics", main.RequestMetrics())
+    app = FastAPI()
+    app.add_middleware(main.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        # Stands in for two statements run by a sync handler in the threadpool
+        main.record_db_query(0.002)
+        main.record_db_query(0.003)
+        return {"id": item_id}
+
+    return TestClient(app)
+
+
+def test_routes_are_labelled_by_template_with_db_counts(monkeypatch):
+    client = make_client(monkeypatch)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nowhere")
+
+    text = main.request_metrics.render()
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+    assert 'http_request_db_queries_bucket{method="GET",route="/items/{item_id}",le="2"} 2' in text
+    assert 'http_request_db_queries_bucket{method="GET",route="/items/{item_id}",le="1"} 0' in text
+    assert 'http_request_db_seconds_sum{method="GET",route="/items/{item_id}"} 0.01' in text
+    assert "http_requests_in_flight 0" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = main.Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert list(histogram.samples("x", 'a="b"')) == [
+        'x_bucket{a="b",le="1"} 2',
+        'x_bucket{a="b",le="5"} 3',
+        'x_bucket{a="b",le="+Inf"} 4',
+        'x_sum{a="b"} 14.5',
+        'x_count{a="b"} 4',
+    ]
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    client = TestClient(main.app)
+    client.get("/metrics")
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/metrics",status="200"' in response.text
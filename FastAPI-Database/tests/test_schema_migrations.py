@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+import pymysql
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def migration_db(fake_db, versions=None, duplicate_ids=()):
+    # `versions` is the schema_migrations table; None means it does not exist yet
+    def max_version(params):
+        if connection.versions is None:
+            raise pymysql.err.ProgrammingError(1146, "Table 'buc.schema_migrations' doesn't exist")
+        return [(max(connection.versions, default=None),)]
+
+    def create_table(params):
+        connection.versions = connection.versions or []
+
+    def record_version(params):
+        connection.versions.append(params[0])
+
+    connection = fake_db([
+        ("MAX(version)", max_version),
+        ("CREATE TABLE IF NOT EXISTS schema_migrations", create_table),
+        ("INSERT INTO schema_migrations", record_version),
+        ("GET_LOCK", [(1,)]),
+        ("kept.id < ca.id", [(ca_id,) for ca_id in duplicate_ids]),
+        ("FROM users", [(1,)]),
+        ("INSERT INTO users", AssertionError("seed user already exists")),
+    ])
+    connection.versions = versions
+    return connection
+
+
+def test_fresh_database_applies_every_migration(fake_db):
+    connection = migration_db(fake_db)
+    assert main.run_migrations(connection) == list(range(1, main.SCHEMA_VERSION + 1))
+    assert connection.versions == list(range(1, main.SCHEMA_VERSION + 1))
+    assert any("uq_cost_aggregate_process_flow" in query for query in connection.queries)
+    assert "RELEASE_LOCK" in connection.queries[-1]
+
+
+def test_current_schema_costs_a_single_query(fake_db):
+    connection = migration_db(fake_db, versions=list(range(1, main.SCHEMA_VERSION + 1)))
+    assert main.run_migrations(connection) == []
+    assert len(connection.queries) == 1
+
+
+def test_duplicate_cost_aggregates_are_removed_before_the_unique_key(fake_db, caplog):
+    connection = migration_db(fake_db, versions=[1, 2], duplicate_ids=[5, 9])
+    with caplog.at_level(logging.WARNING):
+        assert main.run_migrations(connection) == list(range(3, main.SCHEMA_VERSION + 1))
+    assert connection.versions == list(range(1, main.SCHEMA_VERSION + 1))
+
+    deletes = [(query, params) for query, params in connection.executed if query.startswith("DELETE FROM cost_aggregate WHERE")]
+    assert deletes == [("DELETE FROM cost_aggregate WHERE id IN (%s, %s)", [5, 9])]
+    assert any("uq_cost_aggregate_process_flow" in query for query in connection.queries)
+    assert "ids [5, 9]" in caplog.text
+
+
+def test_health_reports_startup_timing(monkeypatch):
+    monkeypatch.setattr(main, "prepare_database", lambda: [])
+    asyncio.run(main.startup_event())
+    response = TestClient(main.app).get("/health")
+    assert response.status_code == 200
+    assert response.json()["schema_version"] == main.SCHEMA_VERSION
+    assert response.json()["boot_seconds"] >= response.json()["schema_seconds"]
+
+
+def test_failed_boot_migration_is_retried_until_healthy(monkeypatch):
+    outcomes = [pymysql.err.OperationalError(2003, "Can't connect to MySQL server"), RuntimeError("still down"), []]
+
+    def prepare_database():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(main, "prepare_database", prepare_database)
+    monkeypatch.setattr(main, "startup_report", {"status": "starting"})
+    monkeypatch.setattr(main, "SCHEMA_RETRY_INITIAL_DELAY", 0)
+
+    async def boot():
+        await main.startup_event()
+        assert main.startup_report["status"] == "error"
+        await main.schema_retry_task
+
+    asyncio.run(boot())
+    assert main.startup_report["status"] == "ok"
+    assert main.startup_report["attempts"] == 3
+    assert "error" not in main.startup_report
+    assert TestClient(main.app).get("/health").status_code == 200
@@ -0,0 +1,71 @@
+import gzip
+
+import orjson
+import pytest
+from starlette.requests import Request
+
+import main
+
+RECORDS = [{"id": index, "part_number": f"P-{index}", "weight": main.Decimal("1.50")} for index in range(100)]
+
+
+def make_request(query="", **headers):
+    return Request({
+        "type": "http",
+        "query_string": query.encode(),
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_default_is_json_rows():
+    response = main.table_response(make_request(), RECORDS[:2])
+    assert response.media_type == "application/json"
+    assert orjson.loads(response.body) == [
+        {"id": 0, "part_number": "P-0", "weight": 1.5},
+        {"id": 1, "part_number": "P-1", "weight": 1.5},
+    ]
+
+
+def test_columnar_sends_each_column_name_once_and_compresses():
+    response = main.table_response(make_request("format=columnar", accept_encoding="gzip"), RECORDS)
+    assert response.headers["content-encoding"] == "gzip"
+    body = orjson.loads(gzip.decompress(response.body))
+    assert body["columns"] == ["id", "part_number", "weight"]
+    assert body["data"][1][:2] == ["P-0", "P-1"]
+
+
+def test_empty_columnar_keeps_the_column_names():
+    response = main.table_response(
+        make_request(accept="application/vnd.buc.columnar+json"), [], columns=("id", "part_number")
+    )
+    assert orjson.loads(response.body) == {"columns": ["id", "part_number"], "data": [[], []]}
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(main.HTTPException) as error:
+        main.table_response(make_request("format=xml"), RECORDS)
+    assert error.value.status_code == 400
+
+
+def test_async_callers_encode_large_tables_in_the_threadpool(monkeypatch):
+    import asyncio
+    import threading
+
+    encoded_on = []
+    encode = main.table_response
+
+    def record_thread(*args, **kwargs):
+        encoded_on.append(threading.current_thread())
+        return encode(*args, **kwargs)
+
+    monkeypatch.setattr(main, "table_response", record_thread)
+    monkeypatch.setattr(main, "TABLE_ENCODE_INLINE_ROWS", 10)
+
+    async def respond(records):
+        return await main.table_response_async(make_request(), records), threading.current_thread()
+
+    _, loop_thread = asyncio.run(respond(RECORDS[:5]))
+    assert encoded_on[-1] is loop_thread
+    response, loop_thread = asyncio.run(respond(RECORDS))
+    assert encoded_on[-1] is not loop_thread
+    assert len(orjson.loads(response.body)) == 100
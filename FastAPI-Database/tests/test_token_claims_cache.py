@@ -0,0 +1,67 @@
+import time
+
+import jwt
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import main
+
+
+def make_token(role="Admin", expires_in=60):
+    return jwt.encode({"sub": "u", "role": role, "exp": int(time.time()) + expires_in}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+
+
+def test_entries_expire_with_the_token():
+    cache = main.TokenClaimsCache(max_size=10)
+    cache.set("live", {"exp": time.time() + 60})
+    cache.set("dead", {"exp": time.time() - 1})
+    cache.set("no-exp", {"sub": "u"})
+    assert cache.get("live") is not None
+    assert cache.get("dead") is None
+    assert cache.get("no-exp") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = main.TokenClaimsCache(max_size=2)
+    exp = time.time() + 60
+    cache.set("a", {"exp": exp})
+    cache.set("b", {"exp": exp})
+    cache.get("a")
+    cache.set("c", {"exp": exp})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_decode_jwt_verifies_a_token_once(monkeypatch):
+    monkeypatch.setattr(main, "token_claims_cache", main.TokenClaimsCache(max_size=10))
+    calls = []
+    decode = jwt.decode
+    monkeypatch.setattr(main.jwt, "decode", lambda *args, **kwargs: calls.append(1) or decode(*args, **kwargs))
+
+    token = make_token()
+    assert main.decode_jwt(token)["role"] == "Admin"
+    assert main.decode_jwt(token)["role"] == "Admin"
+    assert len(calls) == 1
+
+
+def test_invalid_tokens_are_rejected_and_not_cached(monkeypatch):
+    monkeypatch.setattr(main, "token_claims_cache", main.TokenClaimsCache(max_size=10))
+    for token in ("not-a-token", make_token(expires_in=-10)):
+        with pytest.raises(main.HTTPException) as error:
+            main.decode_jwt(token)
+        assert error.value.status_code == 401
+    assert main.token_claims_cache.stats()["entries"] == 0
+
+
+def test_role_required_allows_and_denies():
+    app = FastAPI()
+
+    @app.get("/admin", dependencies=[Depends(main.role_required("Admin"))])
+    def admin():
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.get("/admin", headers={"Authorization": f"Bearer {make_token('Admin')}"}).status_code == 200
+    assert client.get("/admin", headers={"Authorization": f"Bearer {make_token('User')}"}).status_code == 403
+    assert client.get("/admin").status_code == 401
@@ -0,0 +1,24 @@
+from main import TTLCache
+
+
+def test_cache_counts_hits_and_misses():
+    cache = TTLCache(ttl=60)
+    assert cache.get("India") is None
+    cache.set("India", (1, 2, 3))
+    assert cache.get("India") == (1, 2, 3)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_cache_entries_expire():
+    cache = TTLCache(ttl=0)
+    cache.set("India", (1, 2, 3))
+    assert cache.get("India") is None
+
+
+def test_clear_discards_values_read_before_the_write():
+    cache = TTLCache(ttl=60)
+    generation = cache.generation
+    cache.clear()  # a country write lands while the stale SELECT is in flight
+    cache.set("India", ("stale",), generation=generation)
+    assert cache.get("India") is None
@@ -53,6 +53,7 @@ const CostAggregate = () => {
     const [isLoading, setIsLoading] = useState(false);
     const [selectedRows, setSelectedRows] = useState([]);
     const [machineTypes, setMachineTypes] = useState([]);
+    const [machineRates, setMachineRates] = useState(null);
     const [finalCost, setFinalCost] = useState(null);
     const [finalCostLoading, setFinalCostLoading] = useState(false);
     const [showAdditionalCosts, setShowAdditionalCosts] = useState(false);
@@ -63,17 +64,20 @@ const CostAggregate = () => {
         totalCost: 0
     });
 
+    // Process flows arrive with the cost rollup (fetchCostAggregate); clear the previous item's until then
     useEffect(() => {
-        if (selectedItemMaster) {
-            axios.get(`${API_BASE_URL}/fetch-process-flows?item_master_id=${selectedItemMaster}`)
-                .then(res => setProcessFlows(res.data))
-                .catch(() => setProcessFlows([]));
-        } else {
-            setProcessFlows([]);
-        }
+        setProcessFlows([]);
         setSelectedProcessFlow("");
+        setMachineRates(null);
     }, [selectedItemMaster]);
 
+    // Machine rates for the selected item master and country, reusing the ones loaded with the cost rollup
+    const loadMachineRates = async () => {
+        if (machineRates) return machineRates;
+        const machineRateRes = await axios.get(`${API_BASE_URL}/machine-rate-data?item_master_id=${selectedItemMaster}&country=${selectedCountry}`);
+        return machineRateRes.data;
+    };
+
     useEffect(() => {
         if (selectedItemMaster && selectedCountry) {
             fetchCostAggregate(selectedItemMaster);
@@ -98,11 +102,14 @@ const CostAggregate = () => {
         });
     };
 
-    // Fetch cost aggregates for table (with real DB id)
+    // Fetch cost aggregates for table (with real DB id), plus process flows and machine rates, in one request
     const fetchCostAggregate = (itemMasterId) => {
-        axios.get(`${API_BASE_URL}/fetch-cost-aggregates?item_master_id=${itemMasterId}`)
+        setMachineRates(null);
+        axios.get(`${API_BASE_URL}/item-cost-rollup/${itemMasterId}?country=${encodeURIComponent(selectedCountry)}`)
             .then(response => {
-                const dataWithNames = response.data.map((row, idx) => ({
+                setProcessFlows(response.data.process_flows);
+                setMachineRates(response.data.machine_rates);
+                const dataWithNames = response.data.cost_aggregates.map((row, idx) => ({
                     ...row,
                     machine_type_name:
                         row.machine_type_name ||
@@ -139,9 +146,9 @@ const CostAggregate = () => {
         let laborRate = 0;
         (async () => {
             try {
-                const machineRateRes = await axios.get(`${API_BASE_URL}/machine-rate-data?item_master_id=${selectedItemMaster}&country=${selectedCountry}`);
+                const rates = await loadMachineRates();
                 const machineTypeName = pf.machine_type_name || (machineTypes.find(mt => mt.id === pf.machine_type)?.name);
-                const machineRateRow = machineRateRes.data.find(r => r.machine_type === machineTypeName);
+                const machineRateRow = rates.find(r => r.machine_type === machineTypeName);
                 if (machineRateRow) {
                     machineRate = machineRateRow.total_dollar_hr || machineRateRow.machine_rate || 0;
                 }
@@ -232,9 +239,9 @@ const CostAggregate = () => {
         let laborRate = 0;
         try {
             // Fetch all machine rates for the selected item master and country
-            const machineRateRes = await axios.get(`${API_BASE_URL}/machine-rate-data?item_master_id=${selectedItemMaster}&country=${selectedCountry}`);
+            const rates = await loadMachineRates();
             // Find the machine rate for the process flow's machine type name
-            const machineRateRow = machineRateRes.data.find(r => r.machine_type === machineTypeName);
+            const machineRateRow = rates.find(r => r.machine_type === machineTypeName);
             if (machineRateRow) {
                 machineRate = machineRateRow.total_dollar_hr || machineRateRow.machine_rate || 0;
             }
@@ -1,46 +1,67 @@
 import { useState, useEffect } from "react";
 import axios from "axios";
-import { Select, MenuItem, FormControl, InputLabel } from "@mui/material";
+import { Autocomplete, TextField } from "@mui/material";
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || "http://127.0.0.1:8000";
+const SEARCH_DELAY_MS = 250;
 
+// Typeahead over /search-item-masters: only the top matches for what has been typed are loaded
 const ItemMasterDropdown = ({ onSelect }) => {
-  const [itemMasters, setItemMasters] = useState([]);
-  const [selectedItem, setSelectedItem] = useState("");
+  const [options, setOptions] = useState([]);
+  const [selectedItem, setSelectedItem] = useState(null);
+  const [inputValue, setInputValue] = useState("");
+  const [loading, setLoading] = useState(false);
 
   useEffect(() => {
-    axios.get(`${API_BASE_URL}/fetch-item-masters-dropdown`)
-      .then((response) => {
-        setItemMasters(response.data);
-      })
-      .catch((error) => {
-        console.error("Error fetching item masters:", error);
-      });
-  }, []);
-
-  const handleChange = (event) => {
-    setSelectedItem(event.target.value);
-    onSelect(event.target.value); // Pass selected Item Master ID to parent component
+    const query = inputValue.trim();
+    if (!query || (selectedItem && selectedItem.label === inputValue)) {
+      setOptions(selectedItem ? [selectedItem] : []);
+      return undefined;
+    }
+
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      setLoading(true);
+      axios.get(`${API_BASE_URL}/search-item-masters`, { params: { q: query } })
+        .then((response) => {
+          if (!cancelled) setOptions(response.data);
+        })
+        .catch((error) => {
+          console.error("Error searching item masters:", error);
+        })
+        .finally(() => {
+          if (!cancelled) setLoading(false);
+        });
+    }, SEARCH_DELAY_MS);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [inputValue, selectedItem]);
+
+  const handleChange = (event, item) => {
+    setSelectedItem(item);
+    onSelect(item ? item.id : ""); // Pass selected Item Master ID to parent component
   };
 
   return (
-    <FormControl fullWidth variant="outlined" size="small">
-      <InputLabel id="item-master-label" shrink={!!selectedItem} sx={{ fontSize: '0.875rem' }}>Item Master</InputLabel>
-      <Select 
-            labelId="item-master-label"
-            value={selectedItem}
-            onChange={handleChange}
-            label="Item Master"
-            fullWidth
-            size="small"
-        >
-        {itemMasters.map((item) => (
-          <MenuItem key={item.id} value={item.id}>
-            {item.label}
-          </MenuItem>
-        ))}
-      </Select>
-    </FormControl>
+    <Autocomplete
+      fullWidth
+      size="small"
+      options={options}
+      value={selectedItem}
+      loading={loading}
+      filterOptions={(items) => items} // Matching is done by the server
+      getOptionLabel={(item) => item.label}
+      isOptionEqualToValue={(item, value) => item.id === value.id}
+      onChange={handleChange}
+      onInputChange={(event, value) => setInputValue(value)}
+      noOptionsText={inputValue.trim() ? "No matching item masters" : "Type a part or drawing number"}
+      renderInput={(params) => (
+        <TextField {...params} label="Item Master" variant="outlined" size="small" />
+      )}
+    />
   );
 };
 
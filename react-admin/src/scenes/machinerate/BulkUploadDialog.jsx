@@ -161,7 +161,7 @@ const BulkUploadDialog = ({ open, onClose, itemMasterId, onSuccess }) => {
               <input
                 type="file"
                 hidden
-                accept=".xlsx,.xls"
+                accept=".xlsx,.csv"
                 onChange={handleFileChange}
               />
             </Button>